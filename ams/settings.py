@@ -25,6 +25,12 @@ SECRET_KEY = 'django-insecure-wc*-1k-fft@rrc!-%a$gavri0g-w&+sw8y5p3b&n+xi32zzy3d
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# List endpoints page with a keyset cursor (see inventry/pagination.py)
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'inventry.pagination.KeysetCursorPagination',
+    'PAGE_SIZE': 50,
+}
+
 ALLOWED_HOSTS = []
 
 
@@ -43,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'inventry.profiling.QueryProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,6 +80,33 @@ WSGI_APPLICATION = 'ams.wsgi.application'
 
 SITE_URL = "http://192.168.0.37:8000"
 
+# QR images are rendered on demand by /api/asset-tags/<uuid>/qr.png|svg.
+# Set QR_PERSIST_IMAGES to also queue every new tag for render_qr_worker,
+# which writes the PNG to qr_code_image.
+QR_PERSIST_IMAGES = False
+QR_CACHE_MEMORY_BYTES = 32 * 1024 * 1024
+QR_CACHE_DIR = None  # e.g. os.path.join(BASE_DIR, 'qr_cache') to share renders between processes
+QR_CACHE_DISK_BYTES = 512 * 1024 * 1024
+
+# Processes used to render print_tags?format=pdf pages (None: all cores)
+PDF_RENDER_WORKERS = None
+
+# QR scan results are cached per process; name a shared cache alias
+# (e.g. redis/memcached in CACHES) to add a cross-process tier
+SCAN_CACHE_ALIAS = None
+SCAN_CACHE_MAX_ENTRIES = 10000
+SCAN_CACHE_TIMEOUT = 3600
+
+# Tag number autocomplete is served from memory; other processes' new tags
+# are picked up this often
+AUTOCOMPLETE_REFRESH_SECONDS = 60
+
+# Per-request query counts/timings are summarized at /api/_metrics over the
+# last METRICS_WINDOW requests per endpoint. A view over its query_budget
+# logs a warning, or raises when strict (turn it on in test settings)
+METRICS_WINDOW = 500
+QUERY_BUDGET_STRICT = False
+
 ALLOWED_HOSTS = ['192.168.0.37', '127.0.0.1', 'localhost']
 
 import os
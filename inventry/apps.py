@@ -5,3 +5,5 @@ class InventoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventry'
 
+    def ready(self):
+        from . import signals
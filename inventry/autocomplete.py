@@ -0,0 +1,152 @@
+"""
+In-memory prefix index of asset tag numbers for search-as-you-type.
+
+Tag numbers are kept upper-cased in a sorted list (with their ids in a
+parallel array), so the matches for a prefix are a contiguous run found
+with bisect. The index loads lazily on first use; afterwards this process's
+own saves, deletes and bulk_generate update it incrementally, and rows
+written by other processes are pulled in every AUTOCOMPLETE_REFRESH_SECONDS
+(new tags only; a full reload every RELOAD_SECONDS drops deleted tags).
+One request at a time loads or refreshes; the others answer from the index
+as it is, and only wait for the first load.
+A refresh reads the tags created since the previous one started, less
+REFRESH_OVERLAP, rather than the ids above the highest one seen: ids are
+not committed in order, so a lower id can show up after a higher one.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+
+RELOAD_SECONDS = 3600
+
+# How far back each refresh looks past the previous one, for transactions
+# still open then and clock differences between processes
+REFRESH_OVERLAP = timedelta(minutes=5)
+
+
+class TagPrefixIndex:
+
+    def __init__(self, refresh_seconds=60):
+        self.refresh_seconds = refresh_seconds
+        self._keys = None
+        self._ids = array('q')
+        self._created_since = None
+        self._refreshed_at = self._loaded_at = 0.0
+        self._lock = threading.RLock()
+        # Held while loading or refreshing, which reads the table outside _lock
+        self._updating = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._keys is not None
+
+    def _rows(self, created_since=None):
+        AssetTag = apps.get_model('inventry', 'AssetTag')
+        tags = AssetTag.objects.order_by()
+        if created_since is not None:
+            tags = tags.filter(created_at__gte=created_since)
+        return tags.values_list('tag_number', 'id').iterator(chunk_size=5000)
+
+    def load(self):
+        started = timezone.now()
+        rows = sorted((tag_number.upper(), asset_id) for tag_number, asset_id in self._rows())
+        with self._lock:
+            self._keys = [key for key, _ in rows]
+            self._ids = array('q', (asset_id for _, asset_id in rows))
+            self._created_since = started - REFRESH_OVERLAP
+            self._refreshed_at = self._loaded_at = time.monotonic()
+
+    def refresh(self):
+        """Pull in tags created by other processes since the last load/refresh"""
+        started = timezone.now()
+        self.add_many(list(self._rows(created_since=self._created_since)))
+        with self._lock:
+            self._created_since = started - REFRESH_OVERLAP
+            self._refreshed_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        if not self._stale():
+            return
+        # Without an index there is nothing to answer from, so wait for the load
+        if not self._updating.acquire(blocking=not self.loaded):
+            return
+        try:
+            # Another request may have brought it up to date while we waited
+            stale = self._stale()
+            if stale == 'load':
+                self.load()
+            elif stale == 'refresh':
+                self.refresh()
+        finally:
+            self._updating.release()
+
+    def _stale(self):
+        """'load', 'refresh' or None"""
+        now = time.monotonic()
+        if not self.loaded or now - self._loaded_at > RELOAD_SECONDS:
+            return 'load'
+        if now - self._refreshed_at > self.refresh_seconds:
+            return 'refresh'
+        return None
+
+    def add(self, tag_number, asset_id):
+        self.add_many([(tag_number, asset_id)])
+
+    def add_many(self, rows):
+        """Insert `(tag_number, id)` pairs; a no-op until the index is loaded"""
+        if not rows:
+            return
+        with self._lock:
+            if not self.loaded:
+                return
+            if len(rows) > len(self._keys) // 10:
+                # Cheaper to re-sort than to shift the list once per insert
+                merged = sorted(
+                    [*zip(self._keys, self._ids), *((tag.upper(), asset_id) for tag, asset_id in rows)]
+                )
+                merged = [row for i, row in enumerate(merged) if not i or row != merged[i - 1]]
+                self._keys = [key for key, _ in merged]
+                self._ids = array('q', (asset_id for _, asset_id in merged))
+            else:
+                for tag_number, asset_id in rows:
+                    key = tag_number.upper()
+                    i = bisect_left(self._keys, key)
+                    if i < len(self._keys) and self._keys[i] == key:
+                        continue
+                    self._keys.insert(i, key)
+                    self._ids.insert(i, asset_id)
+
+    def remove(self, tag_number):
+        with self._lock:
+            if not self.loaded:
+                return
+            key = tag_number.upper()
+            i = bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+                del self._ids[i]
+
+    def complete(self, prefix, limit=10):
+        """Up to `limit` `(tag_number, id)` pairs starting with `prefix`, in tag order"""
+        self._ensure_fresh()
+        prefix = prefix.upper()
+        with self._lock:
+            keys, ids = self._keys, self._ids
+            i = bisect_left(keys, prefix)
+            matches = []
+            while i < len(keys) and len(matches) < limit and keys[i].startswith(prefix):
+                matches.append((keys[i], ids[i]))
+                i += 1
+        return matches
+
+    def __len__(self):
+        return len(self._keys) if self.loaded else 0
+
+
+tag_index = TagPrefixIndex(refresh_seconds=getattr(settings, 'AUTOCOMPLETE_REFRESH_SECONDS', 60))
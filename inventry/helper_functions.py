@@ -1,15 +1,73 @@
 import uuid
-import random
-import string
 from django.utils import timezone
 from datetime import datetime
 from django.utils.text import slugify
 from django.apps import apps
+from django.db import transaction
+from django.db.models import F
+
+def reserve_sequence(key: str, count: int = 1, seed=None) -> int:
+    """
+    Atomically reserve `count` consecutive values from the counter `key`
+    and return the first one. `seed` is called to get the current value
+    when the counter row does not exist yet (e.g. from already stored rows).
+    The counter row stays locked until the surrounding transaction ends.
+    """
+    SequenceCounter = apps.get_model('inventry', 'SequenceCounter')
+
+    with transaction.atomic():
+        if not SequenceCounter.objects.filter(key=key).exists():
+            # INSERT IGNORE, so a concurrent first use is a no-op instead of an error
+            SequenceCounter.objects.bulk_create(
+                [SequenceCounter(key=key, last_value=seed() if seed else 0)],
+                ignore_conflicts=True
+            )
+        counter = SequenceCounter.objects.select_for_update().get(key=key)
+        SequenceCounter.objects.filter(pk=counter.pk).update(last_value=F('last_value') + count)
+
+    return counter.last_value + 1
+
+
+def allocate_code(model_name: str, field: str, prefix: str, width: int) -> str:
+    """
+    Next code `<prefix><sequence>` for `model_name.field`, drawn from the
+    counter for that prefix and seeded from codes already stored.
+    Call it inside the transaction that saves the row so a failed insert
+    gives the number back.
+    """
+    first = reserve_sequence(
+        f"code:{model_name}:{prefix}",
+        seed=lambda: _last_code_sequence(model_name, field, prefix)
+    )
+    return f"{prefix}{first:0{width}d}"
+
+
+def _last_code_sequence(model_name: str, field: str, prefix: str) -> int:
+    """Highest numeric suffix already stored in `model_name.field` under `prefix`"""
+    Model = apps.get_model('inventry', model_name)
+    codes = Model.objects.filter(**{f'{field}__startswith': prefix}).values_list(field, flat=True)
+    suffixes = [int(code[len(prefix):]) for code in codes if code[len(prefix):].isdigit()]
+    return max(suffixes, default=0)
+
 
 def generate_stock_entry_code():
+    return reserve_stock_entry_codes(1)[0]
+
+
+def reserve_stock_entry_codes(count: int) -> list:
+    """
+    Reserve `count` stock entry numbers from today's sequence in one go.
+    e.g. SR-251030-0001, SR-251030-0002, ...
+    """
     date_part = timezone.now().strftime("%y%m%d")  # e.g. 251030
-    random_part = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-    return f"SR-{date_part}-{random_part}"
+    prefix = f"SR-{date_part}-"
+    first = reserve_sequence(
+        f"stock-entry:{date_part}",
+        count=count,
+        # older codes used random characters, only numeric ones count
+        seed=lambda: _last_code_sequence('StockEntry', 'entry_number', prefix)
+    )
+    return [f"{prefix}{seq:04d}" for seq in range(first, first + count)]
 
 
 def generate_department_code(name: str) -> str:
@@ -17,10 +75,8 @@ def generate_department_code(name: str) -> str:
     Generate unique short code for Department
     e.g. 'Computer Science' -> 'CSD-01'
     """
-    Department = apps.get_model('inventry', 'Department')  # dynamically get model
     base_code = ''.join(word[0].upper() for word in name.split())[:3]
-    existing_codes = Department.objects.filter(code__startswith=base_code).count()
-    return f"{base_code}-{existing_codes + 1:02d}"
+    return allocate_code('Department', 'code', f"{base_code}-", 2)
 
 
 def generate_register_number(store_code: str, register_type: str) -> str:
@@ -28,8 +84,6 @@ def generate_register_number(store_code: str, register_type: str) -> str:
     Generate unique, meaningful Stock Register code.
     Example: MAIN-DSR-001, SUB-CON-002, etc.
     """
-    StockRegister = apps.get_model('inventry', 'StockRegister')
-
     type_map = {
         'DEADSTOCK': 'DSR',
         'CONSUMABLE': 'CON',
@@ -37,9 +91,15 @@ def generate_register_number(store_code: str, register_type: str) -> str:
     }
 
     type_code = type_map.get(register_type, 'REG')
-    count = StockRegister.objects.filter(
-        register_type=register_type,
-        store__code=store_code
-    ).count()
+    return allocate_code('StockRegister', 'register_number', f"{store_code.upper()}-{type_code}-", 3)
+
+
+def normalize_search_text(text: str) -> str:
+    """Lowercase alphanumerics only, so 'CS-CHR001-0042' and 'cschr0010042' match"""
+    return ''.join(ch for ch in text.lower() if ch.isalnum())
+
 
-    return f"{store_code.upper()}-{type_code}-{count + 1:03d}"
\ No newline at end of file
+def search_trigrams(text: str) -> set:
+    """Distinct 3-character tokens of the normalized text (none below 3 characters)"""
+    text = normalize_search_text(text)
+    return {text[i:i + 3] for i in range(len(text) - 2)}
@@ -0,0 +1,129 @@
+"""
+Point-in-time reconstruction of asset status, location and store.
+
+AssetMovement rows are the event log and AssetCheckpoint rows are periodic
+snapshots of every asset's state. The state of an asset at time T is:
+
+    1. the `to_*` values of its last movement in (checkpoint, T], else
+    2. its row in the latest checkpoint taken at or before T, else
+    3. the `from_*` values of its first movement after T, else
+    4. its current values (it has not moved since T).
+
+Assets created after T did not exist yet and are left out. A query only
+reads the movements since the checkpoint, so its cost depends on how often
+checkpoints are taken (`take_asset_checkpoint`), not on how long the
+history is.
+"""
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import AssetCheckpoint, AssetCheckpointState, AssetMovement, AssetTag, BULK_BATCH_SIZE
+
+
+def take_checkpoint(created_by=None):
+    """Record the current state of every asset and return the checkpoint"""
+    with transaction.atomic():
+        checkpoint = AssetCheckpoint.objects.create(taken_at=timezone.now(), created_by=created_by)
+        rows = AssetTag.objects.order_by().values_list(
+            'id', 'status', 'current_location_id', 'current_store_id'
+        ).iterator(chunk_size=BULK_BATCH_SIZE * 4)
+
+        count, states = 0, []
+        for asset_id, status, location_id, store_id in rows:
+            states.append(AssetCheckpointState(
+                checkpoint=checkpoint, asset_id=asset_id,
+                status=status, location_id=location_id, store_id=store_id
+            ))
+            if len(states) >= BULK_BATCH_SIZE * 4:
+                AssetCheckpointState.objects.bulk_create(states, batch_size=BULK_BATCH_SIZE)
+                count += len(states)
+                states = []
+        AssetCheckpointState.objects.bulk_create(states, batch_size=BULK_BATCH_SIZE)
+        count += len(states)
+
+        checkpoint.asset_count = count
+        checkpoint.save(update_fields=['asset_count'])
+    return checkpoint
+
+
+def latest_checkpoint(at):
+    """Latest checkpoint taken at or before `at`, or None"""
+    return AssetCheckpoint.objects.filter(taken_at__lte=at).order_by('-taken_at').first()
+
+
+def states_as_of(at, location_id=None, store_id=None):
+    """
+    `{asset_id: (status, location_id, store_id)}` at time `at`, optionally
+    only for assets that were in `location_id` / `store_id` then
+    """
+    checkpoint = latest_checkpoint(at)
+
+    def wanted(location, store):
+        return ((location_id is None or location == location_id)
+                and (store_id is None or store == store_id))
+
+    # 1. Last movement of each asset inside the window
+    window = AssetMovement.objects.filter(created_at__lte=at)
+    if checkpoint:
+        window = window.filter(created_at__gt=checkpoint.taken_at)
+    moved = {}
+    for asset_id, status, location, store in window.order_by('created_at', 'id').values_list(
+            'asset_id', 'to_status', 'to_location_id', 'to_store_id').iterator(chunk_size=BULK_BATCH_SIZE * 4):
+        moved[asset_id] = (status, location, store)
+    states = {asset_id: state for asset_id, state in moved.items() if wanted(state[1], state[2])}
+
+    # 2. Checkpoint rows of assets that did not move in the window
+    if checkpoint:
+        rows = checkpoint.states.order_by()
+        if location_id is not None:
+            rows = rows.filter(location_id=location_id)
+        if store_id is not None:
+            rows = rows.filter(store_id=store_id)
+        for asset_id, status, location, store in rows.values_list(
+                'asset_id', 'status', 'location_id', 'store_id').iterator(chunk_size=BULK_BATCH_SIZE * 4):
+            if asset_id not in moved:
+                states[asset_id] = (status, location, store)
+
+    # 3./4. Assets the checkpoint does not cover: before their first later movement, or as they are now
+    uncovered = AssetTag.objects.filter(created_at__lte=at).order_by()
+    if checkpoint:
+        uncovered = uncovered.exclude(Exists(checkpoint.states.filter(asset=OuterRef('pk'))))
+    uncovered = uncovered.exclude(Exists(window.filter(asset=OuterRef('pk'))))
+
+    first_after = AssetMovement.objects.filter(asset=OuterRef('pk'), created_at__gt=at).order_by('created_at', 'id')
+    uncovered = uncovered.annotate(
+        moved_later=Exists(first_after),
+        status_then=Subquery(first_after.values('from_status')[:1]),
+        location_then=Subquery(first_after.values('from_location')[:1]),
+        store_then=Subquery(first_after.values('from_store')[:1]),
+    )
+    if location_id is not None:
+        uncovered = uncovered.filter(
+            Q(moved_later=True, location_then=location_id) | Q(moved_later=False, current_location_id=location_id)
+        )
+    if store_id is not None:
+        uncovered = uncovered.filter(
+            Q(moved_later=True, store_then=store_id) | Q(moved_later=False, current_store_id=store_id)
+        )
+    for row in uncovered.values_list(
+            'id', 'moved_later', 'status_then', 'location_then', 'store_then',
+            'status', 'current_location_id', 'current_store_id').iterator(chunk_size=BULK_BATCH_SIZE * 4):
+        asset_id, moved_later = row[0], row[1]
+        states[asset_id] = row[2:5] if moved_later else row[5:8]
+
+    return states
+
+
+def asset_state_as_of(asset, at):
+    """`(status, location_id, store_id)` of one asset at `at`, or None if it did not exist yet"""
+    if asset.created_at > at:
+        return None
+    movements = asset.movements.order_by()
+    last = movements.filter(created_at__lte=at).order_by('-created_at', '-id').first()
+    if last:
+        return last.to_status, last.to_location_id, last.to_store_id
+    first_after = movements.filter(created_at__gt=at).order_by('created_at', 'id').first()
+    if first_after:
+        return first_after.from_status, first_after.from_location_id, first_after.from_store_id
+    return asset.status, asset.current_location_id, asset.current_store_id
@@ -0,0 +1,376 @@
+import datetime
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from inventry import history
+from inventry.helper_functions import reserve_sequence
+from inventry.models import (
+    BULK_BATCH_SIZE, AssetMovement, AssetTag, Batch, Department, InspectionCertificate, InspectionItem, Item,
+    ItemCategory, Location, SequenceCounter, StockBalance, StockEntry, StockRegister, Store, StoreInventory,
+)
+from inventry.qr import render_qr_png
+from inventry.serializers import InspectionCertificateSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the bulk endpoints against the configured database. Each scenario '
+        'creates its own data and rolls it back.'
+    )
+
+    scenarios = ['tags', 'labels', 'scan', 'reconcile', 'history', 'balances', 'search', 'codes', 'pages', 'certificates']
+    # Run outside the rollback transaction, since their writers commit on their own connections
+    concurrent_scenarios = {'codes'}
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', nargs='*', help=f"One of {', '.join(self.scenarios)}; default all")
+        parser.add_argument('--size', type=int, default=1000, help='Tags (assets) created per scenario')
+
+    def handle(self, *args, **options):
+        unknown = set(options['scenario']) - set(self.scenarios)
+        if unknown:
+            raise CommandError(f"Unknown scenario {', '.join(sorted(unknown))}")
+
+        self.client = APIClient(SERVER_NAME='localhost')
+        for name in options['scenario'] or self.scenarios:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            if name in self.concurrent_scenarios:
+                getattr(self, f'bench_{name}')(options['size'])
+                continue
+            with transaction.atomic():
+                getattr(self, f'bench_{name}')(self.create_inventory(options['size']), options['size'])
+                transaction.set_rollback(True)
+
+    def create_inventory(self, quantity):
+        department = Department.objects.create(name='Benchmark')
+        store = Store.objects.create(
+            name='Benchmark', code='BENCH-MAIN', store_type='MAIN', department=department,
+            location='Benchmark', incharge_name='Benchmark'
+        )
+        register = StockRegister.objects.create(register_name='Benchmark', register_type='DEADSTOCK', store=store)
+        category = ItemCategory.objects.create(name='Benchmark', code='BENCH')
+        item = Item.objects.create(
+            name='Benchmark', code='BENCH001', department=department, category=category, unit='pcs',
+            source_type='DEPT_PURCHASE'
+        )
+        certificate = InspectionCertificate.objects.create(
+            certificate_number='BENCH-1', issued_on=datetime.date.today(), issued_to='Benchmark',
+            contracter='Benchmark', indenter='Benchmark', consignee='Benchmark', department=department,
+            date_of_delivery=datetime.date.today(), delivery_status='FULL', stock_register=register
+        )
+        inspection_item = InspectionItem.objects.create(
+            inspection=certificate, item=item, tendered_quantity=quantity, accepted_quantity=quantity,
+            rejected_quantity=0
+        )
+        batch = Batch.objects.create(
+            batch_number='BENCH-0001', inspection_item=inspection_item, item=item,
+            source_type='DEPARTMENTAL_PURCHASE', source_store=store, total_quantity=quantity, current_quantity=quantity
+        )
+        return StoreInventory.objects.create(store=store, batch=batch, quantity_on_hand=quantity)
+
+    def measure(self, label, func):
+        """Run `func`, report its wall time and query count, and return its result"""
+        started = time.perf_counter()
+        with count_queries() as queries:
+            result = func()
+        elapsed = (time.perf_counter() - started) * 1000
+        self.stdout.write(f'  {label}: {elapsed:.0f} ms, {queries[0]} queries')
+        return result
+
+    def measure_each(self, label, requests):
+        """Issue `requests` (callables) one by one and report p50/p99 latency and total queries"""
+        latencies = []
+        with count_queries() as queries:
+            for request in requests:
+                started = time.perf_counter()
+                self.expect(request())
+                latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        p50, p99 = latencies[len(latencies) // 2], latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(f'  {label}: p50 {p50:.1f} ms, p99 {p99:.1f} ms, {queries[0]} queries for {len(latencies)} requests')
+
+    def expect(self, response, expected=200):
+        if response.status_code != expected:
+            raise CommandError(f'{response.request["PATH_INFO"]} returned {response.status_code}')
+        return response
+
+    def bench_tags(self, inventory, size):
+        # Fixed sizes, --size does not apply; each runs the bulk endpoint and
+        # the one-tag-at-a-time path it replaced
+        sizes = (10, 100, 1000, 5000)
+        StoreInventory.objects.filter(pk=inventory.pk).update(quantity_on_hand=sum(sizes))
+        url = f'/api/stores/{inventory.store_id}/inventries/{inventory.pk}/generate_tags/'
+        written = []
+        try:
+            for quantity in sizes:
+                self.expect(self.measure(
+                    f'generate_tags quantity={quantity}',
+                    lambda: self.client.post(url, {'quantity': quantity}, format='json')
+                ), 201)
+                self.measure(
+                    f'  one at a time with a stored PNG (before), quantity={quantity}',
+                    lambda: written.extend(self.generate_one_by_one(inventory, quantity))
+                )
+        finally:
+            # Files are not rolled back with the rows
+            for name in written:
+                default_storage.delete(name)
+
+    def generate_one_by_one(self, inventory, quantity):
+        """Tags as generate_tags created them before: a save, a PNG render and write, and an UPDATE per tag"""
+        names = []
+        for _ in range(quantity):
+            tag = AssetTag.objects.create(batch=inventory.batch, current_store=inventory.store)
+            tag.qr_code_image.save(f'qr_{tag.tag_number}.png', ContentFile(render_qr_png(tag.qr_url)))
+            names.append(tag.qr_code_image.name)
+        return names
+
+    def bench_labels(self, inventory, size):
+        AssetTag.bulk_generate(inventory.batch, inventory.store, size)
+        url = f'/api/stores/{inventory.store_id}/inventries/{inventory.pk}/print_tags/'
+        for query in ('?format=pdf', '?qr=svg'):
+            # The sheets stream, so the time includes reading the whole body
+            body = self.measure(
+                f'print_tags{query} labels={size}',
+                lambda: b''.join(self.expect(self.client.get(url + query)).streaming_content)
+            )
+            self.stdout.write(f'    {len(body) / 1024:.0f} KiB')
+
+    def bench_scan(self, inventory, size):
+        tags = AssetTag.bulk_generate(inventory.batch, inventory.store, size)
+        scans = [lambda tag=tag: self.client.get(f'/api/asset-tags/scan/{tag.qr_code_uuid}/') for tag in tags]
+        self.measure_each('scan, cold cache', scans)
+        self.measure_each('scan, warm cache', scans)
+
+    def bench_reconcile(self, inventory, size):
+        department = inventory.store.department
+        lab, office = (
+            Location.objects.create(name=f'Benchmark {code}', code=f'BENCH-{code}', location_type='LAB', department=department)
+            for code in ('LAB', 'OFFICE')
+        )
+        tags = AssetTag.bulk_generate(inventory.batch, inventory.store, size)
+        AssetTag.objects.filter(batch=inventory.batch).update(current_location=lab)
+        # An audit of the lab: most tags found, a few elsewhere or unknown, the rest missing
+        AssetTag.objects.filter(pk__in=[tag.pk for tag in tags[:size // 100]]).update(current_location=office)
+        uuids = [str(tag.qr_code_uuid) for tag in tags[:size - size // 200]]
+        uuids += [str(uuid.uuid4()) for _ in range(size // 200)]
+        response = self.expect(self.measure(
+            f'reconcile uuids={len(uuids)}',
+            lambda: self.client.post('/api/asset-tags/reconcile/', {'uuids': uuids, 'location_id': lab.pk}, format='json')
+        ))
+        self.stdout.write(f"    {response.data['summary']}")
+
+    def bench_history(self, inventory, size):
+        department, rng = inventory.store.department, random.Random(0)
+        locations = [
+            Location.objects.create(name=f'Benchmark {i}', code=f'BENCH-{i}', location_type='LAB', department=department)
+            for i in range(10)
+        ]
+        tags = AssetTag.bulk_generate(inventory.batch, inventory.store, size)
+        # A year of history, ten moves per asset
+        now = timezone.now()
+        start = now - datetime.timedelta(days=365)
+        step = (now - start) / (size * 10 + 1)
+        AssetTag.objects.filter(batch=inventory.batch).update(created_at=start)
+        current = {tag.pk: None for tag in tags}
+        movements = []
+        for i in range(size * 10):
+            asset_id, location = rng.choice(tags).pk, rng.choice(locations).pk
+            movements.append(AssetMovement(
+                asset_id=asset_id, from_status='IN_STOCK', to_status='IN_STOCK', from_location_id=current[asset_id],
+                to_location_id=location, from_store=inventory.store, to_store=inventory.store,
+                created_at=start + step * (i + 1)
+            ))
+            current[asset_id] = location
+        AssetMovement.objects.bulk_create(movements, batch_size=BULK_BATCH_SIZE)
+        AssetTag.objects.bulk_update(
+            [AssetTag(pk=asset_id, current_location_id=location) for asset_id, location in current.items()],
+            ['current_location'], batch_size=BULK_BATCH_SIZE
+        )
+
+        for label, at in (('3 months in', start + (now - start) / 4), ('6 months in', start + (now - start) / 2), ('now', now)):
+            states = self.measure(
+                f'states_as_of {label}, no checkpoint',
+                lambda: history.states_as_of(at, location_id=locations[0].pk)
+            )
+            self.stdout.write(f'    {len(states)} assets')
+        self.measure(f'take_checkpoint assets={size}', history.take_checkpoint)
+        self.measure(
+            'states_as_of now, after a checkpoint',
+            lambda: history.states_as_of(timezone.now(), location_id=locations[0].pk)
+        )
+
+    def bench_balances(self, inventory, size):
+        register, item = inventory.store.registers.get(), inventory.batch.item
+        # 100 x `size` entries, receipts and issues alternating
+        for _ in range(100):
+            StockEntry.post_many([
+                StockEntry(
+                    entry_type='RECEIPT' if i % 2 == 0 else 'ISSUE', item=item, quantity=2 if i % 2 == 0 else 1,
+                    stock_register=register, to_store=inventory.store
+                ) for i in range(size)
+            ])
+        self.measure(f'ledger aggregate over {size * 100} entries', lambda: StockEntry.ledger_balance(register.pk, item.pk))
+        self.measure(
+            'balance row', lambda: StockBalance.objects.get(stock_register=register, item=item).quantity
+        )
+        self.expect(self.measure(
+            'GET stock-registers/{id}/balances/', lambda: self.client.get(f'/api/stock-registers/{register.pk}/balances/')
+        ))
+
+    def bench_search(self, inventory, size):
+        tags = AssetTag.bulk_generate(inventory.batch, inventory.store, size)
+        tag_number = tags[len(tags) // 2].tag_number
+        # Transposed letters in the item code part, so no tag contains it
+        typo = tag_number.replace('BENCH', 'BENHC', 1)
+        queries = [
+            ('short', tag_number[-2:]),
+            ('tag suffix', tag_number[-6:]),
+            ('whole tag', tag_number),
+            ('typo', typo),
+            ('item name', 'benchmark'),
+            ('long', f'{tag_number} chair desk lamp'),
+        ]
+        for label, query in queries:
+            self.expect(self.measure(
+                f'list ?search= {label} ({query!r}) over {size} tags',
+                lambda: self.client.get('/api/asset-tags/', {'search': query})
+            ))
+            self.expect(self.measure(
+                f'search/?q= {label}', lambda: self.client.get('/api/asset-tags/search/', {'q': query})
+            ))
+
+    def bench_pages(self, inventory, size):
+        AssetTag.bulk_generate(inventory.batch, inventory.store, size)
+        # Small enough pages that page 1000 exists
+        page_size = max(1, size // 1000)
+        marks = {page for page in (1, 10, 100, 1000) if (page - 1) * page_size < size}
+
+        url, page = f'/api/asset-tags/?page_size={page_size}', 0
+        while url and page < max(marks):
+            page += 1
+            if page in marks:
+                self.measure_each(
+                    f'GET asset-tags/ page {page} (page_size={page_size})', [lambda url=url: self.client.get(url)] * 5
+                )
+            url = self.expect(self.client.get(url)).data['next']
+
+        # The page query alone: seeking past the previous page's last row as the
+        # cursor does, and LIMIT/OFFSET as list endpoints ran before
+        ordered = AssetTag.objects.order_by('-created_at', '-id')
+        for page in sorted(marks):
+            offset = (page - 1) * page_size
+            after = ordered
+            if offset:
+                created_at, pk = ordered.values_list('created_at', 'id')[offset - 1]
+                after = ordered.filter(
+                    Q(created_at__lte=created_at), Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+                )
+            self.measure(f'  keyset query, page {page}', lambda: list(after[:page_size]))
+            self.measure(f'  OFFSET {offset} query, page {page}', lambda: list(ordered[offset:offset + page_size]))
+
+    def bench_certificates(self, inventory, size):
+        register, department = inventory.store.registers.get(), inventory.store.department
+        today = datetime.date.today()
+        InspectionCertificate.objects.bulk_create([
+            InspectionCertificate(
+                certificate_number=f'BENCH-C-{i}', issued_on=today, issued_to='Benchmark', contracter='Benchmark',
+                indenter='Benchmark', consignee='Benchmark', department=department, date_of_delivery=today,
+                delivery_status='FULL', stock_register=register
+            ) for i in range(size)
+        ], batch_size=BULK_BATCH_SIZE)
+        certificates = InspectionCertificate.objects.filter(certificate_number__startswith='BENCH-C-')
+        InspectionItem.objects.bulk_create([
+            InspectionItem(
+                inspection_id=certificate_id, item=inventory.batch.item, tendered_quantity=1, accepted_quantity=1,
+                rejected_quantity=0
+            ) for certificate_id in certificates.values_list('id', flat=True) for _ in range(2)
+        ], batch_size=BULK_BATCH_SIZE)
+
+        context = {'request': Request(APIRequestFactory(SERVER_NAME='localhost').get('/api/certificates/'))}
+        self.measure(
+            f'serialize {size} certificates, COUNT and reverse() per row (before)',
+            lambda: PerRowCertificateSerializer(certificates, many=True, context=context).data
+        )
+        self.measure(
+            f'serialize {size} certificates, annotated count and link prefix (after)',
+            lambda: InspectionCertificateSerializer(
+                certificates.annotate(num_items=Count('items')), many=True, context=context
+            ).data
+        )
+        self.expect(self.measure(
+            'GET certificates/?page_size=500', lambda: self.client.get('/api/certificates/', {'page_size': 500})
+        ))
+
+    def bench_codes(self, size):
+        # The same counter path as reserve_stock_entry_codes, on a throwaway key
+        # so today's stock entry numbers are left alone
+        key = f'bench:{uuid.uuid4()}'
+        try:
+            for writers in (1, 4, 16):
+                per_writer = max(1, size // writers)
+                barrier = threading.Barrier(writers + 1)
+
+                def write():
+                    try:
+                        barrier.wait()
+                        for _ in range(per_writer):
+                            # One number per transaction, as a StockEntry save takes it
+                            with transaction.atomic():
+                                reserve_sequence(key)
+                    finally:
+                        connection.close()
+
+                threads = [threading.Thread(target=write) for _ in range(writers)]
+                for thread in threads:
+                    thread.start()
+                barrier.wait()
+                started = time.perf_counter()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'  writers={writers}: {writers * per_writer} numbers in {elapsed * 1000:.0f} ms, '
+                    f'{writers * per_writer / elapsed:.0f}/s'
+                )
+            self.measure(f'one bulk reservation of {size}', lambda: reserve_sequence(key, count=size))
+            self.stdout.write(f'    last number {SequenceCounter.objects.get(key=key).last_value}')
+        finally:
+            SequenceCounter.objects.filter(key=key).delete()
+
+
+@contextmanager
+def count_queries():
+    """Count the queries run inside the block, in a one-item list (unlike query capture, not capped)"""
+    count = [0]
+
+    def record(execute, sql, params, many, context):
+        count[0] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(record):
+        yield count
+
+
+class PerRowCertificateSerializer(InspectionCertificateSerializer):
+    """The certificate serializer as it was, counting and reversing for every row"""
+
+    def get_item_count(self, obj):
+        return InspectionItem.objects.filter(inspection=obj).count()
+
+    def get_items_link(self, obj):
+        url = reverse('certificate-items-list', kwargs={'certificate_pk': obj.id})
+        return self.context['request'].build_absolute_uri(url)
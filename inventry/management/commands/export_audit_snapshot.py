@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventry.snapshot import build_snapshot, parse_since, snapshot_queryset
+
+
+class Command(BaseCommand):
+    help = 'Export a compact asset tag snapshot for offline audit scanners'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', type=int, help='Only assets currently in this store')
+        parser.add_argument('--department', type=int, help='Only assets in stores of this department')
+        parser.add_argument('--since', help='ISO timestamp; export only assets updated or moved out since then (delta)')
+        parser.add_argument('--output', required=True, help='File to write the snapshot to')
+        parser.add_argument('--no-compress', action='store_true', help='Write the raw snapshot instead of gzip')
+
+    def handle(self, *args, **options):
+        if not options['store'] and not options['department']:
+            raise CommandError('Pass --store or --department')
+
+        try:
+            since = parse_since(options['since'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        generated_at = timezone.now()
+        assets = snapshot_queryset(options['store'], options['department'], since)
+        data = build_snapshot(assets, since=since, generated_at=generated_at, compress=not options['no_compress'])
+
+        with open(options['output'], 'wb') as f:
+            f.write(data)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(data)} bytes to {options['output']} "
+            f"(pass --since {generated_at.isoformat()} for the next delta)"
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventry.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the asset tag search index (AssetSearchToken)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Assets indexed per insert round')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_index(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} asset tags'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventry.models import StockBalance, StockRegister
+
+
+class Command(BaseCommand):
+    help = 'Rebuild stock entry running balances and current balances from the ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--register', type=int, action='append', help='Stock register id (repeatable); default all')
+
+    def handle(self, *args, **options):
+        registers = StockRegister.objects.order_by('pk')
+        if options['register']:
+            registers = registers.filter(pk__in=options['register'])
+            missing = set(options['register']) - set(registers.values_list('pk', flat=True))
+            if missing:
+                raise CommandError(f"No stock register with id {', '.join(map(str, sorted(missing)))}")
+
+        for register in registers:
+            entries, corrected, clamped = StockBalance.recompute(register)
+            self.stdout.write(f"{register.register_number}: {entries} entries, {corrected} balances corrected")
+            if clamped:
+                self.stdout.write(self.style.WARNING(
+                    f"{register.register_number}: {clamped} issues exceeded the balance; recorded as 0"
+                ))
+        self.stdout.write(self.style.SUCCESS('Done'))
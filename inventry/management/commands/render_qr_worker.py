@@ -0,0 +1,89 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from inventry.models import AssetTag, QRRenderJob
+
+
+class Command(BaseCommand):
+    help = 'Render pending asset tag QR images from the render queue using a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Number of render processes (default: all cores)')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Jobs claimed from the queue per round')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--lease', type=int, default=300,
+                            help='Seconds a claimed job stays locked before it can be retried')
+        parser.add_argument('--max-attempts', type=int, default=5,
+                            help='Give up on a job after this many failed attempts')
+        parser.add_argument('--enqueue-missing', action='store_true',
+                            help='Queue every pending tag that has no render job before starting')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty instead of polling')
+
+    def handle(self, *args, **options):
+        if options['enqueue_missing']:
+            queued = self.enqueue_missing()
+            self.stdout.write(f'Queued {queued} tags without a render job')
+
+        rendered = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            try:
+                while True:
+                    jobs = self.claim_jobs(options['batch_size'], options['lease'], options['max_attempts'])
+                    if not jobs:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+                        continue
+
+                    rendered += self.render(jobs, executor, options['workers'])
+            except KeyboardInterrupt:
+                pass
+
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} QR images'))
+
+    def enqueue_missing(self):
+        pending = AssetTag.objects.filter(
+            qr_image_status='PENDING',
+            qr_render_job__isnull=True
+        ).values_list('id', flat=True)
+        jobs = [QRRenderJob(asset_id=asset_id) for asset_id in pending.iterator()]
+        QRRenderJob.objects.bulk_create(jobs, batch_size=500, ignore_conflicts=True)
+        return len(jobs)
+
+    def claim_jobs(self, batch_size, lease, max_attempts):
+        """Lock the oldest available jobs so concurrent workers skip them"""
+        now = timezone.now()
+        with transaction.atomic():
+            jobs = list(
+                QRRenderJob.objects.select_for_update(skip_locked=True)
+                .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now))
+                .filter(attempts__lt=max_attempts)
+                .select_related('asset')[:batch_size]
+            )
+            QRRenderJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                locked_until=now + timedelta(seconds=lease),
+                attempts=F('attempts') + 1
+            )
+        return jobs
+
+    def render(self, jobs, executor, workers):
+        tags = [job.asset for job in jobs]
+        chunksize = max(1, len(tags) // (workers * 4))
+        try:
+            AssetTag.render_qr_images(tags, map_func=lambda fn, args: executor.map(fn, args, chunksize=chunksize))
+        except Exception as e:
+            QRRenderJob.objects.filter(pk__in=[job.pk for job in jobs]).update(last_error=str(e))
+            self.stderr.write(f'Failed to render {len(tags)} QR images: {e}')
+            return 0
+        return len(tags)
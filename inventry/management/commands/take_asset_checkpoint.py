@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventry.history import take_checkpoint
+from inventry.models import AssetCheckpoint
+
+
+class Command(BaseCommand):
+    help = 'Record the current state of every asset for point-in-time (as-of) queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, help='Delete all but the newest N checkpoints afterwards')
+
+    def handle(self, *args, **options):
+        keep = options['keep']
+        if keep is not None and keep < 1:
+            raise CommandError('--keep must be at least 1')
+
+        checkpoint = take_checkpoint()
+        self.stdout.write(self.style.SUCCESS(
+            f"Checkpoint {checkpoint.pk} at {checkpoint.taken_at.isoformat()}: {checkpoint.asset_count} assets"
+        ))
+
+        if keep is not None:
+            stale = list(AssetCheckpoint.objects.order_by('-taken_at').values_list('pk', flat=True)[keep:])
+            if stale:
+                AssetCheckpoint.objects.filter(pk__in=stale).delete()
+                self.stdout.write(f"Deleted {len(stale)} older checkpoints")
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mark_rendered_tags_ready(apps, schema_editor):
+    AssetTag = apps.get_model('inventry', 'AssetTag')
+    AssetTag.objects.exclude(qr_code_image='').exclude(qr_code_image__isnull=True).update(qr_image_status='READY')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventry', '0003_alter_stockentry_stock_register_assettag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assettag',
+            name='qr_image_status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('READY', 'Ready')], default='PENDING', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='QRRenderJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('asset', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='qr_render_job', to='inventry.assettag')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(mark_rendered_tags_ready, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventry', '0005_sequencecounter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockentry',
+            name='entry_number',
+            field=models.CharField(blank=True, editable=False, max_length=20, unique=True),
+        ),
+    ]
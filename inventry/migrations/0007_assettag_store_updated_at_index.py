@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventry', '0006_alter_stockentry_entry_number'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assettag',
+            index=models.Index(fields=['current_store', 'updated_at'], name='inventry_as_current_370f9d_idx'),
+        ),
+    ]
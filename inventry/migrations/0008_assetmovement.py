@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventry', '0007_assettag_store_updated_at_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, choices=[('IN_STOCK', 'In Stock'), ('IN_USE', 'In Use'), ('UNDER_REPAIR', 'Under Repair'), ('WRITTEN_OFF', 'Written Off'), ('LOST', 'Lost')], max_length=20)),
+                ('to_status', models.CharField(choices=[('IN_STOCK', 'In Stock'), ('IN_USE', 'In Use'), ('UNDER_REPAIR', 'Under Repair'), ('WRITTEN_OFF', 'Written Off'), ('LOST', 'Lost')], max_length=20)),
+                ('from_assigned_to', models.CharField(blank=True, max_length=255)),
+                ('to_assigned_to', models.CharField(blank=True, max_length=255)),
+                ('remarks', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='inventry.assettag')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('from_location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movements_out', to='inventry.location')),
+                ('from_store', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movements_out', to='inventry.store')),
+                ('to_location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movements_in', to='inventry.location')),
+                ('to_store', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movements_in', to='inventry.store')),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['asset', 'created_at'], name='inventry_as_asset_i_24cd67_idx'), models.Index(fields=['to_location', 'created_at'], name='inventry_as_to_loca_23afa3_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventry', '0008_assetmovement'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(unique=True)),
+                ('asset_count', models.PositiveIntegerField(default=0)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-taken_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AssetCheckpointState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('IN_STOCK', 'In Stock'), ('IN_USE', 'In Use'), ('UNDER_REPAIR', 'Under Repair'), ('WRITTEN_OFF', 'Written Off'), ('LOST', 'Lost')], max_length=20)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoint_states', to='inventry.assettag')),
+                ('checkpoint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='states', to='inventry.assetcheckpoint')),
+                ('location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inventry.location')),
+                ('store', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inventry.store')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['checkpoint', 'location'], name='inventry_as_checkpo_0b05eb_idx'), models.Index(fields=['checkpoint', 'store'], name='inventry_as_checkpo_e96bbd_idx')],
+                'unique_together': {('checkpoint', 'asset')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventry', '0009_assetcheckpoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assettag',
+            index=models.Index(fields=['-created_at', '-id'], name='inventry_as_created_37eb8a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='batch',
+            index=models.Index(fields=['-created_at', '-id'], name='inventry_ba_created_d838f0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockentry',
+            index=models.Index(fields=['-created_at', '-id'], name='inventry_st_created_89f727_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockentry',
+            index=models.Index(fields=['stock_register', '-created_at', '-id'], name='inventry_st_stock_r_d2729d_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from inventry.helper_functions import search_trigrams
+
+
+def index_existing_tags(apps, schema_editor):
+    AssetTag = apps.get_model('inventry', 'AssetTag')
+    AssetSearchToken = apps.get_model('inventry', 'AssetSearchToken')
+    tokens = []
+    for asset_id, tag_number in AssetTag.objects.values_list('id', 'tag_number').iterator(chunk_size=2000):
+        tokens.extend(AssetSearchToken(token=token, asset_id=asset_id) for token in search_trigrams(tag_number))
+        if len(tokens) >= 20000:
+            AssetSearchToken.objects.bulk_create(tokens, batch_size=2000)
+            tokens = []
+    AssetSearchToken.objects.bulk_create(tokens, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventry', '0010_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=3)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='inventry.assettag')),
+            ],
+            options={
+                'unique_together': {('token', 'asset')},
+            },
+        ),
+        migrations.RunPython(index_existing_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventry', '0011_assetsearchtoken'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockentry',
+            name='balance',
+            field=models.PositiveIntegerField(editable=False, help_text='Balance of the item in the register after this entry'),
+        ),
+        migrations.CreateModel(
+            name='StockBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stock_balances', to='inventry.item')),
+                ('last_entry', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inventry.stockentry')),
+                ('stock_register', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='inventry.stockregister')),
+            ],
+            options={
+                'unique_together': {('stock_register', 'item')},
+            },
+        ),
+    ]
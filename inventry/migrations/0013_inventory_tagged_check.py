@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventry', '0012_stockbalance'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='storeinventory',
+            constraint=models.CheckConstraint(condition=models.Q(('quantity_qr_tagged__lte', models.F('quantity_on_hand'))), name='inventory_tagged_within_on_hand'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 09:00
+
+from django.db import migrations, models
+
+
+def mark_unqueued_tags_on_demand(apps, schema_editor):
+    # Tags created while QR_PERSIST_IMAGES was off were left PENDING with no render job
+    AssetTag = apps.get_model('inventry', 'AssetTag')
+    AssetTag.objects.filter(qr_image_status='PENDING', qr_render_job__isnull=True).filter(
+        models.Q(qr_code_image='') | models.Q(qr_code_image__isnull=True)
+    ).update(qr_image_status='ON_DEMAND')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventry', '0013_inventory_tagged_check'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='assettag',
+            name='qr_image_status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('READY', 'Ready'), ('ON_DEMAND', 'Rendered on demand')], default='PENDING', max_length=10),
+        ),
+        migrations.RunPython(mark_unqueued_tags_on_demand, migrations.RunPython.noop),
+    ]
@@ -3,11 +3,29 @@ from  django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 import uuid
 from .helper_functions import *
-import qrcode
-from io import BytesIO
-from django.core.files import File
-from django.db import transaction
+from .qr import build_qr_url, render_qr_png
+from django.core.files.base import ContentFile
+from django.db import transaction, connection
 from django.conf import settings
+from django.utils import timezone
+from .scan_cache import scan_cache
+from .autocomplete import tag_index
+
+# Rows per INSERT/UPDATE statement for bulk operations
+BULK_BATCH_SIZE = 500
+
+class SequenceCounter(models.Model):
+    """
+    Named counters for generated numbers (asset tags, codes, ...).
+    Values are handed out by `reserve_sequence`, which locks the row.
+    """
+    key = models.CharField(max_length=100, unique=True)
+    last_value = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.key}: {self.last_value}'
+
 
 class Department(models.Model):
     name = models.CharField(max_length=255)
@@ -16,9 +34,11 @@ class Department(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def save(self, *args, **kwargs):
-        if not self.code:
-            self.code = generate_department_code(self.name)
-        super().save(*args, **kwargs)
+        # Allocate the code in the same transaction so a failed insert releases it
+        with transaction.atomic():
+            if not self.code:
+                self.code = generate_department_code(self.name)
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f'{self.name} - {self.code}'
@@ -56,9 +76,10 @@ class StockRegister(models.Model):
     is_active  = models.BooleanField(default=True)
 
     def save(self, *args, **kwargs):
-        if not self.register_number:
-            self.register_number = generate_register_number(self.store.code, self.register_type)
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.register_number:
+                self.register_number = generate_register_number(self.store.code, self.register_type)
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f'{self.register_name} - {self.register_number} ({self.get_register_type_display()})'
@@ -161,6 +182,13 @@ class StoreInventory(models.Model):
 
     class Meta:
         unique_together = [['store', 'batch',]]
+        constraints = [
+            # Quantities change through inventry.services, which checks this too
+            models.CheckConstraint(
+                condition=models.Q(quantity_qr_tagged__lte=models.F('quantity_on_hand')),
+                name='inventory_tagged_within_on_hand',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.store.code} - (Batch: {self.batch.batch_number})'
@@ -238,8 +266,8 @@ class StockEntry(models.Model):
     ]
     entry_number = models.CharField(
         max_length=20, 
-        default=generate_stock_entry_code,
         unique=True,
+        blank=True,
         editable=False)
     entry_type = models.CharField(max_length=20, choices=ENTRY_TYPE)
     item = models.ForeignKey(Item, on_delete=models.PROTECT)
@@ -252,11 +280,185 @@ class StockEntry(models.Model):
     transfer_note = models.ForeignKey(TransferNote, on_delete=models.SET_NULL, null=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    balance = models.PositiveIntegerField(help_text='Enter balace')
+    balance = models.PositiveIntegerField(editable=False, help_text='Balance of the item in the register after this entry')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['stock_register', '-created_at', '-id']),
+        ]
+
+    # Fields that move the balance; fixed once an entry is posted
+    LEDGER_FIELDS = ('entry_type', 'item', 'quantity', 'stock_register')
+
+    @property
+    def change(self):
+        return self.quantity if self.entry_type == 'RECEIPT' else -self.quantity
+
+    def save(self, *args, **kwargs):
+        # Number, balance and entry are committed together, with the balance row locked
+        with transaction.atomic():
+            if not self.entry_number:
+                self.entry_number = generate_stock_entry_code()
+            if self._state.adding:
+                balance = StockBalance.lock(self.stock_register_id, self.item_id)
+                self.balance = balance.post(self)
+                super().save(*args, **kwargs)
+                balance.save_after(self)
+            else:
+                super().save(*args, **kwargs)
+
+    @classmethod
+    def assign_entry_numbers(cls, entries):
+        """
+        Fill in entry numbers for unsaved entries with a single reservation,
+        e.g. before bulk_create during imports
+        """
+        pending = [entry for entry in entries if not entry.entry_number]
+        for entry, number in zip(pending, reserve_stock_entry_codes(len(pending)) if pending else []):
+            entry.entry_number = number
+        return entries
+
+    @classmethod
+    def post_many(cls, entries):
+        """
+        Number, balance and bulk insert unsaved entries in list order,
+        locking each (register, item) balance row once
+        """
+        with transaction.atomic():
+            cls.assign_entry_numbers(entries)
+            balances = {}
+            for entry in entries:
+                key = (entry.stock_register_id, entry.item_id)
+                if key not in balances:
+                    balances[key] = StockBalance.lock(*key)
+                entry.balance = balances[key].post(entry)
+            created = cls.objects.bulk_create(entries, batch_size=BULK_BATCH_SIZE)
+            if not connection.features.can_return_rows_from_bulk_insert:
+                # MySQL does not hand back primary keys from bulk inserts
+                numbers = [entry.entry_number for entry in created]
+                by_number = {}
+                for start in range(0, len(numbers), BULK_BATCH_SIZE):
+                    chunk = numbers[start:start + BULK_BATCH_SIZE]
+                    by_number.update(cls.objects.filter(entry_number__in=chunk).in_bulk(field_name='entry_number'))
+                created = [by_number[number] for number in numbers]
+            last = {(entry.stock_register_id, entry.item_id): entry for entry in created}
+            for key, balance in balances.items():
+                balance.save_after(last[key])
+        return created
+
+    @classmethod
+    def ledger_balance(cls, stock_register_id, item_id):
+        """Receipts minus issues of an item in a register, from the full ledger"""
+        # Summed separately: negating the unsigned quantity column fails on MySQL
+        totals = cls.objects.filter(stock_register_id=stock_register_id, item_id=item_id).aggregate(
+            received=models.Sum('quantity', filter=models.Q(entry_type='RECEIPT')),
+            issued=models.Sum('quantity', filter=models.Q(entry_type='ISSUE')),
+        )
+        return (totals['received'] or 0) - (totals['issued'] or 0)
 
     def __str__(self):
         return f'{self.entry_number} ({self.entry_type}) - {self.item.code} x {self.quantity}'
 
+class StockBalance(models.Model):
+    """
+    Current balance of an item in a stock register. StockEntry.save() locks
+    the row while it posts an entry, so the balance and each entry's
+    running `balance` move together; the row is seeded from the ledger the
+    first time the pair is posted to. `recompute` rebuilds a register's
+    balances from its entries.
+    """
+    stock_register = models.ForeignKey(StockRegister, on_delete=models.CASCADE, related_name='balances')
+    item = models.ForeignKey(Item, on_delete=models.PROTECT, related_name='stock_balances')
+    quantity = models.PositiveIntegerField(default=0)
+    last_entry = models.ForeignKey(StockEntry, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [['stock_register', 'item']]
+
+    def __str__(self):
+        return f'{self.stock_register_id}/{self.item_id}: {self.quantity}'
+
+    @classmethod
+    def lock(cls, stock_register_id, item_id):
+        """The balance row for (register, item), created if needed; locked until the transaction ends"""
+        key = {'stock_register_id': stock_register_id, 'item_id': item_id}
+        with transaction.atomic():
+            if not cls.objects.filter(**key).exists():
+                # INSERT IGNORE, so a concurrent first use is a no-op instead of an error
+                cls.objects.bulk_create(
+                    [cls(**key, quantity=max(0, StockEntry.ledger_balance(stock_register_id, item_id)))],
+                    ignore_conflicts=True
+                )
+            return cls.objects.select_for_update().get(**key)
+
+    def post(self, entry):
+        """Apply `entry` to the (locked) balance and return the new quantity"""
+        quantity = self.quantity + entry.change
+        if quantity < 0:
+            raise ValidationError({
+                'quantity': f'Cannot issue {entry.quantity}; the register holds {self.quantity} of this item'
+            })
+        self.quantity = quantity
+        return quantity
+
+    def save_after(self, entry):
+        self.last_entry = entry
+        self.save(update_fields=['quantity', 'last_entry', 'updated_at'])
+
+    @classmethod
+    def recompute(cls, stock_register):
+        """
+        Rebuild the running balance of every entry in `stock_register`, and
+        its balance rows, in one pass over the ledger in posting order.
+        Returns `(entries, corrected, clamped)`: entries read, entries whose
+        stored balance changed, and issues that would have gone below zero
+        (their balance is recorded as 0).
+        """
+        with transaction.atomic():
+            # Hold off new postings to this register until the pass commits
+            existing = {
+                balance.item_id: balance
+                for balance in cls.objects.select_for_update().filter(stock_register=stock_register)
+            }
+
+            totals, last, changed = {}, {}, []
+            entries = corrected = clamped = 0
+            ledger = StockEntry.objects.filter(stock_register=stock_register).order_by('created_at', 'id').only(
+                'id', 'entry_type', 'item_id', 'quantity', 'balance'
+            )
+            for entry in ledger.iterator(chunk_size=2000):
+                entries += 1
+                quantity = totals.get(entry.item_id, 0) + entry.change
+                if quantity < 0:
+                    clamped += 1
+                    quantity = 0
+                totals[entry.item_id] = quantity
+                last[entry.item_id] = entry.pk
+                if entry.balance != quantity:
+                    entry.balance = quantity
+                    changed.append(entry)
+                if len(changed) >= BULK_BATCH_SIZE:
+                    StockEntry.objects.bulk_update(changed, ['balance'])
+                    corrected += len(changed)
+                    changed = []
+            StockEntry.objects.bulk_update(changed, ['balance'], batch_size=BULK_BATCH_SIZE)
+            corrected += len(changed)
+
+            cls.objects.filter(pk__in=[
+                balance.pk for item_id, balance in existing.items() if item_id not in totals
+            ]).delete()
+            now, updated, created = timezone.now(), [], []
+            for item_id, quantity in totals.items():
+                balance = existing.get(item_id) or cls(stock_register=stock_register, item_id=item_id)
+                balance.quantity, balance.last_entry_id, balance.updated_at = quantity, last[item_id], now
+                (updated if balance.pk else created).append(balance)
+            cls.objects.bulk_update(updated, ['quantity', 'last_entry', 'updated_at'], batch_size=BULK_BATCH_SIZE)
+            cls.objects.bulk_create(created, batch_size=BULK_BATCH_SIZE)
+        return entries, corrected, clamped
+
+
 class Batch(models.Model):
     """
     Core tracking unit for inventory.
@@ -325,6 +527,11 @@ class Batch(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+        ]
+
     def clean(self):
         if self.source_type == 'DEPARTMENTAL_PURCHASE' and not self.inspection_item:
             raise ValidationError("Inspection item required for departmental purchase batch.")
@@ -362,10 +569,17 @@ class AssetTag(models.Model):
         ('LOST', 'Lost'),
     ]
 
+    QR_IMAGE_STATUS = [
+        ('PENDING', 'Pending'),
+        ('READY', 'Ready'),
+        ('ON_DEMAND', 'Rendered on demand'),
+    ]
+
     # Core identifiers
     tag_number = models.CharField(max_length=100, unique=True, editable=False)
     qr_code_uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     qr_code_image = models.ImageField(upload_to='qr_codes/', blank=True, null=True)
+    qr_image_status = models.CharField(max_length=10, choices=QR_IMAGE_STATUS, default='PENDING')
     
     # Links to existing models
     batch = models.ForeignKey('Batch', on_delete=models.PROTECT, related_name='asset_tags')
@@ -391,6 +605,8 @@ class AssetTag(models.Model):
             models.Index(fields=['tag_number']),
             models.Index(fields=['qr_code_uuid']),
             models.Index(fields=['status', 'current_store']),
+            models.Index(fields=['current_store', 'updated_at']),
+            models.Index(fields=['-created_at', '-id']),
         ]
 
     def save(self, *args, **kwargs):
@@ -398,58 +614,176 @@ class AssetTag(models.Model):
             self.tag_number = self._generate_tag_number()
         
         is_new = not self.pk
-        super().save(*args, **kwargs)
-        
         if is_new and not self.qr_code_image:
-            self._generate_qr_code()
-    
-    def _generate_tag_number(self):
-        """Generate unique tag: DEPT-ITEM-BATCH-0001"""
-        dept = self.batch.item.department.code[:4].upper()
-        item = self.batch.item.code[:6].upper()
-        batch_seq = self.batch.batch_number.split('-')[-1][:4] if '-' in self.batch.batch_number else 'XXXX'
-        
-        # Get next sequence
-        last_tag = AssetTag.objects.filter(batch=self.batch).order_by('-tag_number').first()
-        next_seq = 1
-        
-        if last_tag and '-' in last_tag.tag_number:
-            try:
-                next_seq = int(last_tag.tag_number.split('-')[-1]) + 1
-            except:
-                pass
+            self.qr_image_status = self._new_qr_image_status()
+        super().save(*args, **kwargs)
         
-        return f"{dept}-{item}-{batch_seq}-{next_seq:04d}"
+        if is_new and not self.qr_code_image and settings.QR_PERSIST_IMAGES:
+            QRRenderJob.objects.create(asset=self)
+
+    @staticmethod
+    def _new_qr_image_status():
+        """Tags wait for an image only when a render job is queued for them"""
+        return 'PENDING' if settings.QR_PERSIST_IMAGES else 'ON_DEMAND'
     
-    def _generate_qr_code(self):
+    @classmethod
+    def bulk_generate(cls, batch, store, quantity, created_by=None):
+        """
+        Create `quantity` tags for a batch with a single reserved sequence range.
+        Tags are inserted with bulk_create; QR images are served on demand and
+        only queued for rendering to files when QR_PERSIST_IMAGES is enabled.
+        bulk_create skips post_save, so search tokens and autocomplete entries
+        are added here.
+        """
+        prefix = cls._tag_prefix(batch)
+        first_seq = cls._reserve_tag_sequence(batch, quantity)
+        qr_image_status = cls._new_qr_image_status()
+
+        tags = [
+            cls(
+                tag_number=f"{prefix}-{seq:04d}",
+                batch=batch,
+                current_store=store,
+                qr_image_status=qr_image_status,
+                created_by=created_by,
+            )
+            for seq in range(first_seq, first_seq + quantity)
+        ]
+        cls.objects.bulk_create(tags, batch_size=BULK_BATCH_SIZE)
+
+        if not connection.features.can_return_rows_from_bulk_insert:
+            # MySQL does not hand back primary keys from bulk inserts
+            uuids = [tag.qr_code_uuid for tag in tags]
+            by_uuid = {}
+            for start in range(0, len(uuids), BULK_BATCH_SIZE):
+                chunk = uuids[start:start + BULK_BATCH_SIZE]
+                by_uuid.update(cls.objects.filter(qr_code_uuid__in=chunk).in_bulk(field_name='qr_code_uuid'))
+            tags = [by_uuid[uuid] for uuid in uuids]
+
+        if settings.QR_PERSIST_IMAGES:
+            QRRenderJob.objects.bulk_create(
+                [QRRenderJob(asset=tag) for tag in tags],
+                batch_size=BULK_BATCH_SIZE
+            )
+        AssetSearchToken.index(tags, replace=False)
+        rows = [(tag.tag_number, tag.pk) for tag in tags]
+        transaction.on_commit(lambda: tag_index.add_many(rows))
+
+        return tags
+
+    @classmethod
+    def render_qr_images(cls, tags, map_func=map):
         """
-        Generate QR code that directly points to your endpoint for this asset
+        Render and store QR images for `tags`, mark them ready and clear their
+        queued render jobs. `map_func` lets callers fan the PNG encoding out,
+        e.g. to `ProcessPoolExecutor.map`.
         """
-        from django.conf import settings
+        tags = list(tags)
+        if not tags:
+            return tags
 
-        # Build full URL to scan endpoint
-        qr_url = f"{settings.SITE_URL}/api/asset-tags/scan/{self.qr_code_uuid}/"
+        qr_urls = [tag.qr_url for tag in tags]
+        for tag, png in zip(tags, map_func(render_qr_png, qr_urls)):
+            tag.qr_code_image.save(f'qr_{tag.tag_number}.png', ContentFile(png), save=False)
+            tag.qr_image_status = 'READY'
 
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
-            border=4,
+        cls.objects.bulk_update(tags, ['qr_code_image', 'qr_image_status'], batch_size=BULK_BATCH_SIZE)
+        QRRenderJob.objects.filter(asset__in=[tag.pk for tag in tags]).delete()
+        return tags
+
+    def apply_changes(self, status=None, assigned_to=None, location_id=None, store_id=None, remarks=None,
+                      created_by=None):
+        """
+        Apply a status/assignment/location/store update in memory and return
+        the unsaved AssetMovement recording it, or None when nothing changed.
+        Remarks belong to the movement, not the asset. The caller saves both.
+        """
+        previous = self.movement_state()
+        if status:
+            self.status = status
+        if assigned_to:
+            self.assigned_to = assigned_to
+        if location_id:
+            self.current_location_id = location_id
+        if store_id:
+            self.current_store_id = store_id
+        return AssetMovement.between(self, previous, remarks=remarks, created_by=created_by)
+
+    def movement_state(self):
+        """Values tracked by AssetMovement, for comparing before and after a change"""
+        return {field: getattr(self, field) for field in AssetMovement.TRACKED_FIELDS}
+
+    @classmethod
+    def bulk_apply_changes(cls, assets, created_by=None, **changes):
+        """
+        Apply the same `apply_changes` update to many assets with one
+        bulk_update and one bulk_create of their movements, and return the
+        movements. bulk_update skips auto_now and signals, so updated_at is
+        set here and cached scan results are dropped explicitly.
+        """
+        now = timezone.now()
+        movements, changed = [], []
+        for asset in assets:
+            movement = asset.apply_changes(created_by=created_by, **changes)
+            if movement is None:
+                continue
+            movement.created_at = now
+            movements.append(movement)
+            if movement.changed_fields():
+                asset.updated_at = now
+                changed.append(asset)
+
+        if changed:
+            cls.objects.bulk_update(
+                changed, ['status', 'assigned_to', 'current_location', 'current_store', 'updated_at'],
+                batch_size=BULK_BATCH_SIZE
+            )
+            for asset in changed:
+                scan_cache.invalidate(str(asset.qr_code_uuid))
+        AssetMovement.objects.bulk_create(movements, batch_size=BULK_BATCH_SIZE)
+        return movements
+
+    def qr_image_path(self, fmt='png'):
+        """Path of the on-demand QR image endpoint for this asset"""
+        return f'/api/asset-tags/{self.qr_code_uuid}/qr.{fmt}'
+
+    @property
+    def qr_url(self):
+        """URL encoded into this asset's QR code"""
+        return build_qr_url(settings.SITE_URL, self.qr_code_uuid)
+
+    @staticmethod
+    def _tag_prefix(batch):
+        """DEPT-ITEM-BATCH part of the tag number"""
+        dept = batch.item.department.code[:4].upper()
+        item = batch.item.code[:6].upper()
+        batch_seq = batch.batch_number.split('-')[-1][:4] if '-' in batch.batch_number else 'XXXX'
+        return f"{dept}-{item}-{batch_seq}"
+
+    @classmethod
+    def _reserve_tag_sequence(cls, batch, count=1):
+        """Reserve `count` consecutive sequence numbers for tags of this batch"""
+        return reserve_sequence(
+            f'asset-tag:{batch.pk}',
+            count=count,
+            seed=lambda: cls._last_tag_sequence(batch)
         )
-        qr.add_data(qr_url)
-        qr.make(fit=True)
-    
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        file_name = f'qr_{self.tag_number}.png'
-    
-        self.qr_code_image.save(file_name, File(buffer), save=False)
-        buffer.close()
-    
-        # Update without triggering save loop
-        AssetTag.objects.filter(pk=self.pk).update(qr_code_image=self.qr_code_image)
 
+    @classmethod
+    def _last_tag_sequence(cls, batch):
+        """Highest sequence already used by this batch's tags (seeds its counter)"""
+        last_seq = 0
+        for tag_number in cls.objects.filter(batch=batch).values_list('tag_number', flat=True).iterator():
+            try:
+                last_seq = max(last_seq, int(tag_number.split('-')[-1]))
+            except ValueError:
+                pass
+        return last_seq
+
+    def _generate_tag_number(self):
+        """Generate unique tag: DEPT-ITEM-BATCH-0001"""
+        return f"{self._tag_prefix(self.batch)}-{self._reserve_tag_sequence(self.batch):04d}"
+    
     def get_full_details(self):
         """Get complete details including from batch and inspection"""
         batch = self.batch
@@ -520,12 +854,137 @@ class AssetTag(models.Model):
         return f"{self.tag_number} - {self.batch.item.name} ({self.get_status_display()})"
 
 
+class QRRenderJob(models.Model):
+    """Queue of asset tags waiting for their QR image to be rendered"""
+    asset = models.OneToOneField(AssetTag, on_delete=models.CASCADE, related_name='qr_render_job')
+    attempts = models.PositiveIntegerField(default=0)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
 
+    def __str__(self):
+        return f'QR render job for {self.asset_id} (attempts: {self.attempts})'
 
 
-    
-    
+class AssetMovement(models.Model):
+    """Append-only history of status, assignment, location and store changes of an asset"""
 
+    TRACKED_FIELDS = ('status', 'assigned_to', 'current_location_id', 'current_store_id')
 
+    asset = models.ForeignKey(AssetTag, on_delete=models.CASCADE, related_name='movements')
 
-    
\ No newline at end of file
+    from_status = models.CharField(max_length=20, choices=AssetTag.STATUS_CHOICES, blank=True)
+    to_status = models.CharField(max_length=20, choices=AssetTag.STATUS_CHOICES)
+    from_location = models.ForeignKey('Location', on_delete=models.SET_NULL, null=True, blank=True, related_name='movements_out')
+    to_location = models.ForeignKey('Location', on_delete=models.SET_NULL, null=True, blank=True, related_name='movements_in')
+    from_store = models.ForeignKey('Store', on_delete=models.SET_NULL, null=True, blank=True, related_name='movements_out')
+    to_store = models.ForeignKey('Store', on_delete=models.SET_NULL, null=True, blank=True, related_name='movements_in')
+    from_assigned_to = models.CharField(max_length=255, blank=True)
+    to_assigned_to = models.CharField(max_length=255, blank=True)
+
+    remarks = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['asset', 'created_at']),
+            models.Index(fields=['to_location', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.asset_id}: {self.from_status or '-'} -> {self.to_status} at {self.created_at}"
+
+    @classmethod
+    def between(cls, asset, previous, remarks=None, created_by=None):
+        """
+        Unsaved movement from the `previous` movement_state of `asset` to its
+        current values, or None when nothing changed and there are no remarks
+        """
+        if previous == asset.movement_state() and not remarks:
+            return None
+        return cls(
+            asset=asset,
+            from_status=previous['status'],
+            to_status=asset.status,
+            from_location_id=previous['current_location_id'],
+            to_location_id=asset.current_location_id,
+            from_store_id=previous['current_store_id'],
+            to_store_id=asset.current_store_id,
+            from_assigned_to=previous['assigned_to'],
+            to_assigned_to=asset.assigned_to,
+            remarks=remarks or '',
+            created_by=created_by,
+        )
+
+    def changed_fields(self):
+        """Tracked asset fields this movement changed"""
+        pairs = {
+            'status': (self.from_status, self.to_status),
+            'assigned_to': (self.from_assigned_to, self.to_assigned_to),
+            'current_location': (self.from_location_id, self.to_location_id),
+            'current_store': (self.from_store_id, self.to_store_id),
+        }
+        return [field for field, (before, after) in pairs.items() if before != after]
+
+
+class AssetCheckpoint(models.Model):
+    """
+    Snapshot of every asset's status, location and store at `taken_at`.
+    As-of queries start from the latest checkpoint before the requested
+    time and only replay the movements after it (see history.py).
+    """
+    taken_at = models.DateTimeField(unique=True)
+    asset_count = models.PositiveIntegerField(default=0)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        ordering = ['-taken_at']
+
+    def __str__(self):
+        return f"Checkpoint {self.taken_at} ({self.asset_count} assets)"
+
+
+class AssetCheckpointState(models.Model):
+    """State of one asset in a checkpoint"""
+    checkpoint = models.ForeignKey(AssetCheckpoint, on_delete=models.CASCADE, related_name='states')
+    asset = models.ForeignKey(AssetTag, on_delete=models.CASCADE, related_name='checkpoint_states')
+    status = models.CharField(max_length=20, choices=AssetTag.STATUS_CHOICES)
+    location = models.ForeignKey('Location', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    store = models.ForeignKey('Store', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        unique_together = [['checkpoint', 'asset']]
+        indexes = [
+            models.Index(fields=['checkpoint', 'location']),
+            models.Index(fields=['checkpoint', 'store']),
+        ]
+
+
+class AssetSearchToken(models.Model):
+    """
+    Trigram index of asset tag numbers (see search.py). Kept in step by the
+    AssetTag post_save signal and by bulk_generate; rebuild it with
+    `rebuild_search_index`.
+    """
+    token = models.CharField(max_length=3)
+    asset = models.ForeignKey(AssetTag, on_delete=models.CASCADE, related_name='search_tokens')
+
+    class Meta:
+        unique_together = [['token', 'asset']]
+
+    @classmethod
+    def index(cls, assets, replace=True):
+        """Build the tokens of `assets`; `replace=False` skips deleting old ones for new assets"""
+        assets = list(assets)
+        if replace:
+            cls.objects.filter(asset__in=[asset.pk for asset in assets]).delete()
+        cls.objects.bulk_create([
+            cls(token=token, asset_id=asset.pk)
+            for asset in assets
+            for token in search_trigrams(asset.tag_number)
+        ], batch_size=BULK_BATCH_SIZE * 4)
@@ -0,0 +1,186 @@
+"""
+Keyset (cursor) pagination for list endpoints.
+
+Pages are selected with a WHERE on the ordering columns instead of an
+OFFSET, so page 1000 costs the same as page 1 and rows inserted while a
+client is paging do not shift later pages. The ordering comes from the
+view's `cursor_ordering`, else the model's Meta.ordering, else '-id', and
+always ends with the primary key so every position is unique. Ordering
+fields must be non-null model columns.
+"""
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder, but datetimes and times keep their microseconds
+    (it cuts them to milliseconds), so a cursor seeks exactly past its row
+    instead of skipping rows created in the same millisecond
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetCursorPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = api_settings.PAGE_SIZE or 50
+    max_page_size = 500
+    default_ordering = ('-id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    # Set on an instance to override the view/model ordering
+    ordering = None
+
+    def get_ordering(self, queryset, view):
+        """[(field_name, descending)] ending with the primary key"""
+        ordering = (self.ordering
+                    or getattr(view, 'cursor_ordering', None)
+                    or queryset.model._meta.ordering
+                    or self.default_ordering)
+        pk_name = queryset.model._meta.pk.name
+        fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        fields = [('pk' if name == pk_name else name, descending) for name, descending in fields]
+        if 'pk' not in [name for name, _ in fields]:
+            fields.append(('pk', fields[-1][1]))
+        return fields[:[name for name, _ in fields].index('pk') + 1]
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.fields = self.get_ordering(queryset, view)
+        self.model = queryset.model
+
+        position, reverse = self.decode_cursor(request)
+        fields = [(name, descending != reverse) for name, descending in self.fields]
+        queryset = queryset.order_by(*[f"{'-' if descending else ''}{name}" for name, descending in fields])
+        if position is not None:
+            queryset = queryset.filter(self._after(fields, position))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        # Going backwards, there is a next page (the one we came from) and
+        # a previous one only if more rows were found; forwards the reverse
+        if reverse:
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = results
+        return results
+
+    def _after(self, fields, position):
+        """
+        Rows strictly after `position` in `fields` order. The redundant bound
+        on the first field lets the database seek the index instead of
+        scanning it to evaluate the OR.
+        """
+        first, descending = fields[0]
+        bound = Q(**{f"{first}__{'lte' if descending else 'gte'}": position[0]})
+        condition = Q()
+        for i, (name, descending) in enumerate(fields):
+            step = Q(**{f"{name}__{'lt' if descending else 'gt'}": position[i]})
+            for (equal_name, _), value in zip(fields[:i], position[:i]):
+                step &= Q(**{equal_name: value})
+            condition |= step
+        return bound & condition
+
+    def _position(self, obj):
+        return [getattr(obj, name) for name, _ in self.fields]
+
+    def encode_cursor(self, obj, reverse=False):
+        payload = json.dumps({'p': self._position(obj), 'r': int(reverse)}, cls=CursorEncoder)
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        """`(position, reverse)` from the request's cursor; `(None, False)` for the first page"""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            values, reverse = payload['p'], bool(payload['r'])
+            if len(values) != len(self.fields):
+                raise ValueError(cursor)
+            position = [self._field(name).to_python(value) for (name, _), value in zip(self.fields, values)]
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def _field(self, name):
+        meta = self.model._meta
+        return meta.pk if name == 'pk' else meta.get_field(name)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Number of results to return per page (max {self.max_page_size}).',
+                'schema': {'type': 'integer'},
+            },
+        ]
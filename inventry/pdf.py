@@ -0,0 +1,145 @@
+"""
+PDF label sheets for asset tags.
+
+Lays the 8cm x 5cm print_tags labels out on A4 pages and writes a minimal
+PDF with vector QR codes and the standard Helvetica fonts. Page content
+streams are built by `render_page`, which only takes plain values, so
+pages can be rendered in parallel by a process pool while the document
+is streamed out in order.
+"""
+import multiprocessing
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from .qr import qr_runs
+
+MM = 72 / 25.4
+
+PAGE_WIDTH = 210 * MM
+PAGE_HEIGHT = 297 * MM
+MARGIN = 10 * MM
+GAP = 3 * MM
+
+LABEL_WIDTH = 80 * MM
+LABEL_HEIGHT = 50 * MM
+LABEL_PADDING = 3 * MM
+INFO_HEIGHT = 15 * MM
+
+COLUMNS = int((PAGE_WIDTH - 2 * MARGIN + GAP) // (LABEL_WIDTH + GAP))
+ROWS = int((PAGE_HEIGHT - 2 * MARGIN + GAP) // (LABEL_HEIGHT + GAP))
+LABELS_PER_PAGE = COLUMNS * ROWS
+
+# Fixed QR mask so sheets skip the per-code search over all eight masks
+PDF_MASK_PATTERN = 0
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)').replace('\r', ' ').replace('\n', ' ')
+
+
+def _fit(text, font_size):
+    """Trim text to roughly the label width (Helvetica averages ~0.5em per glyph)"""
+    max_chars = int((LABEL_WIDTH - 2 * LABEL_PADDING) / (font_size * 0.5))
+    return text if len(text) <= max_chars else text[:max_chars - 1] + '...'
+
+
+def _text(font, size, x, y, text, gray=0):
+    return f"BT {gray} g /{font} {size} Tf {x:.2f} {y:.2f} Td ({_escape(_fit(text, size))}) Tj ET"
+
+
+def _label_ops(slot, label):
+    qr_url, tag_number, item_name, batch_number, store_code = label
+    column, row = slot % COLUMNS, slot // COLUMNS
+    left = MARGIN + column * (LABEL_WIDTH + GAP)
+    top = PAGE_HEIGHT - MARGIN - row * (LABEL_HEIGHT + GAP)
+    bottom = top - LABEL_HEIGHT
+    text_x = left + LABEL_PADDING
+    info_top = bottom + LABEL_PADDING + INFO_HEIGHT
+
+    ops = [
+        # Border
+        f"1.5 w 0 G {left:.2f} {bottom:.2f} {LABEL_WIDTH:.2f} {LABEL_HEIGHT:.2f} re S",
+    ]
+
+    # QR code, drawn in module units through a flipped transform
+    size, runs = qr_runs(qr_url, PDF_MASK_PATTERN)
+    qr_side = top - LABEL_PADDING - info_top
+    module = qr_side / size
+    qr_left = left + (LABEL_WIDTH - qr_side) / 2
+    ops.append(f"q {module:.4f} 0 0 {-module:.4f} {qr_left:.2f} {top - LABEL_PADDING:.2f} cm 0 g")
+    ops.extend(f"{x} {y} {length} 1 re" for x, y, length in runs)
+    ops.append("f Q")
+
+    # Separator and text
+    ops.append(f"0.5 w 0.8 G {text_x:.2f} {info_top:.2f} m {left + LABEL_WIDTH - LABEL_PADDING:.2f} {info_top:.2f} l S")
+    ops.append(_text('F2', 10, text_x, info_top - 4.5 * MM, tag_number))
+    ops.append(_text('F1', 8.5, text_x, info_top - 8.5 * MM, item_name))
+    ops.append(_text('F1', 7, text_x, info_top - 12 * MM, f"Batch: {batch_number} | Store: {store_code}", gray=0.4))
+    return ops
+
+
+def render_page(labels):
+    """Compressed content stream for one page of `(qr_url, tag_number, item_name, batch_number, store_code)` labels"""
+    ops = []
+    for slot, label in enumerate(labels):
+        ops.extend(_label_ops(slot, label))
+    return zlib.compress('\n'.join(ops).encode('cp1252', errors='replace'))
+
+
+def stream_label_pdf(labels, workers=1):
+    """
+    Yield the bytes of a PDF laying out `labels` on A4 pages.
+    With more than one worker, page content is rendered in a process pool.
+    """
+    pages = [labels[i:i + LABELS_PER_PAGE] for i in range(0, len(labels), LABELS_PER_PAGE)]
+    offsets = []
+    position = 0
+
+    def emit(data):
+        nonlocal position
+        position += len(data)
+        return data
+
+    def obj(number, body):
+        offsets.append(position)
+        return emit(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    # Objects 1-4 are fixed, then each page takes a page and a content object
+    page_numbers = [5 + 2 * i for i in range(len(pages))]
+    kids = ' '.join(f"{n} 0 R" for n in page_numbers)
+
+    yield emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    yield obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+    yield obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    yield obj(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    yield obj(4, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+
+    executor = None
+    if workers > 1 and len(pages) > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=min(workers, len(pages)),
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        contents = executor.map(render_page, pages, chunksize=max(1, len(pages) // (workers * 4)))
+    else:
+        contents = map(render_page, pages)
+
+    try:
+        for page_number, content in zip(page_numbers, contents):
+            yield obj(page_number, (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH:.2f} {PAGE_HEIGHT:.2f}] "
+                f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {page_number + 1} 0 R >>"
+            ).encode())
+            yield obj(page_number + 1, (
+                f"<< /Length {len(content)} /Filter /FlateDecode >>\nstream\n".encode()
+                + content + b"\nendstream"
+            ))
+    finally:
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    xref_position = position
+    xref = [f"xref\n0 {len(offsets) + 1}\n", "0000000000 65535 f \n"]
+    xref.extend(f"{offset:010d} 00000 n \n" for offset in offsets)
+    yield ''.join(xref).encode()
+    yield f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref_position}\n%%EOF\n".encode()
@@ -0,0 +1,198 @@
+"""
+Per-request SQL and serialization profiling.
+
+QueryProfilingMiddleware attaches a RequestProfile to each request and
+counts the queries run while it is handled: number, total SQL time and
+fingerprints (SQL text with IN lists collapsed), so an N+1 shows up as one
+fingerprint repeated. Views using QueryPlanningMixin also report how long
+serialization took. The totals go out in a Server-Timing header and into
+an in-memory rolling window per endpoint (the last METRICS_WINDOW
+requests), summarized for staff at /api/_metrics. The window is per
+process.
+
+A view can set `query_budget`, either a number or `{action: number}`.
+Exceeding it logs a warning, or raises QueryBudgetExceeded when
+QUERY_BUDGET_STRICT is on (set it in test settings to fail tests).
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+METRICS_WINDOW = 500
+
+# Upper bounds (ms) of the request duration histogram buckets
+DURATION_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# Repeated fingerprints kept per endpoint in the metrics summary
+TOP_DUPLICATES = 5
+
+# Requests to these paths are not recorded
+UNPROFILED_PREFIXES = ('/api/_metrics', '/static/', '/media/')
+
+IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def fingerprint(sql):
+    """Short id of a query's shape; parameters are already out of `sql`"""
+    return hashlib.md5(IN_LIST.sub('IN (...)', sql).encode()).hexdigest()[:12]
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.fingerprints = Counter()
+        self.samples = {}
+        self.serialize_time = None
+        self.endpoint = None
+        self.budget = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+            key = fingerprint(sql)
+            self.fingerprints[key] += 1
+            self.samples.setdefault(key, sql)
+
+    def duplicates(self):
+        """`{fingerprint: count}` of queries run more than once"""
+        return {key: count for key, count in self.fingerprints.items() if count > 1}
+
+    def server_timing(self, total):
+        timings = [f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} queries"']
+        duplicates = sum(count - 1 for count in self.duplicates().values())
+        if duplicates:
+            timings.append(f'db-repeat;desc="{duplicates} repeated queries"')
+        if self.serialize_time is not None:
+            timings.append(f'serialize;dur={self.serialize_time * 1000:.1f}')
+        timings.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(timings)
+
+
+class EndpointMetrics:
+    """Rolling window of request samples per endpoint"""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._duplicates = defaultdict(Counter)
+        self._queries = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, profile, total, size):
+        sample = (total * 1000, profile.sql_time * 1000, profile.queries,
+                  None if profile.serialize_time is None else profile.serialize_time * 1000, size)
+        with self._lock:
+            self._samples[endpoint].append(sample)
+            for key, count in profile.duplicates().items():
+                self._duplicates[endpoint][key] += count
+                self._queries.setdefault(key, profile.samples[key])
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._duplicates.clear()
+            self._queries.clear()
+
+    def summary(self):
+        with self._lock:
+            samples = {endpoint: list(rows) for endpoint, rows in self._samples.items()}
+            duplicates = {endpoint: counts.most_common(TOP_DUPLICATES) for endpoint, counts in self._duplicates.items()}
+            queries = dict(self._queries)
+
+        endpoints = {}
+        for endpoint, rows in sorted(samples.items()):
+            total_ms, sql_ms, query_counts, serialize_ms, sizes = zip(*rows)
+            buckets = Counter(next((f'le_{bound}' for bound in DURATION_BUCKETS if ms <= bound), 'inf') for ms in total_ms)
+            endpoints[endpoint] = {
+                'requests': len(rows),
+                'total_ms': _distribution(total_ms),
+                'sql_ms': _distribution(sql_ms),
+                'queries': _distribution(query_counts),
+                'serialize_ms': _distribution([ms for ms in serialize_ms if ms is not None]),
+                'response_bytes': _distribution([size for size in sizes if size is not None]),
+                'duration_histogram': {
+                    label: buckets[label] for label in [*(f'le_{bound}' for bound in DURATION_BUCKETS), 'inf']
+                },
+                'repeated_queries': [
+                    {'fingerprint': key, 'count': count, 'sql': queries[key][:500]}
+                    for key, count in duplicates.get(endpoint, [])
+                ],
+            }
+        return {'window': self.window, 'endpoints': endpoints}
+
+
+def _distribution(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def percentile(p):
+        return round(values[min(len(values) - 1, int(len(values) * p))], 1)
+
+    return {'p50': percentile(0.5), 'p95': percentile(0.95), 'max': round(values[-1], 1)}
+
+
+metrics = EndpointMetrics(window=getattr(settings, 'METRICS_WINDOW', METRICS_WINDOW))
+
+
+def current_profile(request):
+    return getattr(request, 'profile', None)
+
+
+def _endpoint(request, profile):
+    if profile.endpoint:
+        return f'{request.method} {profile.endpoint}'
+    match = request.resolver_match
+    # Unresolved paths share one key so the metrics stay bounded
+    return f"{request.method} {match.view_name if match else 'unresolved'}"
+
+
+def _check_budget(endpoint, profile):
+    if profile.budget is None or profile.queries <= profile.budget:
+        return
+    message = (f'{endpoint} ran {profile.queries} queries, over its budget of {profile.budget}'
+               f' ({len(profile.duplicates())} repeated fingerprints)')
+    if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class QueryProfilingMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path.startswith(UNPROFILED_PREFIXES):
+            return self.get_response(request)
+
+        request.profile = profile = RequestProfile()
+        with connection.execute_wrapper(profile):
+            response = self.get_response(request)
+        total = time.perf_counter() - profile.started
+
+        size = None if response.streaming else len(response.content)
+        endpoint = _endpoint(request, profile)
+        response['Server-Timing'] = profile.server_timing(total)
+        metrics.record(endpoint, profile, total, size)
+        _check_budget(endpoint, profile)
+        return response
@@ -0,0 +1,260 @@
+"""
+QR code rendering helpers.
+
+These functions only deal with plain values (no models or database access)
+so they can run inside worker processes.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import qrcode
+
+# Bump when the rendered output changes so cached images and ETags roll over
+RENDER_VERSION = 2
+
+# Fixed QR mask for SVG output, so label sheets skip the search over all eight masks
+SVG_MASK_PATTERN = 0
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def build_qr_url(site_url, qr_code_uuid):
+    """Scan endpoint URL encoded into an asset's QR code"""
+    return f"{site_url}/api/asset-tags/scan/{qr_code_uuid}/"
+
+
+def _make_qr(qr_url, mask_pattern=None):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=10,
+        border=4,
+        mask_pattern=mask_pattern,
+    )
+    qr.add_data(qr_url)
+    qr.make(fit=True)
+    return qr
+
+
+def qr_runs(qr_url, mask_pattern=None):
+    """
+    Dark modules of the QR code for `qr_url` as `(size, runs)`, where each
+    run is an `(x, y, length)` horizontal stretch in a `size` x `size` grid
+    (quiet zone included).
+
+    Passing a fixed `mask_pattern` skips qrcode's search over all eight
+    masks, which is most of the encoding time; any mask scans the same.
+    """
+    matrix = _make_qr(qr_url, mask_pattern).get_matrix()
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        width = len(row)
+        while x < width:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < width and row[x]:
+                x += 1
+            runs.append((start, y, x - start))
+    return len(matrix), runs
+
+
+def render_qr_png(qr_url):
+    """Render the QR code for `qr_url` and return the PNG bytes"""
+    img = _make_qr(qr_url).make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def qr_svg_path(qr_url):
+    """
+    Return `(size, path)` for the QR code of `qr_url`, where `path` is SVG
+    path data drawing the dark modules in a `size` x `size` module grid.
+    Horizontal runs are merged into a single rectangle each.
+    """
+    size, runs = qr_runs(qr_url, SVG_MASK_PATTERN)
+    return size, ''.join(f"M{x} {y}h{run}v1h-{run}z" for x, y, run in runs)
+
+
+def render_qr_svg(qr_url):
+    """Render the QR code for `qr_url` and return the SVG document bytes"""
+    size, path = qr_svg_path(qr_url)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+        f'shape-rendering="crispEdges"><rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{path}"/></svg>'
+    ).encode()
+
+
+RENDERERS = {
+    'png': render_qr_png,
+    'svg': render_qr_svg,
+}
+
+
+def qr_etag(qr_url, fmt):
+    """Strong ETag for the rendered image; depends only on its inputs"""
+    digest = hashlib.sha256(f"{RENDER_VERSION}:{fmt}:{qr_url}".encode()).hexdigest()
+    return digest[:32]
+
+
+class LRUBytesCache:
+    """Thread-safe in-process LRU of rendered images bounded by total size"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._data[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+
+class DiskBytesCache:
+    """
+    Directory of rendered images shared between processes. When the
+    directory grows past `max_bytes` the least recently written files are
+    removed until it is back under 90% of the limit.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file first so readers never see a partial image
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(value)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._files())
+
+    def _evict(self):
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * 0.9
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._size = total
+
+
+class QRImageCache:
+    """In-process LRU in front of an optional shared disk cache"""
+
+    def __init__(self, memory_bytes, directory=None, disk_bytes=0):
+        self.memory = LRUBytesCache(memory_bytes)
+        self.disk = DiskBytesCache(directory, disk_bytes) if directory else None
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk:
+            self.disk.set(key, value)
+
+
+_image_cache = None
+
+
+def get_image_cache():
+    """Process-wide image cache configured from settings"""
+    global _image_cache
+    if _image_cache is None:
+        from django.conf import settings
+        _image_cache = QRImageCache(
+            memory_bytes=getattr(settings, 'QR_CACHE_MEMORY_BYTES', 32 * 1024 * 1024),
+            directory=getattr(settings, 'QR_CACHE_DIR', None),
+            disk_bytes=getattr(settings, 'QR_CACHE_DISK_BYTES', 512 * 1024 * 1024),
+        )
+    return _image_cache
+
+
+def cached_render(qr_url, fmt):
+    """Rendered image bytes for `qr_url`, going through the process-wide cache"""
+    cache = get_image_cache()
+    cache_key = f'{qr_etag(qr_url, fmt)}.{fmt}'
+    content = cache.get(cache_key)
+    if content is None:
+        content = RENDERERS[fmt](qr_url)
+        cache.set(cache_key, content)
+    return content
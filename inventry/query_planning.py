@@ -0,0 +1,200 @@
+"""
+Derive select_related / prefetch_related / only() from a serializer.
+
+`plan_queryset` walks the serializer's fields and follows each `source`
+through the model: forward foreign keys become select_related joins,
+reverse and many-to-many relations become prefetches (nested serializers
+are planned inside them), and plain columns are collected for only().
+only() is skipped when the serializer reads anything the walk cannot see
+(SerializerMethodField, model methods/properties as sources, str() of a
+related object) or when the queryset already joins relations itself.
+Relations that only method fields read can be listed in the serializer's
+`Meta.select_related`.
+
+QueryPlanningMixin applies the plan for list/retrieve. With DEBUG on, it
+also logs a warning when queries run while the response is serialized,
+which is where N+1 lazy loads show up. It also reports serialization time,
+the endpoint name and the view's `query_budget` to the request profile
+(see profiling.py).
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+from .profiling import current_profile
+
+logger = logging.getLogger(__name__)
+
+PLANNED_ACTIONS = ('list', 'retrieve')
+
+
+class QueryPlan:
+
+    def __init__(self):
+        self.select = set()
+        self.prefetch = {}
+        self.only = set()
+        self.exact = True
+
+    def apply(self, queryset, extra_only=()):
+        # Joins and prefetches the view set up itself are kept as they are, and
+        # may read columns we know nothing about
+        joined = bool(queryset.query.select_related)
+        if self.select:
+            queryset = queryset.select_related(*sorted(self.select))
+        prefetched = {getattr(lookup, 'prefetch_to', lookup) for lookup in queryset._prefetch_related_lookups}
+        for path, (model, plan) in sorted(self.prefetch.items()):
+            if path in prefetched:
+                continue
+            queryset = queryset.prefetch_related(Prefetch(path, queryset=plan.apply(model._default_manager.all())))
+        if self.exact and self.only and not joined:
+            queryset = queryset.only(*sorted(self.only | set(extra_only)))
+        return queryset
+
+
+def plan_queryset(queryset, serializer, extra_only=()):
+    """
+    `queryset` with the joins, prefetches and columns `serializer` needs.
+    `extra_only` names columns read outside the serializer (e.g. by pagination).
+    """
+    plan = QueryPlan()
+    _walk(serializer, queryset.model, '', plan)
+    return plan.apply(queryset, extra_only)
+
+
+def _walk(serializer, model, prefix, plan):
+    if not isinstance(serializer, serializers.ModelSerializer):
+        plan.exact = False
+        return
+    plan.only.add(prefix + model._meta.pk.name)
+    # Relations read by method fields, which the walk cannot see
+    plan.select.update(prefix + path for path in getattr(serializer.Meta, 'select_related', ()))
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+            plan.exact = False
+            continue
+        _follow(field, field.source_attrs, model, prefix, plan)
+
+
+def _follow(field, attrs, model, prefix, plan):
+    """Resolve one field's `source_attrs` through `model`, recording what it needs"""
+    for i, attr in enumerate(attrs):
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            # Method or property; it may read anything on the instance
+            plan.exact = False
+            return
+        path = prefix + attr
+        last = i == len(attrs) - 1
+
+        if not model_field.is_relation:
+            plan.only.add(path)
+            return
+
+        related_model = model_field.related_model
+        if model_field.many_to_many or model_field.one_to_many:
+            nested = QueryPlan()
+            if model_field.one_to_many:
+                # Prefetching matches children to parents on this column
+                nested.only.add(model_field.field.attname)
+            if isinstance(field, serializers.ListSerializer) and last:
+                _walk(field.child, related_model, '', nested)
+            elif not isinstance(field, serializers.ManyRelatedField) or not last:
+                _follow(field, attrs[i + 1:], related_model, '', nested)
+            plan.prefetch[path] = (related_model, nested)
+            return
+
+        # Forward foreign key / one-to-one (or reverse one-to-one)
+        if model_field.concrete:
+            plan.only.add(path)
+        if last:
+            if isinstance(field, serializers.PrimaryKeyRelatedField) or (
+                    isinstance(field, serializers.HyperlinkedRelatedField)):
+                # Only the key column is read
+                return
+            plan.select.add(path)
+            if isinstance(field, serializers.ModelSerializer):
+                _walk(field, related_model, path + '__', plan)
+            else:
+                # e.g. StringRelatedField: str() may read any column
+                plan.exact = False
+            return
+        plan.select.add(path)
+        model, prefix = related_model, path + '__'
+
+
+class QueryPlanningMixin:
+    """
+    Apply `plan_queryset` to list/retrieve querysets. Set
+    `query_planning = False` on a view to opt out.
+
+    `query_budget` caps the queries a request may run, either a number or
+    `{action: number}`; see profiling.QueryProfilingMiddleware.
+    """
+    query_planning = True
+    query_budget = None
+
+    def filter_queryset(self, queryset):
+        # Rather than get_queryset, which views often override without super()
+        queryset = super().filter_queryset(queryset)
+        if self.query_planning and getattr(self, 'action', None) in PLANNED_ACTIONS:
+            serializer = self.get_serializer_class()(context=self.get_serializer_context())
+            queryset = plan_queryset(queryset, serializer, self._ordering_fields(queryset))
+        return queryset
+
+    def _ordering_fields(self, queryset):
+        # Keyset pagination reads the ordering values of each page's edge rows
+        ordering = getattr(self, 'cursor_ordering', None) or queryset.model._meta.ordering or []
+        return [name.lstrip('-') for name in ordering if '__' not in name]
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if args and not hasattr(self, '_serialize_started'):
+            # Serializing an instance/page; .data is read before finalize_response
+            self._serialize_started = time.perf_counter()
+        if settings.DEBUG and args and getattr(self, 'action', None) in PLANNED_ACTIONS:
+            self._start_lazy_load_guard()
+        return serializer
+
+    def _start_lazy_load_guard(self):
+        if getattr(self, '_lazy_load_guard', None):
+            return
+        self._lazy_queries = []
+
+        def record(execute, sql, params, many, context):
+            self._lazy_queries.append(sql)
+            return execute(sql, params, many, context)
+
+        self._lazy_load_guard = connection.execute_wrapper(record)
+        self._lazy_load_guard.__enter__()
+
+    def get_query_budget(self):
+        if isinstance(self.query_budget, dict):
+            return self.query_budget.get(getattr(self, 'action', None))
+        return self.query_budget
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        profile = current_profile(request)
+        if profile is not None:
+            profile.endpoint = f"{type(self).__name__}.{getattr(self, 'action', None) or request.method.lower()}"
+            profile.budget = self.get_query_budget()
+            if hasattr(self, '_serialize_started'):
+                profile.serialize_time = time.perf_counter() - self._serialize_started
+        guard = getattr(self, '_lazy_load_guard', None)
+        if guard:
+            guard.__exit__(None, None, None)
+            self._lazy_load_guard = None
+            if self._lazy_queries:
+                logger.warning(
+                    '%d queries ran while serializing %s.%s; add them to the queryset plan. First: %s',
+                    len(self._lazy_queries), type(self).__name__, self.action, self._lazy_queries[0][:300]
+                )
+        return super().finalize_response(request, response, *args, **kwargs)
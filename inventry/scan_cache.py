@@ -0,0 +1,145 @@
+"""
+Read-through cache for QR scan results (`AssetTag.get_full_details()`).
+
+Two tiers: an in-process LRU and, when SCAN_CACHE_ALIAS names a Django
+cache, a shared backend. Entries are tagged with a global generation and a
+per-asset version kept in the shared backend, so invalidations made by any
+process are seen by every local LRU. Without a shared backend the cache
+is process-local and the versions are kept in this process.
+
+Invalidation happens right away and again when the surrounding
+transaction commits, so a scan that read the old rows before the commit
+cannot keep them cached.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+GENERATION_KEY = 'inventry:scan:generation'
+
+
+def _version_key(qr_uuid):
+    return f'inventry:scan:version:{qr_uuid}'
+
+
+def _data_key(qr_uuid, token):
+    generation, version = token
+    return f'inventry:scan:data:{generation}:{version}:{qr_uuid}'
+
+
+class ScanCache:
+
+    def __init__(self, max_entries=10000, alias=None, timeout=3600):
+        self.max_entries = max_entries
+        self.alias = alias
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local_generation = 0
+        self._local_versions = {}
+        self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    @property
+    def backend(self):
+        return caches[self.alias] if self.alias else None
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _token(self, qr_uuid):
+        """Current (generation, version) an entry for `qr_uuid` must carry to be valid"""
+        if self.backend is None:
+            with self._lock:
+                return self._local_generation, self._local_versions.get(qr_uuid)
+        values = self.backend.get_many([GENERATION_KEY, _version_key(qr_uuid)])
+        return values.get(GENERATION_KEY, 0), values.get(_version_key(qr_uuid))
+
+    def get(self, qr_uuid):
+        """
+        Return `(data, token)`. `data` is None on a miss; pass `token` to
+        `set` so a result read while an invalidation happened is not served.
+        """
+        token = self._token(qr_uuid)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(qr_uuid)
+            if entry and entry[0] == token and entry[1] > now:
+                self._entries.move_to_end(qr_uuid)
+                self.stats['local_hits'] += 1
+                return entry[2], token
+
+        if self.backend is not None:
+            data = self.backend.get(_data_key(qr_uuid, token))
+            if data is not None:
+                self._store_local(qr_uuid, token, data)
+                self._count('shared_hits')
+                return data, token
+
+        self._count('misses')
+        return None, token
+
+    def set(self, qr_uuid, data, token):
+        self._store_local(qr_uuid, token, data)
+        if self.backend is not None:
+            self.backend.set(_data_key(qr_uuid, token), data, self.timeout)
+
+    def _store_local(self, qr_uuid, token, data):
+        with self._lock:
+            self._entries[qr_uuid] = (token, time.monotonic() + self.timeout, data)
+            self._entries.move_to_end(qr_uuid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, qr_uuid):
+        """Drop the cached result for one asset, now and when the transaction commits"""
+        self._count('invalidations')
+        self._invalidate(qr_uuid)
+        transaction.on_commit(lambda: self._invalidate(qr_uuid))
+
+    def _invalidate(self, qr_uuid):
+        # A new version, so results read before this point are not stored as valid
+        version = uuid.uuid4().hex
+        with self._lock:
+            self._entries.pop(qr_uuid, None)
+            if self.backend is None:
+                self._local_versions[qr_uuid] = version
+        if self.backend is not None:
+            self.backend.set(_version_key(qr_uuid), version, None)
+
+    def invalidate_all(self):
+        """Drop every cached result, e.g. when a shared batch or store changes"""
+        self._count('invalidations')
+        self._invalidate_all()
+        transaction.on_commit(self._invalidate_all)
+
+    def _invalidate_all(self):
+        with self._lock:
+            self._entries.clear()
+            # The generation change outdates every per-asset version too
+            self._local_versions.clear()
+            self._local_generation += 1
+        if self.backend is not None:
+            self.backend.set(GENERATION_KEY, uuid.uuid4().hex, None)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['local_entries'] = len(self._entries)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['local_hits'] + stats['shared_hits']) / lookups, 4) if lookups else None
+        stats['shared_backend'] = self.alias
+        return stats
+
+
+scan_cache = ScanCache(
+    max_entries=getattr(settings, 'SCAN_CACHE_MAX_ENTRIES', 10000),
+    alias=getattr(settings, 'SCAN_CACHE_ALIAS', None),
+    timeout=getattr(settings, 'SCAN_CACHE_TIMEOUT', 3600),
+)
@@ -0,0 +1,196 @@
+"""
+Asset tag and item search.
+
+Tag numbers are indexed as trigrams in AssetSearchToken, so a substring
+query starts from the assets holding the query's rarest trigram instead of
+a leading-wildcard LIKE over every tag, and candidates are confirmed
+against the normalized tag number. Only MAX_PROBED_TOKENS trigrams are
+counted, so a long query runs as many queries as a short one. When every trigram of the query is
+common (e.g. 'chr001' on a store full of chairs) matches are dense and a
+plain scan in index order finds a page of them quickly, so the token table
+is skipped. Item names and codes live in a small table and are matched
+directly, then expanded to their assets. Queries shorter than a trigram
+keep substring semantics through a plain scan, which stops once a page
+(or `limit`) of matches is found.
+
+Ranking: exact tag (100), tag prefix (80), tag substring (60); when no tag
+contains the query, tags sharing most of its trigrams, i.e. near misses and
+typos (up to 50); then assets of matching items (30 for a name/code prefix,
+20 otherwise).
+"""
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Lower, Replace
+
+from .helper_functions import normalize_search_text, search_trigrams
+from .models import AssetSearchToken, AssetTag, Batch, Item
+
+SEARCH_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+ITEM_LIMIT = 10
+
+# Trigrams held by at least this many assets are too common to narrow a search
+COMMON_TOKEN_POSTINGS = 2000
+
+# Trigrams of a query whose postings are counted (one query each); matches
+# are confirmed against the whole normalized tag, so the rest are not needed
+MAX_PROBED_TOKENS = 6
+
+# Share of the query's trigrams a tag needs to be returned as a near miss
+FUZZY_THRESHOLD = 0.6
+
+
+def _with_normalized_tag(queryset):
+    # Tag numbers only use letters, digits and '-'
+    return queryset.annotate(normalized_tag=Replace(Lower('tag_number'), Value('-'), Value('')))
+
+
+def _probe_tokens(normalized):
+    """Up to MAX_PROBED_TOKENS distinct trigrams of `normalized`, spread over its length"""
+    tokens = list(dict.fromkeys(normalized[i:i + 3] for i in range(len(normalized) - 2)))
+    if len(tokens) <= MAX_PROBED_TOKENS:
+        return tokens
+    step = (len(tokens) - 1) / (MAX_PROBED_TOKENS - 1)
+    return [tokens[round(i * step)] for i in range(MAX_PROBED_TOKENS)]
+
+
+def _postings(normalized):
+    """Number of assets holding each probed trigram, counted up to COMMON_TOKEN_POSTINGS"""
+    return {
+        token: AssetSearchToken.objects.filter(token=token)[:COMMON_TOKEN_POSTINGS].count()
+        for token in _probe_tokens(normalized)
+    }
+
+
+def _rare_tokens(postings):
+    return sorted((token for token, count in postings.items() if count < COMMON_TOKEN_POSTINGS), key=postings.get)
+
+
+def _tag_matches(queryset, normalized, postings):
+    """`queryset` narrowed to tag numbers containing `normalized`"""
+    queryset = _with_normalized_tag(queryset).filter(normalized_tag__contains=normalized)
+    rare = _rare_tokens(postings)
+    if rare:
+        queryset = queryset.filter(pk__in=AssetSearchToken.objects.filter(token=rare[0]).values('asset'))
+    return queryset
+
+
+def matching_items(query):
+    return Item.objects.filter(Q(name__icontains=query) | Q(code__icontains=query))
+
+
+def search_filter(queryset, query):
+    """`queryset` narrowed to assets whose tag number, item name or item code contains `query`"""
+    normalized = normalize_search_text(query)
+    # Batch ids rather than a join, so the database can OR two indexes on the asset table
+    item_match = Q(batch_id__in=list(Batch.objects.filter(item__in=matching_items(query)).values_list('pk', flat=True)))
+    if not normalized:
+        return queryset.filter(item_match)
+
+    if len(normalized) >= 3:
+        postings = _postings(normalized)
+        if any(count == 0 for count in postings.values()):
+            return queryset.filter(item_match)
+        rare = _rare_tokens(postings)
+        if rare:
+            # Few enough to list, which keeps the OR index-friendly
+            tag_ids = list(_tag_matches(AssetTag.objects.order_by(), normalized, postings).values_list('pk', flat=True))
+            return queryset.filter(Q(pk__in=tag_ids) | item_match)
+    # Too short for trigrams, or every trigram is common: scanned until a page is found
+    return _with_normalized_tag(queryset).filter(Q(normalized_tag__contains=normalized) | item_match)
+
+
+def search_assets(query, limit=SEARCH_LIMIT):
+    """
+    Ranked search over tag numbers and item names/codes. Returns
+    `(assets, items)`: up to `limit` assets with `score` and `match`
+    attributes, best first, and the matching items.
+    """
+    normalized = normalize_search_text(query)
+    scored = {}
+
+    def add(rows, match, score):
+        for asset_id, row_score in rows:
+            if len(scored) >= limit:
+                return
+            scored.setdefault(asset_id, (score(row_score), match))
+
+    if len(normalized) >= 3:
+        tokens = search_trigrams(normalized)
+        postings = _postings(normalized)
+        rare = _rare_tokens(postings)
+
+        if all(postings.values()):
+            tags = _tag_matches(AssetTag.objects.all(), normalized, postings).annotate(
+                rank=Case(
+                    When(normalized_tag=normalized, then=Value(100)),
+                    When(normalized_tag__startswith=normalized, then=Value(80)),
+                    default=Value(60),
+                    output_field=IntegerField(),
+                )
+            )
+            # Dense matches are taken in tag order rather than ranking all of them
+            tags = tags.order_by('-rank', 'tag_number') if rare else tags.order_by('tag_number')
+            add(tags.values_list('pk', 'rank')[:limit], 'tag', lambda rank: rank)
+
+        if not scored and rare and len(tokens) > 1:
+            # Candidates share a rare trigram, so there are at most a few thousand to compare
+            candidates = AssetTag.objects.filter(
+                pk__in=AssetSearchToken.objects.filter(token__in=rare).values('asset')
+            ).values_list('pk', 'tag_number')
+            near = []
+            for asset_id, tag_number in candidates.iterator(chunk_size=2000):
+                tag_tokens = search_trigrams(tag_number)
+                shared = len(tokens & tag_tokens)
+                if shared >= len(tokens) * FUZZY_THRESHOLD:
+                    near.append((shared / len(tokens | tag_tokens), tag_number, asset_id))
+            near.sort(key=lambda row: (-row[0], row[1]))
+            add([(asset_id, similarity) for similarity, _, asset_id in near[:limit]],
+                'tag_similar', lambda similarity: round(50 * similarity))
+    elif normalized:
+        # Too short for trigrams: prefixes first, then other substrings, each scan stopping at `limit`
+        tags = _with_normalized_tag(AssetTag.objects.all()).order_by('tag_number')
+        prefix = tags.filter(normalized_tag__startswith=normalized)
+        add(prefix.values_list('pk', Value(80))[:limit], 'tag', lambda rank: rank)
+        if len(scored) < limit:
+            inner = tags.filter(normalized_tag__contains=normalized).exclude(normalized_tag__startswith=normalized)
+            add(inner.values_list('pk', Value(60))[:limit - len(scored)], 'tag', lambda rank: rank)
+
+    items = list(matching_items(query).order_by('name')[:ITEM_LIMIT]) if normalized else []
+    if items and len(scored) < limit:
+        prefix_items = {
+            item.pk for item in items
+            if item.name.lower().startswith(query.lower()) or item.code.lower().startswith(query.lower())
+        }
+        by_item = AssetTag.objects.filter(batch__item__in=items).exclude(pk__in=list(scored)).annotate(
+            rank=Case(
+                When(batch__item__in=prefix_items, then=Value(30)),
+                default=Value(20),
+                output_field=IntegerField(),
+            )
+        ).order_by('-rank', 'tag_number').values_list('pk', 'rank')[:limit - len(scored)]
+        add(by_item, 'item', lambda rank: rank)
+
+    assets = AssetTag.objects.select_related(
+        'batch__item', 'current_store', 'current_location'
+    ).in_bulk(list(scored))
+    results = []
+    for asset_id, (score, match) in scored.items():
+        asset = assets[asset_id]
+        asset.score, asset.match = score, match
+        results.append(asset)
+    results.sort(key=lambda asset: (-asset.score, asset.tag_number))
+    return results, items
+
+
+def rebuild_index(chunk_size=2000):
+    """Rebuild every asset's search tokens; returns the number of assets indexed"""
+    AssetSearchToken.objects.all().delete()
+    count, chunk = 0, []
+    for asset in AssetTag.objects.order_by().only('id', 'tag_number').iterator(chunk_size=chunk_size):
+        chunk.append(asset)
+        if len(chunk) >= chunk_size:
+            AssetSearchToken.index(chunk, replace=False)
+            count += len(chunk)
+            chunk = []
+    AssetSearchToken.index(chunk, replace=False)
+    return count + len(chunk)
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from django.urls import reverse
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Value
 from .models import *
 
 class DepartmentSerializer(serializers.ModelSerializer):
@@ -38,12 +40,20 @@ class InspectionCertificateSerializer(serializers.ModelSerializer):
         ]
 
     def get_item_count(self, obj):
+        # InspectionCertificateViewSet annotates num_items; saved instances don't have it
+        if hasattr(obj, 'num_items'):
+            return obj.num_items
         return InspectionItem.objects.filter(inspection=obj).count()
     
     def get_items_link(self, obj):
-        request = self.context['request']
-        url = reverse('certificate-items-list', kwargs={'certificate_pk': obj.id})
-        return request.build_absolute_uri(url)
+        # Reverse and absolutize once, then fill in each certificate id
+        if not hasattr(self, '_items_link_parts'):
+            marker = 'certificate_pk'
+            url = reverse('certificate-items-list', kwargs={'certificate_pk': marker})
+            url = self.context['request'].build_absolute_uri(url)
+            self._items_link_parts = url.split(marker, 1)
+        prefix, suffix = self._items_link_parts
+        return f'{prefix}{obj.id}{suffix}'
 
 
 class UpdateInspectionCertificateSerializer(serializers.ModelSerializer):
@@ -98,6 +108,21 @@ class BatchSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['total_quantity', 'current_quantity']
 
+def stock_register_indexes(register_ids):
+    """
+    Distinct items entered in each register, `{register_id: [{'code', 'name'}]}`,
+    in one grouped query. Views put this in the serializer context as
+    'register_indexes' so StockRegisterSerializer does not query per register.
+    """
+    indexes = {register_id: [] for register_id in register_ids}
+    rows = StockEntry.objects.filter(stock_register__in=indexes).values_list(
+        'stock_register', 'item__code', 'item__name'
+    ).distinct().order_by('stock_register', 'item__code')
+    for register_id, code, name in rows:
+        indexes[register_id].append({'code': code, 'name': name})
+    return indexes
+
+
 class StockRegisterSerializer(serializers.ModelSerializer):
     indexes = serializers.SerializerMethodField(method_name='get_indexes')
     class Meta:
@@ -108,34 +133,24 @@ class StockRegisterSerializer(serializers.ModelSerializer):
         ]
     
     def get_indexes(self, obj):
-        item_qs = StockEntry.objects.select_related('item').filter(
-            stock_register=obj
-        ).values('item__code', 'item__name').distinct()
-
-        summary = []
-
-        for item in item_qs:
-            summary.append({
-                'code': item['item__code'],
-                'name': item['item__name']
-            })
+        register_indexes = self.context.get('register_indexes')
+        if register_indexes is None or obj.id not in register_indexes:
+            register_indexes = stock_register_indexes([obj.id])
         
         entry_link = None
-        if self.context['request']:
-            entry_link = self.context['request'].build_absolute_uri(
-                reverse('stockentry-list') + f'?stock_register={obj.id}'
-            )
+        request = self.context.get('request')
+        if request:
+            # Resolved once per response rather than once per register
+            if 'stock_entries_url' not in self.context:
+                self.context['stock_entries_url'] = request.build_absolute_uri(reverse('stockentry-list'))
+            entry_link = self.context['stock_entries_url'] + f'?stock_register={obj.id}'
 
         return {
-            'indexes': summary,
+            'indexes': register_indexes[obj.id],
             'view_all_entries': entry_link
         }
 
 
-
-    
-        
-
 class StoreSerializer(serializers.ModelSerializer):
     class Meta:
         model = Store
@@ -164,13 +179,31 @@ class StoreInventrySerializer(serializers.ModelSerializer):
     class Meta:
         model = StoreInventory
         fields = ['id', 'batch', 'quantity_on_hand', 'quantity_allocated', 'quantity_qr_tagged']
+        # Changed through the receive/issue/allocate/generate_tags actions (inventry.services)
+        read_only_fields = ['quantity_on_hand', 'quantity_allocated', 'quantity_qr_tagged']
     
     def create(self, validated_data):
         validated_data['store_id'] = self.context['store_id']
         return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        # Save only what changed; a full save would write back stale quantities
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=[*validated_data, 'last_updated'])
+        return instance
+
+
+class AllocateInventorySerializer(serializers.Serializer):
+    quantity = serializers.IntegerField(help_text='Items to reserve; negative to release')
+
+    def validate_quantity(self, value):
+        if value == 0:
+            raise serializers.ValidationError('Quantity must not be 0')
+        return value
     
 class StockEnteySerializer(serializers.ModelSerializer):
-    balance = serializers.IntegerField(help_text='balance after this stockentry')
+    balance = serializers.IntegerField(read_only=True, help_text='balance after this stockentry, computed by the server')
     class Meta:
         model = StockEntry
         fields = [
@@ -180,6 +213,35 @@ class StockEnteySerializer(serializers.ModelSerializer):
             'created_by', 'balance'
         ]
 
+    def validate(self, attrs):
+        if self.instance:
+            changed = [
+                field for field in StockEntry.LEDGER_FIELDS
+                if field in attrs and attrs[field] != getattr(self.instance, field)
+            ]
+            if changed:
+                raise serializers.ValidationError(
+                    {field: 'Posted entries cannot be changed; post a correcting entry' for field in changed}
+                )
+        return attrs
+
+    def create(self, validated_data):
+        try:
+            return super().create(validated_data)
+        except DjangoValidationError as error:
+            # e.g. an issue larger than the balance, found once the balance row is locked
+            raise serializers.ValidationError(serializers.as_serializer_error(error))
+
+
+class StockBalanceSerializer(serializers.ModelSerializer):
+    item_code = serializers.CharField(source='item.code', read_only=True)
+    item_name = serializers.CharField(source='item.name', read_only=True)
+
+    class Meta:
+        model = StockBalance
+        fields = ['item', 'item_code', 'item_name', 'quantity', 'last_entry', 'updated_at']
+        read_only_fields = fields
+
 class AssetTagListSerializer(serializers.ModelSerializer):
     """Serializer for list view"""
     item_name = serializers.CharField(source='batch.item.name', read_only=True)
@@ -202,12 +264,10 @@ class AssetTagListSerializer(serializers.ModelSerializer):
         ]
     
     def get_qr_image_url(self, obj):
-        if obj.qr_code_image:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.qr_code_image.url)
-            return obj.qr_code_image.url
-        return None
+        request = self.context.get('request')
+        if request:
+            return request.build_absolute_uri(obj.qr_image_path())
+        return obj.qr_image_path()
 
 
 
@@ -226,17 +286,17 @@ class AssetTagDetailSerializer(serializers.ModelSerializer):
             'full_details'
         ]
         read_only_fields = ['tag_number', 'qr_code_uuid', 'tagged_date', 'created_at', 'updated_at']
+        # Read by get_full_details
+        select_related = ['batch__item__category', 'batch__inspection_item__inspection']
     
     def get_full_details(self, obj):
         return obj.get_full_details()
     
     def get_qr_image_url(self, obj):
-        if obj.qr_code_image:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.qr_code_image.url)
-            return obj.qr_code_image.url
-        return None
+        request = self.context.get('request')
+        if request:
+            return request.build_absolute_uri(obj.qr_image_path())
+        return obj.qr_image_path()
 
 
 class AssetTagCreateSerializer(serializers.ModelSerializer):
@@ -270,3 +330,109 @@ class GenerateQRTagsSerializer(serializers.Serializer):
     )
 
 
+class InventoryMovementSerializer(serializers.Serializer):
+    """Receipt into / issue from a store inventory, posted in one of the store's registers"""
+    quantity = serializers.IntegerField(min_value=1)
+    stock_register = serializers.PrimaryKeyRelatedField(queryset=StockRegister.objects.all())
+    from_inspection = serializers.PrimaryKeyRelatedField(
+        queryset=InspectionCertificate.objects.all(), required=False, help_text='Receipts only'
+    )
+    to_location = serializers.PrimaryKeyRelatedField(
+        queryset=Location.objects.all(), required=False, help_text='Issues only'
+    )
+
+    def validate_stock_register(self, value):
+        if str(value.store_id) != str(self.context['store_id']):
+            raise serializers.ValidationError('Register does not belong to this store')
+        return value
+
+
+class ReconcileScanSerializer(serializers.Serializer):
+    uuids = serializers.ListField(
+        child=serializers.CharField(),
+        allow_empty=False,
+        max_length=20000,
+        help_text='QR UUIDs scanned during the audit'
+    )
+    location_id = serializers.IntegerField(
+        required=False,
+        help_text='Location the scanned assets are expected to be in'
+    )
+    store_id = serializers.IntegerField(
+        required=False,
+        help_text='Store the scanned assets are expected to belong to'
+    )
+
+    def validate_location_id(self, value):
+        if not Location.objects.filter(pk=value).exists():
+            raise serializers.ValidationError('Location does not exist')
+        return value
+
+    def validate_store_id(self, value):
+        if not Store.objects.filter(pk=value).exists():
+            raise serializers.ValidationError('Store does not exist')
+        return value
+
+
+class BulkAssetStatusSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+        max_length=5000,
+        help_text='Asset tag ids to update'
+    )
+    uuids = serializers.ListField(
+        child=serializers.CharField(),
+        required=False,
+        max_length=5000,
+        help_text='QR UUIDs of the asset tags to update'
+    )
+    status = serializers.ChoiceField(choices=AssetTag.STATUS_CHOICES, required=False)
+    assigned_to = serializers.CharField(required=False, allow_blank=True, max_length=255)
+    location_id = serializers.IntegerField(required=False)
+    store_id = serializers.IntegerField(required=False)
+    remarks = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, data):
+        if not data.get('ids') and not data.get('uuids'):
+            raise serializers.ValidationError('Provide ids or uuids')
+        if not any(data.get(field) for field in ('status', 'assigned_to', 'location_id', 'store_id', 'remarks')):
+            raise serializers.ValidationError('No changes provided')
+
+        # Check both referenced rows with a single query
+        location_id, store_id = data.get('location_id'), data.get('store_id')
+        lookups = []
+        if location_id:
+            lookups.append(Location.objects.filter(pk=location_id).annotate(kind=Value('location')).values_list('kind', flat=True))
+        if store_id:
+            lookups.append(Store.objects.filter(pk=store_id).annotate(kind=Value('store')).values_list('kind', flat=True))
+        if lookups:
+            found = set(lookups[0].union(*lookups[1:]))
+            errors = {}
+            if location_id and 'location' not in found:
+                errors['location_id'] = 'Location does not exist'
+            if store_id and 'store' not in found:
+                errors['store_id'] = 'Store does not exist'
+            if errors:
+                raise serializers.ValidationError(errors)
+        return data
+
+
+class AssetMovementSerializer(serializers.ModelSerializer):
+    from_location_name = serializers.CharField(source='from_location.name', read_only=True, default=None)
+    to_location_name = serializers.CharField(source='to_location.name', read_only=True, default=None)
+    from_store_code = serializers.CharField(source='from_store.code', read_only=True, default=None)
+    to_store_code = serializers.CharField(source='to_store.code', read_only=True, default=None)
+    created_by_username = serializers.CharField(source='created_by.username', read_only=True, default=None)
+
+    class Meta:
+        model = AssetMovement
+        fields = [
+            'id', 'asset', 'created_at',
+            'from_status', 'to_status',
+            'from_location', 'from_location_name', 'to_location', 'to_location_name',
+            'from_store', 'from_store_code', 'to_store', 'to_store_code',
+            'from_assigned_to', 'to_assigned_to',
+            'remarks', 'created_by', 'created_by_username'
+        ]
+        read_only_fields = fields
@@ -0,0 +1,117 @@
+"""
+Store inventory mutations.
+
+Every change to StoreInventory quantities goes through here as a single
+conditional UPDATE (`SET col = col + n WHERE <still allowed>`), so
+concurrent tagging, receipts and issues never overwrite each other and a
+change that is no longer allowed updates nothing and raises
+InsufficientStock. Receipts and issues post their StockEntry in the same
+transaction, so the register's ledger and balance move with the store.
+The database enforces quantity_qr_tagged <= quantity_on_hand as well.
+"""
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import StockEntry, StoreInventory
+
+QUANTITY_FIELDS = ['quantity_on_hand', 'quantity_allocated', 'quantity_qr_tagged']
+
+
+class InsufficientStock(Exception):
+
+    def __init__(self, message, inventory):
+        super().__init__(message)
+        self.inventory = inventory
+
+    @property
+    def details(self):
+        inventory = self.inventory
+        return {
+            'quantity_on_hand': inventory.quantity_on_hand,
+            'already_tagged': inventory.quantity_qr_tagged,
+            'available': inventory.quantity_on_hand - inventory.quantity_qr_tagged,
+        }
+
+
+def _update(inventory, deltas, condition=Q(), message='Inventory changed; {available} untagged items available'):
+    """
+    Add `deltas` to `inventory`'s columns where `condition` still holds,
+    then reload its quantities; raises InsufficientStock(`message`) if it did not.
+    `message` can use {available}, {allocated} and {on_hand} as they are now.
+    """
+    updated = StoreInventory.objects.filter(condition, pk=inventory.pk).update(
+        last_updated=timezone.now(),
+        **{field: F(field) + delta for field, delta in deltas.items()},
+    )
+    try:
+        inventory.refresh_from_db(fields=QUANTITY_FIELDS)
+    except StoreInventory.DoesNotExist:
+        raise InsufficientStock('Inventory no longer exists', inventory)
+    if not updated:
+        raise InsufficientStock(message.format(
+            available=inventory.quantity_on_hand - inventory.quantity_qr_tagged,
+            allocated=inventory.quantity_allocated,
+            on_hand=inventory.quantity_on_hand,
+        ), inventory)
+    return inventory
+
+
+def tag(inventory, quantity):
+    """Count `quantity` more items of `inventory` as QR tagged"""
+    return _update(
+        inventory,
+        {'quantity_qr_tagged': quantity},
+        # Added rather than subtracted: the columns are unsigned on MySQL
+        Q(quantity_on_hand__gte=F('quantity_qr_tagged') + quantity),
+        'Only {available} untagged items available',
+    )
+
+
+def allocate(inventory, quantity):
+    """
+    Reserve `quantity` more items of `inventory`, or release them when
+    negative; the allocation stays between 0 and the quantity on hand
+    """
+    if quantity >= 0:
+        condition = Q(quantity_on_hand__gte=F('quantity_allocated') + quantity)
+    else:
+        condition = Q(quantity_allocated__gte=-quantity)
+    return _update(
+        inventory, {'quantity_allocated': quantity}, condition,
+        f'Cannot allocate {quantity}; ' + '{allocated} of {on_hand} items are allocated',
+    )
+
+
+def receive(inventory, quantity, stock_register, created_by=None, **entry_fields):
+    """Add `quantity` to `inventory` and post the receipt in `stock_register`; returns the entry"""
+    with transaction.atomic():
+        _update(inventory, {'quantity_on_hand': quantity})
+        entry = StockEntry(
+            entry_type='RECEIPT', item=inventory.batch.item, quantity=quantity,
+            to_store=inventory.store, stock_register=stock_register, created_by=created_by,
+            **entry_fields
+        )
+        entry.save()
+    return entry
+
+
+def issue(inventory, quantity, stock_register, created_by=None, **entry_fields):
+    """
+    Take `quantity` untagged items out of `inventory` and post the issue
+    in `stock_register`; returns the entry
+    """
+    with transaction.atomic():
+        _update(
+            inventory,
+            {'quantity_on_hand': -quantity},
+            Q(quantity_on_hand__gte=F('quantity_qr_tagged') + quantity),
+            'Only {available} untagged items available',
+        )
+        entry = StockEntry(
+            entry_type='ISSUE', item=inventory.batch.item, quantity=quantity,
+            from_store=inventory.store, stock_register=stock_register, created_by=created_by,
+            **entry_fields
+        )
+        entry.save()
+    return entry
@@ -0,0 +1,43 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import AssetSearchToken, AssetTag, Batch, Department, InspectionCertificate, Item, ItemCategory, Location, Store
+from .autocomplete import tag_index
+from .scan_cache import scan_cache
+
+
+@receiver([post_save, post_delete], sender=AssetTag)
+def invalidate_scanned_asset(sender, instance, **kwargs):
+    scan_cache.invalidate(str(instance.qr_code_uuid))
+
+
+@receiver(post_save, sender=AssetTag)
+def index_asset_for_search(sender, instance, created, **kwargs):
+    # Tag numbers never change once assigned
+    if created:
+        AssetSearchToken.index([instance], replace=False)
+
+
+@receiver(post_save, sender=AssetTag)
+def add_asset_to_autocomplete(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: tag_index.add(instance.tag_number, instance.pk))
+
+
+@receiver(post_delete, sender=AssetTag)
+def remove_asset_from_autocomplete(sender, instance, **kwargs):
+    transaction.on_commit(lambda: tag_index.remove(instance.tag_number))
+
+
+# Scan results embed details of these models, shared by many assets
+SCAN_DETAIL_MODELS = [Batch, Item, ItemCategory, Store, Location, InspectionCertificate, Department]
+
+
+def invalidate_all_scans(sender, **kwargs):
+    scan_cache.invalidate_all()
+
+
+for model in SCAN_DETAIL_MODELS:
+    post_save.connect(invalidate_all_scans, sender=model, dispatch_uid=f'scan-cache-{model.__name__}-save')
+    post_delete.connect(invalidate_all_scans, sender=model, dispatch_uid=f'scan-cache-{model.__name__}-delete')
@@ -0,0 +1,237 @@
+"""
+Offline audit snapshots of asset tags for scanner devices.
+
+A snapshot is a little-endian columnar file meant to be memory-mapped:
+
+    header      magic b'AMSSNAP\\0', format version (u16), flags (u16),
+                row count (u32), generated_at and since (i64 unix
+                microseconds, since is 0 for a full snapshot),
+                section count (u32)
+    directory   per section: name (4 ascii bytes), offset (u64), length (u64)
+    sections    8-byte aligned
+
+Rows are sorted by UUID so a device can binary search the `UUID` column.
+
+    UUID    16 bytes per row
+    STAT    u8 per row, index into STTB
+    STOR    u32 per row, index into SRTB
+    LOCN    u32 per row, index into LCTB (0xFFFFFFFF when unassigned)
+    ITEM    u32 per row, index into ITTB
+    UPDT    i64 per row, updated_at in unix microseconds
+    GONE    u8 per row, 1 when the asset left the snapshot's store or
+            department since `since` (deltas only, see below)
+    TAGS    string column of tag numbers
+    STTB, SRTB, LCTB, ITTB
+            string tables: status codes, store codes, location names, item names
+
+String columns/tables are a u32 count, u32 offsets (count + 1) and the
+UTF-8 blob. A delta snapshot (flag bit 0) only holds rows updated since
+`since`; devices upsert those rows by UUID. It also holds the assets that
+moved out of the store/department since then, found through their
+AssetMovement rows, with their current values and GONE set; devices drop
+them from the audit scope (or keep them as relocated). Deleted asset tags
+take their movements with them, so deltas cannot report them; a device
+only loses them on its next full snapshot.
+"""
+import gzip
+import struct
+from array import array
+from datetime import timezone as dt_timezone
+
+from django.db.models import BooleanField, Case, Q, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import AssetMovement, AssetTag
+
+MAGIC = b'AMSSNAP\0'
+FORMAT_VERSION = 2
+FLAG_DELTA = 1
+NO_LOCATION = 0xFFFFFFFF
+
+HEADER = struct.Struct('<8sHHIqqI')
+DIRECTORY_ENTRY = struct.Struct('<4sQQ')
+
+
+def _micros(value):
+    return int(value.timestamp() * 1_000_000) if value else 0
+
+
+def _string_column(values):
+    offsets = array('I', [0])
+    blob = bytearray()
+    for value in values:
+        blob += value.encode()
+        offsets.append(len(blob))
+    return struct.pack('<I', len(values)) + _le(offsets) + bytes(blob)
+
+
+def _le(values):
+    if struct.pack('=H', 1) != struct.pack('<H', 1):
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class _Interner:
+    """Maps repeated strings to table indexes"""
+
+    def __init__(self):
+        self.index = {}
+        self.values = []
+
+    def __call__(self, value):
+        if value not in self.index:
+            self.index[value] = len(self.values)
+            self.values.append(value)
+        return self.index[value]
+
+
+def parse_since(value):
+    """Parse an ISO timestamp for delta exports; naive values are taken as UTC"""
+    if not value:
+        return None
+    since = parse_datetime(value)
+    if since is None:
+        raise ValueError(f'Invalid timestamp: {value}')
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, dt_timezone.utc)
+    return since
+
+
+def snapshot_queryset(store_id=None, department_id=None, since=None):
+    """
+    Assets of a store and/or department, annotated with `left_scope`. With
+    `since`, the ones updated since then plus the ones moved out since then.
+    """
+    in_scope, moved_from = Q(), Q()
+    if store_id:
+        in_scope &= Q(current_store_id=store_id)
+        moved_from &= Q(from_store_id=store_id)
+    if department_id:
+        in_scope &= Q(current_store__department_id=department_id)
+        moved_from &= Q(from_store__department_id=department_id)
+
+    if not since:
+        return AssetTag.objects.filter(in_scope).annotate(left_scope=Value(False)).order_by('qr_code_uuid')
+    if not in_scope:
+        # Unscoped: nothing can move out
+        return AssetTag.objects.filter(updated_at__gte=since).annotate(left_scope=Value(False)).order_by('qr_code_uuid')
+
+    moved_out = AssetMovement.objects.filter(moved_from, created_at__gte=since).values('asset_id')
+    assets = AssetTag.objects.filter(Q(in_scope, updated_at__gte=since) | Q(pk__in=moved_out))
+    return assets.annotate(
+        left_scope=Case(When(in_scope, then=Value(False)), default=Value(True), output_field=BooleanField())
+    ).order_by('qr_code_uuid')
+
+
+def build_snapshot(assets, since=None, generated_at=None, compress=True):
+    """Encode `assets` (see `snapshot_queryset`) and return the snapshot bytes"""
+    generated_at = generated_at or timezone.now()
+
+    uuids = bytearray()
+    statuses, stores, locations, items = _Interner(), _Interner(), _Interner(), _Interner()
+    status_col, store_col = array('B'), array('I')
+    location_col, item_col = array('I'), array('I')
+    updated_col, gone_col = array('q'), array('B')
+    tag_numbers = []
+
+    rows = assets.values_list(
+        'qr_code_uuid', 'tag_number', 'status', 'current_store__code',
+        'current_location__name', 'batch__item__name', 'updated_at', 'left_scope'
+    ).iterator(chunk_size=2000)
+
+    for qr_uuid, tag_number, status, store_code, location_name, item_name, updated_at, left_scope in rows:
+        uuids += qr_uuid.bytes
+        tag_numbers.append(tag_number)
+        status_col.append(statuses(status))
+        store_col.append(stores(store_code))
+        location_col.append(locations(location_name) if location_name is not None else NO_LOCATION)
+        item_col.append(items(item_name))
+        updated_col.append(_micros(updated_at))
+        gone_col.append(1 if left_scope else 0)
+
+    sections = [
+        (b'UUID', bytes(uuids)),
+        (b'STAT', _le(status_col)),
+        (b'STOR', _le(store_col)),
+        (b'LOCN', _le(location_col)),
+        (b'ITEM', _le(item_col)),
+        (b'UPDT', _le(updated_col)),
+        (b'GONE', _le(gone_col)),
+        (b'TAGS', _string_column(tag_numbers)),
+        (b'STTB', _string_column(statuses.values)),
+        (b'SRTB', _string_column(stores.values)),
+        (b'LCTB', _string_column(locations.values)),
+        (b'ITTB', _string_column(items.values)),
+    ]
+
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, FLAG_DELTA if since else 0, len(tag_numbers),
+        _micros(generated_at), _micros(since), len(sections)
+    )
+    offset = len(header) + DIRECTORY_ENTRY.size * len(sections)
+    directory, body = [], []
+    for name, data in sections:
+        padding = -offset % 8
+        body.append(b'\0' * padding)
+        offset += padding
+        directory.append(DIRECTORY_ENTRY.pack(name, offset, len(data)))
+        body.append(data)
+        offset += len(data)
+
+    snapshot = header + b''.join(directory) + b''.join(body)
+    return gzip.compress(snapshot, compresslevel=6) if compress else snapshot
+
+
+def read_snapshot(data):
+    """Decode a snapshot (gzip or raw) into `(header, rows)`; reference reader"""
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+    view = memoryview(data)
+    magic, version, flags, count, generated_at, since, section_count = HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ValueError('Not an asset snapshot')
+    if version != FORMAT_VERSION:
+        raise ValueError(f'Unsupported snapshot format version {version}')
+
+    sections = {}
+    for i in range(section_count):
+        name, offset, length = DIRECTORY_ENTRY.unpack_from(view, HEADER.size + i * DIRECTORY_ENTRY.size)
+        sections[name.decode()] = view[offset:offset + length]
+
+    def strings(section):
+        (n,) = struct.unpack_from('<I', section, 0)
+        offsets = struct.unpack_from(f'<{n + 1}I', section, 4)
+        blob = bytes(section[4 + 4 * (n + 1):])
+        return [blob[offsets[i]:offsets[i + 1]].decode() for i in range(n)]
+
+    def column(name, fmt):
+        return struct.unpack(f'<{count}{fmt}', sections[name])
+
+    status_table, store_table = strings(sections['STTB']), strings(sections['SRTB'])
+    location_table, item_table = strings(sections['LCTB']), strings(sections['ITTB'])
+    tag_numbers = strings(sections['TAGS'])
+    status_col, store_col = column('STAT', 'B'), column('STOR', 'I')
+    location_col, item_col, updated_col = column('LOCN', 'I'), column('ITEM', 'I'), column('UPDT', 'q')
+    gone_col = column('GONE', 'B')
+
+    rows = [{
+        'uuid': bytes(sections['UUID'][16 * i:16 * (i + 1)]).hex(),
+        'tag_number': tag_numbers[i],
+        'status': status_table[status_col[i]],
+        'store': store_table[store_col[i]],
+        'location': location_table[location_col[i]] if location_col[i] != NO_LOCATION else None,
+        'item_name': item_table[item_col[i]],
+        'updated_at': updated_col[i],
+        'left_scope': bool(gone_col[i]),
+    } for i in range(count)]
+
+    header = {
+        'version': version,
+        'delta': bool(flags & FLAG_DELTA),
+        'count': count,
+        'generated_at': generated_at,
+        'since': since,
+    }
+    return header, rows
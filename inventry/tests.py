@@ -1,3 +1,1111 @@
-from django.test import TestCase
+import datetime
+import random
+import struct
+import threading
+import time
+from collections import Counter
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from .models import (
+    AssetCheckpoint, AssetCheckpointState, AssetMovement, AssetTag, Batch, Department, InspectionCertificate,
+    InspectionItem, Item, ItemCategory, Location, QRRenderJob, StockBalance, StockEntry, StockRegister, Store,
+    StoreInventory,
+)
+from . import history, qr, services, views
+from .autocomplete import TagPrefixIndex
+from .helper_functions import reserve_stock_entry_codes
+from .management.commands.render_qr_worker import Command as RenderQRWorker
+from .profiling import QueryBudgetExceeded, metrics
+from .query_planning import plan_queryset
+from .scan_cache import ScanCache
+from .search import search_assets, search_filter
+from .snapshot import FORMAT_VERSION, MAGIC, build_snapshot, read_snapshot, snapshot_queryset
+
+
+def create_inventory(quantity=1000):
+    """A department with a store, register, item, batch and inventory of `quantity`"""
+    department = Department.objects.create(name='Computer Science')
+    store = Store.objects.create(
+        name='Main', code='CSD-MAIN', store_type='MAIN', department=department, location='Block A', incharge_name='Incharge'
+    )
+    register = StockRegister.objects.create(register_name='Dead Stock', register_type='DEADSTOCK', store=store)
+    category = ItemCategory.objects.create(name='Furniture', code='FUR')
+    item = Item.objects.create(
+        name='Chair', code='CHR001', department=department, category=category, unit='pcs', source_type='DEPT_PURCHASE'
+    )
+    certificate = InspectionCertificate.objects.create(
+        certificate_number='IC-1', issued_on=datetime.date.today(), issued_to='Lab', contracter='Vendor',
+        indenter='Indenter', consignee='Consignee', department=department,
+        date_of_delivery=datetime.date.today(), delivery_status='FULL', stock_register=register
+    )
+    inspection_item = InspectionItem.objects.create(
+        inspection=certificate, item=item, tendered_quantity=quantity, accepted_quantity=quantity, rejected_quantity=0
+    )
+    batch = Batch.objects.create(
+        batch_number='B-2025-0001', inspection_item=inspection_item, item=item, source_type='DEPARTMENTAL_PURCHASE',
+        source_store=store, total_quantity=quantity, current_quantity=quantity
+    )
+    return StoreInventory.objects.create(store=store, batch=batch, quantity_on_hand=quantity)
+
+
+def run_concurrently(target, threads=8):
+    """
+    Call `target(i)` from `threads` threads started together; returns the
+    results in thread order and re-raises the first exception
+    """
+    barrier = threading.Barrier(threads)
+    results, errors = [None] * threads, []
+
+    def run(i):
+        try:
+            barrier.wait()
+            results[i] = target(i)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class TagSequenceConcurrencyTests(TransactionTestCase):
+
+    def test_parallel_generation_on_one_batch_gives_unique_gap_free_numbers(self):
+        inventory = create_inventory()
+
+        def generate(i):
+            if i % 2:
+                with transaction.atomic():
+                    return [tag.tag_number for tag in AssetTag.bulk_generate(inventory.batch, inventory.store, 25)]
+            return [AssetTag.objects.create(batch=inventory.batch, current_store=inventory.store).tag_number
+                    for _ in range(5)]
+
+        numbers = [number for chunk in run_concurrently(generate) for number in chunk]
+        self.assertEqual(len(numbers), len(set(numbers)))
+        sequences = sorted(int(number.rsplit('-', 1)[1]) for number in numbers)
+        self.assertEqual(sequences, list(range(1, len(numbers) + 1)))
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class CodeAllocationConcurrencyTests(TransactionTestCase):
+
+    def assertGapFree(self, codes, prefix, width):
+        self.assertEqual(len(codes), len(set(codes)))
+        self.assertEqual(sorted(codes), [f'{prefix}{n:0{width}d}' for n in range(1, len(codes) + 1)])
+
+    def test_parallel_department_creation(self):
+        codes = run_concurrently(lambda i: Department.objects.create(name='Computer Science').code, threads=12)
+        self.assertGapFree(codes, 'CS-', 2)
+
+    def test_parallel_register_creation(self):
+        department = Department.objects.create(name='Physics')
+        store = Store.objects.create(
+            name='Main', code='PHY-MAIN', store_type='MAIN', department=department, location='Block B', incharge_name='Incharge'
+        )
+        numbers = run_concurrently(
+            lambda i: StockRegister.objects.create(register_name=f'Register {i}', register_type='CONSUMABLE', store=store).register_number,
+            threads=12,
+        )
+        self.assertGapFree(numbers, 'PHY-MAIN-CON-', 3)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class StockEntryCodeConcurrencyTests(TransactionTestCase):
+
+    def test_parallel_reservations_are_unique_and_increasing(self):
+        def work(i):
+            with transaction.atomic():
+                codes = [reserve_stock_entry_codes(1)[0] for _ in range(10)]
+            codes += reserve_stock_entry_codes(5)
+            return codes
+
+        per_thread = run_concurrently(work, threads=8)
+        for codes in per_thread:
+            self.assertEqual(codes, sorted(codes))
+        codes = sorted(code for codes in per_thread for code in codes)
+        prefix = f"SR-{timezone.now():%y%m%d}-"
+        self.assertEqual(codes, [f'{prefix}{n:04d}' for n in range(1, 8 * 15 + 1)])
+
+
+class StockEntryCodeTests(TestCase):
+
+    def test_bulk_reservation_is_consecutive(self):
+        prefix = f"SR-{timezone.now():%y%m%d}-"
+        self.assertEqual(reserve_stock_entry_codes(3), [f'{prefix}0001', f'{prefix}0002', f'{prefix}0003'])
+        self.assertEqual(reserve_stock_entry_codes(2), [f'{prefix}0004', f'{prefix}0005'])
+        self.assertEqual(reserve_stock_entry_codes(1), [f'{prefix}0006'])
+
+    def test_numbers_restart_each_day(self):
+        today = timezone.now()
+        tomorrow = today + datetime.timedelta(days=1)
+        reserve_stock_entry_codes(4)
+        with mock.patch('inventry.helper_functions.timezone.now', return_value=tomorrow):
+            self.assertEqual(reserve_stock_entry_codes(2), [f"SR-{tomorrow:%y%m%d}-0001", f"SR-{tomorrow:%y%m%d}-0002"])
+        self.assertEqual(reserve_stock_entry_codes(1), [f"SR-{today:%y%m%d}-0005"])
+
+    def test_sequence_is_seeded_from_stored_numbers(self):
+        inventory = create_inventory()
+        register, item = inventory.store.registers.get(), inventory.batch.item
+        prefix = f"SR-{timezone.now():%y%m%d}-"
+        for number in (f'{prefix}0041', f'{prefix}X7QK'):
+            StockEntry.objects.create(
+                entry_type='RECEIPT', entry_number=number, item=item, quantity=1, stock_register=register,
+                to_store=inventory.store
+            )
+        # Older random-character codes are skipped
+        self.assertEqual(reserve_stock_entry_codes(2), [f'{prefix}0042', f'{prefix}0043'])
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class InventoryServiceConcurrencyTests(TransactionTestCase):
+
+    def test_mixed_concurrent_changes_lose_no_updates(self):
+        inventory = create_inventory(quantity=0)
+        register = inventory.store.registers.get()
+        services.receive(inventory, 40, register)
+
+        def work(i):
+            rng, done = random.Random(i), Counter()
+            own = StoreInventory.objects.select_related('batch__item', 'store').get(pk=inventory.pk)
+            for _ in range(25):
+                operation = rng.choice(['receive', 'issue', 'tag', 'allocate', 'release'])
+                try:
+                    if operation == 'receive':
+                        services.receive(own, 2, register)
+                    elif operation == 'issue':
+                        services.issue(own, 3, register)
+                    elif operation == 'tag':
+                        services.tag(own, 1)
+                    else:
+                        services.allocate(own, 2 if operation == 'allocate' else -2)
+                    done[operation] += 1
+                except services.InsufficientStock:
+                    done['refused'] += 1
+            return done
+
+        done = sum(run_concurrently(work), Counter())
+        self.assertEqual(sum(done.values()), 8 * 25)
+
+        inventory.refresh_from_db()
+        self.assertEqual(inventory.quantity_on_hand, 40 + 2 * done['receive'] - 3 * done['issue'])
+        self.assertEqual(inventory.quantity_qr_tagged, done['tag'])
+        self.assertEqual(inventory.quantity_allocated, 2 * (done['allocate'] - done['release']))
+        self.assertLessEqual(inventory.quantity_qr_tagged, inventory.quantity_on_hand)
+
+        # The register moved with the store: one entry per change, running balances intact
+        item = inventory.batch.item
+        entries = list(StockEntry.objects.filter(stock_register=register).order_by('id'))
+        self.assertEqual(len(entries), 1 + done['receive'] + done['issue'])
+        running = 0
+        for entry in entries:
+            running += entry.change
+            self.assertEqual(entry.balance, running)
+        self.assertEqual(StockBalance.objects.get(stock_register=register, item=item).quantity, inventory.quantity_on_hand)
+        self.assertEqual(StockEntry.ledger_balance(register.pk, item.pk), inventory.quantity_on_hand)
+
+
+class StockLedgerTests(TestCase):
+
+    def setUp(self):
+        inventory = create_inventory()
+        self.store, self.item = inventory.store, inventory.batch.item
+        self.register = self.store.registers.get()
+
+    def entry(self, entry_type, quantity):
+        return StockEntry(
+            entry_type=entry_type, item=self.item, quantity=quantity, stock_register=self.register,
+            **({'to_store': self.store} if entry_type == 'RECEIPT' else {'from_store': self.store})
+        )
+
+    def post_many(self):
+        entries = StockEntry.post_many([
+            self.entry('RECEIPT', 10), self.entry('ISSUE', 4), self.entry('RECEIPT', 5), self.entry('ISSUE', 6),
+        ])
+        self.assertEqual([entry.balance for entry in entries], [10, 6, 11, 5])
+        self.assertTrue(all(entry.pk for entry in entries))
+        balance = StockBalance.objects.get(stock_register=self.register, item=self.item)
+        self.assertEqual((balance.quantity, balance.last_entry_id), (5, entries[-1].pk))
+        numbers = [entry.entry_number for entry in entries]
+        self.assertEqual(numbers, sorted(set(numbers)))
+        return entries
+
+    def test_post_many(self):
+        self.post_many()
+
+    def test_post_many_without_keys_from_bulk_insert(self):
+        # As on MySQL
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            self.post_many()
+
+    def test_post_many_refuses_to_go_below_zero(self):
+        with self.assertRaises(DjangoValidationError):
+            StockEntry.post_many([self.entry('RECEIPT', 1), self.entry('ISSUE', 2)])
+        self.assertFalse(StockEntry.objects.exists())
+
+    def test_recompute_repairs_balances(self):
+        entries = self.post_many()
+        StockEntry.objects.filter(pk=entries[1].pk).update(balance=99)
+        StockBalance.objects.filter(stock_register=self.register).update(quantity=42, last_entry=None)
+
+        self.assertEqual(StockBalance.recompute(self.register), (4, 1, 0))
+        self.assertEqual(list(StockEntry.objects.order_by('id').values_list('balance', flat=True)), [10, 6, 11, 5])
+        balance = StockBalance.objects.get(stock_register=self.register, item=self.item)
+        self.assertEqual((balance.quantity, balance.last_entry_id), (5, entries[-1].pk))
+
+    def test_recompute_clamps_issues_beyond_the_balance(self):
+        entries = self.post_many()
+        StockEntry.objects.filter(pk=entries[0].pk).update(quantity=1)
+        # 1 in, 4 out, 5 in, 6 out: both issues overdraw
+        _, _, clamped = StockBalance.recompute(self.register)
+        self.assertEqual(clamped, 2)
+        self.assertEqual(list(StockEntry.objects.order_by('id').values_list('balance', flat=True)), [1, 0, 5, 0])
+
+    def test_recompute_command(self):
+        self.post_many()
+        StockBalance.objects.all().delete()
+        out = StringIO()
+        call_command('recompute_stock_balances', register=[self.register.pk], stdout=out)
+        self.assertIn(f'{self.register.register_number}: 4 entries, 0 balances corrected', out.getvalue())
+        self.assertEqual(StockBalance.objects.get(stock_register=self.register, item=self.item).quantity, 5)
+
+        with self.assertRaisesMessage(CommandError, 'No stock register with id 999'):
+            call_command('recompute_stock_balances', register=[999], stdout=StringIO())
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        inventory = create_inventory()
+        tags = AssetTag.bulk_generate(inventory.batch, inventory.store, 300)
+        # Several rows per millisecond and exact ties, as bulk inserts produce
+        start = timezone.now().replace(microsecond=0)
+        for i, tag in enumerate(tags):
+            tag.created_at = start + datetime.timedelta(microseconds=(i // 3) * 250)
+        AssetTag.objects.bulk_update(tags, ['created_at'])
+        cls.ids = set(AssetTag.objects.values_list('pk', flat=True))
+
+    def walk(self, url, link):
+        client, seen, pages = APIClient(), [], 0
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [row['id'] for row in response.data['results']]
+            url = response.data[link]
+            pages += 1
+            self.assertLess(pages, 100)
+        return seen, response
+
+    def test_walks_every_row_once_forward_and_backward(self):
+        forward, last_page = self.walk('/api/asset-tags/?page_size=7', 'next')
+        self.assertEqual(len(forward), len(self.ids))
+        self.assertEqual(set(forward), self.ids)
+
+        backward, _ = self.walk(last_page.data['previous'], 'previous')
+        last = [row['id'] for row in last_page.data['results']]
+        # Pages come back in order, so walking back yields the rows before the last page
+        self.assertEqual(len(backward), len(self.ids) - len(last))
+        self.assertEqual(set(backward) | set(last), self.ids)
+
+    def test_invalid_cursor_is_not_found(self):
+        response = APIClient().get('/api/asset-tags/?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+
+class TaggedAssetsQueryTests(TestCase):
+
+    def test_query_count_does_not_grow_with_tags(self):
+        inventory = create_inventory()
+        url = f'/api/stores/{inventory.store.pk}/inventries/{inventory.pk}/tagged_assets/'
+        client = APIClient()
+        for count in (10, 200):
+            AssetTag.bulk_generate(inventory.batch, inventory.store, count - AssetTag.objects.count())
+            # Inventory with batch and item, grouped status count, one page of rows
+            with self.assertNumQueries(3):
+                response = client.get(url)
+            self.assertEqual(response.data['summary']['total'], count)
+            self.assertEqual(len(response.data['assets']), min(count, 100))
+
+
+class StoreListQueryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = create_inventory().store.department
+
+    def add_stores(self, count):
+        for i in range(count):
+            store = Store.objects.create(
+                name=f'Lab {i}', code=f'CSD-LAB{Store.objects.count()}', store_type='SUB',
+                department=self.department, location='Block A', incharge_name='Incharge'
+            )
+            for register_type in ('DEADSTOCK', 'CONSUMABLE'):
+                StockRegister.objects.create(register_name=register_type.title(), register_type=register_type, store=store)
+
+    def assertConstantQueries(self, url, queries):
+        client = APIClient()
+        for count in (2, 20):
+            self.add_stores(count)
+            with self.assertNumQueries(queries):
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.data['results'])
+
+    def test_store_list(self):
+        # Stores, their registers, the item index of those registers
+        self.assertConstantQueries('/api/stores/', 3)
+
+    def test_register_list(self):
+        # Registers with their store, the item index
+        self.assertConstantQueries('/api/stock-registers/', 2)
+
+
+class CertificateListQueryTests(TestCase):
+
+    def test_list_is_one_query_for_a_full_page(self):
+        inventory = create_inventory()
+        certificate = InspectionCertificate.objects.get()
+        register = certificate.stock_register
+        InspectionCertificate.objects.bulk_create(
+            InspectionCertificate(
+                certificate_number=f'IC-{i}', issued_on=certificate.issued_on, issued_to='Lab', contracter='Vendor',
+                indenter='Indenter', consignee='Consignee', department=inventory.store.department,
+                date_of_delivery=certificate.date_of_delivery, delivery_status='FULL', stock_register=register
+            ) for i in range(2, 1001)
+        )
+        # Item counts are annotated and links built without a query per row
+        with self.assertNumQueries(1):
+            response = APIClient().get('/api/certificates/?page_size=500')
+        rows = response.data['results']
+        self.assertEqual(len(rows), 500)
+        for row in rows:
+            self.assertEqual(row['item_count'], int(row['id'] == certificate.pk))
+            self.assertTrue(row['items_link'].endswith(f"/api/certificates/{row['id']}/items/"))
+
+
+class ItemBriefSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Item
+        fields = ['id', 'name', 'code']
+
+
+class BatchPlanSerializer(serializers.ModelSerializer):
+    item = ItemBriefSerializer()
+
+    class Meta:
+        model = Batch
+        fields = ['id', 'batch_number', 'item', 'source_store']
+
+
+class RegisterBriefSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockRegister
+        fields = ['id', 'register_name']
+
+
+class StorePlanSerializer(serializers.ModelSerializer):
+    registers = RegisterBriefSerializer(many=True, read_only=True)
+    department_name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Store
+        fields = ['id', 'code', 'registers', 'department_name']
+        select_related = ['department']
+
+    def get_department_name(self, store):
+        return store.department.name
+
+
+class QueryPlanningTests(TestCase):
+
+    def test_nested_foreign_keys_are_joined_and_columns_limited(self):
+        queryset = plan_queryset(Batch.objects.all(), BatchPlanSerializer(), extra_only=['created_at'])
+        self.assertEqual(queryset.query.select_related, {'item': {}})
+        self.assertEqual(queryset.query.deferred_loading, (
+            {'id', 'batch_number', 'created_at', 'item', 'item__id', 'item__name', 'item__code', 'source_store'},
+            False
+        ))
+
+    def test_reverse_relations_are_prefetched_with_their_own_plan(self):
+        queryset = plan_queryset(Store.objects.all(), StorePlanSerializer())
+        # Meta.select_related covers the method field, which also rules out only()
+        self.assertEqual(queryset.query.select_related, {'department': {}})
+        self.assertEqual(queryset.query.deferred_loading, (frozenset(), True))
+        prefetch, = queryset._prefetch_related_lookups
+        self.assertEqual(prefetch.prefetch_to, 'registers')
+        self.assertEqual(prefetch.queryset.query.deferred_loading, ({'id', 'register_name', 'store_id'}, False))
+
+    def test_existing_joins_and_prefetches_are_kept(self):
+        queryset = plan_queryset(Batch.objects.select_related('inspection_item'), BatchPlanSerializer())
+        self.assertEqual(queryset.query.select_related, {'inspection_item': {}, 'item': {}})
+        self.assertEqual(queryset.query.deferred_loading, (frozenset(), True))
+
+        queryset = plan_queryset(Store.objects.prefetch_related('registers'), StorePlanSerializer())
+        self.assertEqual(queryset._prefetch_related_lookups, ('registers',))
+
+    def test_planned_queryset_serializes_without_further_queries(self):
+        create_inventory()
+        stores = list(plan_queryset(Store.objects.all(), StorePlanSerializer()))
+        with self.assertNumQueries(0):
+            data = StorePlanSerializer(stores, many=True).data
+        self.assertEqual(data[0]['department_name'], 'Computer Science')
+        self.assertEqual([row['register_name'] for row in data[0]['registers']], ['Dead Stock'])
+
+    @override_settings(DEBUG=True)
+    def test_lazy_loads_while_serializing_are_logged(self):
+        department = Department.objects.create(name='Physics')
+        for i in range(3):
+            category = ItemCategory.objects.create(name=f'Category {i}', code=f'CAT{i}')
+            Item.objects.create(
+                name=f'Item {i}', code=f'ITM{i}', department=department, category=category, unit='pcs',
+                source_type='DEPT_PURCHASE'
+            )
+        with self.assertNoLogs('inventry.query_planning', 'WARNING'):
+            self.assertEqual(APIClient().get('/api/items/').status_code, 200)
+
+        # Unplanned, every item loads its category on its own, which also goes over the budget
+        with mock.patch.object(views.ItemViewSet, 'query_planning', False), \
+                self.assertLogs('inventry.profiling', 'WARNING'), \
+                self.assertLogs('inventry.query_planning', 'WARNING') as logs:
+            self.assertEqual(APIClient().get('/api/items/').status_code, 200)
+        self.assertIn('3 queries ran while serializing ItemViewSet.list', logs.output[0])
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryBudgetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.inventory = create_inventory()
+        AssetTag.bulk_generate(cls.inventory.batch, cls.inventory.store, 30)
+
+    def test_endpoints_stay_within_budget(self):
+        inventory, client = self.inventory, APIClient()
+        certificate = inventory.batch.inspection_item.inspection
+        urls = [
+            '/api/items/', f'/api/items/{inventory.batch.item.pk}/',
+            '/api/certificates/', f'/api/certificates/{certificate.pk}/',
+            f'/api/certificates/{certificate.pk}/items/',
+            f'/api/certificates/{certificate.pk}/items/{inventory.batch.inspection_item.pk}/',
+            '/api/stores/', f'/api/stores/{inventory.store.pk}/',
+            f'/api/stores/{inventory.store.pk}/inventries/', f'/api/stores/{inventory.store.pk}/inventries/{inventory.pk}/',
+            '/api/stock-registers/', '/api/stock-entries/',
+            '/api/asset-tags/', f'/api/asset-tags/{AssetTag.objects.first().pk}/',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(client.get(url).status_code, 200)
+
+    def test_metrics_are_staff_only(self):
+        APIClient().get('/api/items/')
+        client = APIClient()
+        self.assertEqual(client.get('/api/_metrics/').status_code, 403)
+        self.assertEqual(client.delete('/api/_metrics/').status_code, 403)
+        self.assertTrue(metrics.summary()['endpoints'])
+
+        client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+        self.assertIn('GET ItemViewSet.list', client.get('/api/_metrics/').data['endpoints'])
+        self.assertEqual(client.delete('/api/_metrics/').status_code, 204)
+        self.assertEqual(metrics.summary()['endpoints'], {})
+
+    def test_long_search_stays_within_budget(self):
+        client = APIClient()
+        for query in ('CS-0-CHR001-0001-0001', 'CS-0-CHR001-0001-0001 chair desk lamp'):
+            with self.subTest(query=query):
+                self.assertEqual(client.get('/api/asset-tags/', {'search': query}).status_code, 200)
+
+    def test_request_over_budget_fails(self):
+        with mock.patch.object(views.ItemViewSet, 'query_budget', {'list': 0}):
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'over its budget of 0'):
+                APIClient().get('/api/items/')
+
+
+class SnapshotDeltaTests(TestCase):
+
+    def setUp(self):
+        inventory = create_inventory()
+        self.main = inventory.store
+        self.lab = Store.objects.create(
+            name='Lab', code='CSD-LAB', store_type='SUB', department=self.main.department, location='Block A',
+            incharge_name='Incharge'
+        )
+        self.moved, self.updated, self.unchanged = AssetTag.bulk_generate(inventory.batch, self.main, 3)
+        self.since = timezone.now()
+        AssetTag.bulk_apply_changes([self.moved], store_id=self.lab.pk)
+        AssetTag.bulk_apply_changes([self.updated], status='IN_USE')
+
+    def delta(self, **scope):
+        header, rows = read_snapshot(build_snapshot(snapshot_queryset(since=self.since, **scope), since=self.since))
+        self.assertTrue(header['delta'])
+        return {row['tag_number']: row for row in rows}
+
+    def test_delta_includes_assets_moved_out_of_the_store(self):
+        rows = self.delta(store_id=self.main.pk)
+        self.assertEqual(set(rows), {self.moved.tag_number, self.updated.tag_number})
+        self.assertTrue(rows[self.moved.tag_number]['left_scope'])
+        self.assertEqual(rows[self.moved.tag_number]['store'], 'CSD-LAB')
+        self.assertFalse(rows[self.updated.tag_number]['left_scope'])
+
+    def test_moves_within_the_scope_are_plain_updates(self):
+        rows = self.delta(store_id=self.lab.pk)
+        self.assertEqual(set(rows), {self.moved.tag_number})
+        self.assertFalse(rows[self.moved.tag_number]['left_scope'])
+
+        rows = self.delta(department_id=self.main.department_id)
+        self.assertEqual(set(rows), {self.moved.tag_number, self.updated.tag_number})
+        self.assertFalse(any(row['left_scope'] for row in rows.values()))
+
+    def test_other_format_versions_are_rejected(self):
+        data = bytearray(build_snapshot(snapshot_queryset(store_id=self.main.pk), compress=False))
+        struct.pack_into('<H', data, len(MAGIC), FORMAT_VERSION - 1)
+        with self.assertRaisesMessage(ValueError, f'Unsupported snapshot format version {FORMAT_VERSION - 1}'):
+            read_snapshot(bytes(data))
+
+    def test_full_snapshot_has_the_assets_in_scope(self):
+        header, rows = read_snapshot(build_snapshot(snapshot_queryset(store_id=self.main.pk)))
+        self.assertFalse(header['delta'])
+        self.assertEqual({row['tag_number'] for row in rows}, {self.updated.tag_number, self.unchanged.tag_number})
+
+
+class HistoryTests(TestCase):
+    """states_as_of against a replay of every movement from the start"""
+
+    def setUp(self):
+        rng = random.Random(0)
+        inventory = create_inventory()
+        department = inventory.store.department
+        self.stores = [inventory.store, Store.objects.create(
+            name='Lab', code='CSD-LAB', store_type='SUB', department=department, location='Block A',
+            incharge_name='Incharge'
+        )]
+        self.locations = [
+            Location.objects.create(name=f'Room {i}', code=f'ROOM-{i}', location_type='LAB', department=department)
+            for i in range(3)
+        ]
+        tags = AssetTag.bulk_generate(inventory.batch, inventory.store, 30)
+        AssetMovement.objects.all().delete()
+
+        # 30 days of moves; the last five tags arrive halfway and three of those never move
+        self.start = timezone.now() - datetime.timedelta(days=30)
+        self.middle = self.start + datetime.timedelta(days=15)
+        AssetTag.objects.filter(pk__in=[tag.pk for tag in tags[:25]]).update(created_at=self.start)
+        AssetTag.objects.filter(pk__in=[tag.pk for tag in tags[25:]]).update(created_at=self.middle)
+        self.created = {tag.pk: self.start if i < 25 else self.middle for i, tag in enumerate(tags)}
+
+        current = {tag.pk: ('IN_STOCK', None, inventory.store_id) for tag in tags}
+        movers = tags[:27]
+        movements = []
+        for i in range(300):
+            tag = rng.choice(movers)
+            at = self.start + datetime.timedelta(minutes=i * 144 + 1)
+            if at < self.created[tag.pk]:
+                continue
+            state = (
+                rng.choice(['IN_STOCK', 'IN_USE', 'UNDER_REPAIR']), rng.choice(self.locations).pk,
+                rng.choice(self.stores).pk
+            )
+            before = current[tag.pk]
+            movements.append(AssetMovement(
+                asset=tag, from_status=before[0], to_status=state[0], from_location_id=before[1],
+                to_location_id=state[1], from_store_id=before[2], to_store_id=state[2], created_at=at
+            ))
+            current[tag.pk] = state
+        AssetMovement.objects.bulk_create(movements)
+        for asset_id, (status, location, store) in current.items():
+            AssetTag.objects.filter(pk=asset_id).update(status=status, current_location_id=location, current_store_id=store)
+
+        self.initial = {tag.pk: ('IN_STOCK', None, inventory.store_id) for tag in tags}
+        self.movements = sorted(movements, key=lambda movement: movement.created_at)
+
+    def replay(self, at):
+        states = {asset_id: state for asset_id, state in self.initial.items() if self.created[asset_id] <= at}
+        for movement in self.movements:
+            if movement.created_at <= at:
+                states[movement.asset_id] = (movement.to_status, movement.to_location_id, movement.to_store_id)
+        return states
+
+    def checkpoint(self, at):
+        """A checkpoint as take_checkpoint would have recorded it at `at`"""
+        states = self.replay(at)
+        checkpoint = AssetCheckpoint.objects.create(taken_at=at, asset_count=len(states))
+        AssetCheckpointState.objects.bulk_create([
+            AssetCheckpointState(checkpoint=checkpoint, asset_id=asset_id, status=status, location_id=location, store_id=store)
+            for asset_id, (status, location, store) in states.items()
+        ])
+
+    def assertMatchesReplay(self, at):
+        expected = self.replay(at)
+        self.assertEqual(history.states_as_of(at), expected)
+        for location in self.locations:
+            self.assertEqual(
+                history.states_as_of(at, location_id=location.pk),
+                {asset_id: state for asset_id, state in expected.items() if state[1] == location.pk}
+            )
+        for store in self.stores:
+            self.assertEqual(
+                history.states_as_of(at, store_id=store.pk),
+                {asset_id: state for asset_id, state in expected.items() if state[2] == store.pk}
+            )
+        for tag in AssetTag.objects.all():
+            self.assertEqual(history.asset_state_as_of(tag, at), expected.get(tag.pk))
+
+    def sample_times(self):
+        return [self.start + datetime.timedelta(days=days, minutes=7) for days in (0, 5, 14, 15, 16, 22, 29)] + [timezone.now()]
+
+    def test_without_a_checkpoint(self):
+        for at in self.sample_times():
+            with self.subTest(at=at):
+                self.assertMatchesReplay(at)
+
+    def test_with_a_checkpoint(self):
+        # Assets arriving after the checkpoint fall back to their first later movement or current state
+        self.checkpoint(self.start + datetime.timedelta(days=10))
+        for at in self.sample_times():
+            with self.subTest(at=at):
+                self.assertMatchesReplay(at)
+
+    def test_with_a_checkpoint_of_the_current_state(self):
+        history.take_checkpoint()
+        self.assertEqual(AssetCheckpoint.objects.get().asset_count, 30)
+        self.assertMatchesReplay(timezone.now())
+
+    def test_assets_created_later_are_left_out(self):
+        self.assertEqual(len(history.states_as_of(self.middle - datetime.timedelta(minutes=1))), 25)
+        self.assertEqual(len(history.states_as_of(self.middle)), 30)
+
+
+class TagPrefixIndexTests(TestCase):
+
+    def test_refresh_picks_up_tags_committed_out_of_id_order(self):
+        inventory = create_inventory()
+        late, *_ = AssetTag.bulk_generate(inventory.batch, inventory.store, 3)
+        # Another process's insert with a lower id that commits after the index loads
+        AssetTag.objects.filter(pk=late.pk).delete()
+        index = TagPrefixIndex()
+        index.load()
+        self.assertEqual(len(index), 2)
+
+        AssetTag.objects.bulk_create([late])
+        index.refresh()
+        self.assertEqual(index.complete(late.tag_number), [(late.tag_number.upper(), late.pk)])
+        self.assertEqual(len(index), 3)
+
+        # Rows seen again in the overlap are not duplicated
+        index.refresh()
+        self.assertEqual(len(index), 3)
+
+
+    def test_one_request_loads_while_the_others_wait(self):
+        index, calls = TagPrefixIndex(), []
+
+        def rows(created_since=None):
+            calls.append(created_since)
+            time.sleep(0.05)
+            return iter([('CS-CHR001-0001', 1), ('CS-CHR001-0002', 2)])
+
+        with mock.patch.object(index, '_rows', side_effect=rows):
+            results = run_concurrently(lambda i: index.complete('cs-chr'))
+        self.assertEqual(calls, [None])
+        self.assertEqual(results, [[('CS-CHR001-0001', 1), ('CS-CHR001-0002', 2)]] * 8)
+
+    def test_requests_use_the_current_index_during_a_refresh(self):
+        index = TagPrefixIndex(refresh_seconds=0)
+        with mock.patch.object(index, '_rows', return_value=iter([('CS-CHR001-0001', 1)])):
+            index.load()
+
+        with mock.patch.object(index, '_rows') as rows:
+            # Another request is refreshing
+            with index._updating:
+                self.assertEqual(index.complete('CS'), [('CS-CHR001-0001', 1)])
+            rows.assert_not_called()
+
+            rows.return_value = iter([('CS-CHR001-0002', 2)])
+            self.assertEqual(len(index.complete('CS')), 2)
+            rows.assert_called_once()
+
+
+class ShortSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        inventory = create_inventory()
+        cls.tags = AssetTag.bulk_generate(inventory.batch, inventory.store, 12)
+
+    def test_short_query_matches_inside_tag_numbers(self):
+        twelfth = self.tags[11]
+        self.assertTrue(twelfth.tag_number.endswith('0012'))
+        self.assertEqual(list(search_filter(AssetTag.objects.all(), '12')), [twelfth])
+
+        response = APIClient().get('/api/asset-tags/?search=12')
+        self.assertEqual([row['id'] for row in response.data['results']], [twelfth.pk])
+
+        assets, _ = search_assets('12')
+        self.assertEqual([(asset.pk, asset.score) for asset in assets], [(twelfth.pk, 60)])
+
+    def test_query_count_does_not_grow_with_query_length(self):
+        counts = []
+        for query in ('chr001-0012', 'CS-0-CHR001-0001-0012', 'CS-0-CHR001-0001-0012 chair desk lamp'):
+            with CaptureQueriesContext(connection) as queries:
+                list(search_filter(AssetTag.objects.all(), query))
+                search_assets(query)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertLessEqual(counts[2], counts[0])
+
+    def test_short_prefix_ranks_first_and_stops_at_the_limit(self):
+        assets, _ = search_assets('cs', limit=5)
+        self.assertEqual(len(assets), 5)
+        self.assertTrue(all(asset.score == 80 for asset in assets))
+
+
+class AssetStatusUpdateTests(TestCase):
+
+    def setUp(self):
+        inventory = create_inventory()
+        self.tags = AssetTag.bulk_generate(inventory.batch, inventory.store, 4)
+        self.written_off = self.tags[3]
+        AssetTag.objects.filter(pk=self.written_off.pk).update(status='WRITTEN_OFF')
+        self.user = User.objects.create_user('clerk', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def bulk_update(self, body, client=None):
+        return (client or self.client).post('/api/asset-tags/bulk_update_status/', body, format='json')
+
+    def test_results_follow_request_order_with_per_row_errors(self):
+        AssetTag.objects.filter(pk=self.tags[1].pk).update(status='IN_USE')
+        ids = [self.tags[0].pk, 999999, self.written_off.pk, self.tags[1].pk, self.tags[0].pk]
+        response = self.bulk_update({'ids': ids, 'status': 'IN_USE'})
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([row['key'] for row in results], [self.tags[0].pk, 999999, self.written_off.pk, self.tags[1].pk])
+        self.assertEqual([row['success'] for row in results], [True, False, False, True])
+        self.assertEqual(results[1]['error'], 'Asset not found')
+        self.assertEqual(results[2]['error'], 'Written off assets cannot be updated')
+        self.assertEqual([results[0]['changed'], results[3]['changed']], [True, False])
+        self.assertEqual(response.data['summary'], {'requested': 4, 'updated': 1, 'unchanged': 1, 'failed': 2})
+        self.assertFalse(response.data['success'])
+
+        self.assertEqual(AssetTag.objects.get(pk=self.written_off.pk).status, 'WRITTEN_OFF')
+        movement = AssetMovement.objects.get(asset=self.tags[0])
+        self.assertEqual((movement.to_status, movement.created_by), ('IN_USE', self.user))
+
+    def test_uuids_report_invalid_and_unknown_values(self):
+        unknown = '00000000-0000-0000-0000-000000000000'
+        response = self.bulk_update({'uuids': [str(self.tags[2].qr_code_uuid), 'not-a-uuid', unknown], 'status': 'LOST'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['success'], row.get('error')) for row in response.data['results']],
+            [(True, None), (False, 'Invalid UUID'), (False, 'Asset not found')]
+        )
+        self.assertEqual(AssetTag.objects.get(pk=self.tags[2].pk).status, 'LOST')
+
+    def test_request_validation(self):
+        response = self.bulk_update({'ids': list(range(1, 5002)), 'status': 'IN_USE'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ids', response.data)
+
+        response = self.bulk_update({'ids': [self.tags[0].pk]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['non_field_errors'], ['No changes provided'])
+
+        response = self.bulk_update({'status': 'IN_USE'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['non_field_errors'], ['Provide ids or uuids'])
+
+    def test_bulk_update_requires_login(self):
+        response = self.bulk_update({'ids': [self.tags[0].pk], 'status': 'IN_USE'}, client=APIClient())
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(AssetTag.objects.get(pk=self.tags[0].pk).status, 'IN_STOCK')
+
+    def test_single_update_refuses_written_off_assets(self):
+        response = self.client.post(
+            f'/api/asset-tags/{self.written_off.pk}/update_status/', {'status': 'IN_USE'}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Written off assets cannot be updated')
+        self.assertEqual(AssetTag.objects.get(pk=self.written_off.pk).status, 'WRITTEN_OFF')
+
+        response = self.client.post(
+            f'/api/asset-tags/{self.tags[0].pk}/update_status/', {'status': 'WRITTEN_OFF'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AssetTag.objects.get(pk=self.tags[0].pk).status, 'WRITTEN_OFF')
+
+
+class AssetTimelineTests(TestCase):
+
+    def setUp(self):
+        inventory = create_inventory()
+        self.main = inventory.store
+        self.lab = Store.objects.create(
+            name='Lab', code='CSD-LAB', store_type='SUB', department=self.main.department, location='Block A',
+            incharge_name='Incharge'
+        )
+        self.room = Location.objects.create(name='Room 1', code='ROOM-1', location_type='LAB', department=self.main.department)
+        self.tag, self.other = AssetTag.bulk_generate(inventory.batch, self.main, 2)
+        self.user = User.objects.create_user('clerk', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_update_status_records_from_and_to(self):
+        response = self.client.post(f'/api/asset-tags/{self.tag.pk}/update_status/', {
+            'status': 'IN_USE', 'assigned_to': 'AV Hall', 'location_id': self.room.pk, 'store_id': self.lab.pk,
+            'remarks': 'Installed'
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        movement = AssetMovement.objects.get(asset=self.tag)
+        self.assertEqual(
+            (movement.from_status, movement.from_location_id, movement.from_store_id, movement.from_assigned_to),
+            ('IN_STOCK', None, self.main.pk, '')
+        )
+        self.assertEqual(
+            (movement.to_status, movement.to_location_id, movement.to_store_id, movement.to_assigned_to),
+            ('IN_USE', self.room.pk, self.lab.pk, 'AV Hall')
+        )
+        self.assertEqual((movement.remarks, movement.created_by), ('Installed', self.user))
+        # Remarks go on the movement, not the asset
+        self.assertEqual(AssetTag.objects.get(pk=self.tag.pk).remarks, '')
+
+        # Repeating the same values records nothing
+        self.client.post(f'/api/asset-tags/{self.tag.pk}/update_status/', {'status': 'IN_USE'}, format='json')
+        self.assertEqual(AssetMovement.objects.filter(asset=self.tag).count(), 1)
+
+    def test_update_through_patch_records_a_movement(self):
+        response = self.client.patch(f'/api/asset-tags/{self.tag.pk}/', {'status': 'UNDER_REPAIR'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        movement = AssetMovement.objects.get(asset=self.tag)
+        self.assertEqual((movement.from_status, movement.to_status), ('IN_STOCK', 'UNDER_REPAIR'))
+        self.assertEqual(movement.from_store_id, movement.to_store_id)
+
+    def test_timeline_pages_through_the_history_newest_first(self):
+        # Several movements share a timestamp, so the id breaks ties
+        start = timezone.now().replace(microsecond=0) - datetime.timedelta(days=1)
+        AssetMovement.objects.bulk_create([
+            AssetMovement(
+                asset=self.tag, from_status='IN_STOCK', to_status='IN_USE', from_store=self.main, to_store=self.lab,
+                to_location=self.room, created_at=start + datetime.timedelta(minutes=i // 3)
+            ) for i in range(20)
+        ] + [AssetMovement(asset=self.other, to_status='IN_USE', created_at=start)])
+        expected = list(AssetMovement.objects.filter(asset=self.tag).order_by('-created_at', '-id').values_list('pk', flat=True))
+
+        url, seen = f'/api/asset-tags/{self.tag.pk}/timeline/?page_size=6', []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['asset'], {'id': self.tag.pk, 'tag_number': self.tag.tag_number})
+            self.assertLessEqual(len(response.data['results']), 6)
+            seen += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+
+        row = response.data['results'][0]
+        self.assertEqual((row['from_status'], row['to_status']), ('IN_STOCK', 'IN_USE'))
+        self.assertEqual((row['from_store_code'], row['to_store_code']), ('CSD-MAIN', 'CSD-LAB'))
+        self.assertEqual((row['from_location_name'], row['to_location_name']), (None, 'Room 1'))
+
+    def test_timeline_of_unknown_asset_is_not_found(self):
+        self.assertEqual(self.client.get('/api/asset-tags/999999/timeline/').status_code, 404)
+
+
+class ReconcileTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        inventory = create_inventory()
+        department = inventory.store.department
+        cls.main = inventory.store
+        cls.lab = Store.objects.create(
+            name='Lab', code='CSD-LAB', store_type='SUB', department=department, location='Block A',
+            incharge_name='Incharge'
+        )
+        cls.room, cls.office = (
+            Location.objects.create(name=name, code=name.upper(), location_type='LAB', department=department)
+            for name in ('Room', 'Office')
+        )
+        tags = AssetTag.bulk_generate(inventory.batch, cls.main, 7)
+        # Room: 0-3 (3 is lost), office: 4, room but the lab store: 5, no location: 6
+        AssetTag.objects.filter(pk__in=[tag.pk for tag in tags[:4]]).update(current_location=cls.room)
+        AssetTag.objects.filter(pk=tags[3].pk).update(status='LOST')
+        AssetTag.objects.filter(pk=tags[4].pk).update(current_location=cls.office)
+        AssetTag.objects.filter(pk=tags[5].pk).update(current_location=cls.room, current_store=cls.lab)
+        cls.tags = tags
+
+    def reconcile(self, uuids, **scope):
+        response = APIClient().post('/api/asset-tags/reconcile/', {'uuids': uuids, **scope}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def uuids(self, *indexes):
+        return [str(self.tags[i].qr_code_uuid) for i in indexes]
+
+    def ids(self, rows):
+        return sorted(row['id'] for row in rows)
+
+    def test_location_audit(self):
+        unknown = '00000000-0000-0000-0000-000000000000'
+        data = self.reconcile(self.uuids(0, 1, 4, 5, 0) + [unknown, 'garbage'], location_id=self.room.pk)
+        self.assertEqual(self.ids(data['found']), [self.tags[0].pk, self.tags[1].pk, self.tags[5].pk])
+        self.assertEqual(self.ids(data['misplaced']), [self.tags[4].pk])
+        self.assertEqual(data['misplaced'][0]['location'], 'Office')
+        # Lost and written off assets are not expected anywhere
+        self.assertEqual(self.ids(data['missing']), [self.tags[2].pk])
+        self.assertEqual(data['unknown'], [unknown])
+        self.assertEqual(data['invalid'], ['garbage'])
+        self.assertEqual(
+            data['summary'], {'scanned': 7, 'found': 3, 'misplaced': 1, 'unknown': 1, 'missing': 1, 'invalid': 1}
+        )
+
+    def test_store_audit(self):
+        data = self.reconcile(self.uuids(0, 5, 6), store_id=self.main.pk)
+        self.assertEqual(self.ids(data['found']), [self.tags[0].pk, self.tags[6].pk])
+        self.assertEqual(self.ids(data['misplaced']), [self.tags[5].pk])
+        self.assertEqual(data['misplaced'][0]['store'], 'CSD-LAB')
+        self.assertEqual(self.ids(data['missing']), [self.tags[i].pk for i in (1, 2, 4)])
+
+    def test_location_and_store_together(self):
+        data = self.reconcile(self.uuids(0, 5), location_id=self.room.pk, store_id=self.lab.pk)
+        self.assertEqual(self.ids(data['found']), [self.tags[5].pk])
+        self.assertEqual(self.ids(data['misplaced']), [self.tags[0].pk])
+        self.assertEqual(data['missing'], [])
+
+    def test_without_a_scope_nothing_is_missing(self):
+        data = self.reconcile(self.uuids(0, 4))
+        self.assertEqual(self.ids(data['found']), [self.tags[0].pk, self.tags[4].pk])
+        self.assertEqual((data['misplaced'], data['missing']), ([], []))
+
+    def test_unknown_scope_is_rejected(self):
+        response = APIClient().post(
+            '/api/asset-tags/reconcile/', {'uuids': self.uuids(0), 'location_id': 999999}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('location_id', response.data)
+
+
+class QRRenderQueueTests(TestCase):
+
+    def setUp(self):
+        self.inventory = create_inventory()
+
+    def new_tags(self):
+        tag = AssetTag.objects.create(batch=self.inventory.batch, current_store=self.inventory.store)
+        return [tag] + AssetTag.bulk_generate(self.inventory.batch, self.inventory.store, 3)
+
+    @override_settings(QR_PERSIST_IMAGES=False)
+    def test_tags_served_on_demand_are_not_pending(self):
+        tags = self.new_tags()
+        self.assertEqual(
+            set(AssetTag.objects.filter(pk__in=[tag.pk for tag in tags]).values_list('qr_image_status', flat=True)),
+            {'ON_DEMAND'}
+        )
+        self.assertFalse(QRRenderJob.objects.exists())
+        self.assertEqual(RenderQRWorker().enqueue_missing(), 0)
+
+    @override_settings(QR_PERSIST_IMAGES=True)
+    def test_persisted_tags_are_pending_with_a_job(self):
+        tags = self.new_tags()
+        self.assertEqual(
+            set(AssetTag.objects.filter(pk__in=[tag.pk for tag in tags]).values_list('qr_image_status', flat=True)),
+            {'PENDING'}
+        )
+        self.assertEqual(QRRenderJob.objects.count(), 4)
+        self.assertEqual(RenderQRWorker().enqueue_missing(), 0)
+
+        QRRenderJob.objects.filter(asset=tags[0]).delete()
+        self.assertEqual(RenderQRWorker().enqueue_missing(), 1)
+
+
+class QRImageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        inventory = create_inventory()
+        cls.tag, = AssetTag.bulk_generate(inventory.batch, inventory.store, 1)
+
+    def test_renders_png_and_svg_with_cache_headers(self):
+        client = APIClient()
+        for fmt, content_type in (('png', 'image/png'), ('svg', 'image/svg+xml')):
+            response = client.get(f'/api/asset-tags/{self.tag.qr_code_uuid}/qr.{fmt}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], content_type)
+            self.assertTrue(response.content)
+            self.assertRegex(response['ETag'], r'^"[^"]+"$')
+            self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+        # Upper-case UUIDs name the same image
+        upper = client.get(f'/api/asset-tags/{str(self.tag.qr_code_uuid).upper()}/qr.svg')
+        self.assertEqual(upper['ETag'], response['ETag'])
+
+    def test_svg_uses_a_fixed_mask(self):
+        url = qr.build_qr_url('http://testserver', self.tag.qr_code_uuid)
+        with mock.patch.object(qr, '_make_qr', wraps=qr._make_qr) as make_qr:
+            size, path = qr.qr_svg_path(url)
+        make_qr.assert_called_once_with(url, qr.SVG_MASK_PATTERN)
+        self.assertEqual(size, qr.qr_runs(url, qr.SVG_MASK_PATTERN)[0])
+        self.assertTrue(path.startswith('M'))
+
+    def test_matching_etag_is_not_modified(self):
+        client = APIClient()
+        url = f'/api/asset-tags/{self.tag.qr_code_uuid}/qr.png'
+        etag = client.get(url)['ETag']
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_unknown_or_malformed_uuid_is_not_found(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/asset-tags/00000000-0000-0000-0000-000000000000/qr.png').status_code, 404)
+        self.assertEqual(client.get(f"/api/asset-tags/{'-' * 36}/qr.png").status_code, 404)
+        self.assertEqual(client.get(f"/api/asset-tags/{'a' * 36}/qr.svg").status_code, 404)
+
+
+class ScanCacheTests(TestCase):
+
+    def setUp(self):
+        self.cache = ScanCache()
+
+    def test_result_read_before_invalidation_is_not_served(self):
+        data, token = self.cache.get('asset')
+        self.assertIsNone(data)
+        self.cache.invalidate('asset')
+        self.cache.set('asset', {'status': 'old'}, token)
+        self.assertIsNone(self.cache.get('asset')[0])
+
+        data, token = self.cache.get('asset')
+        self.cache.set('asset', {'status': 'new'}, token)
+        self.assertEqual(self.cache.get('asset')[0], {'status': 'new'})
+
+    def test_result_cached_before_commit_is_dropped_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cache.invalidate('asset')
+            # A concurrent scan reads the pre-commit row and caches it
+            data, token = self.cache.get('asset')
+            self.cache.set('asset', {'status': 'old'}, token)
+        self.assertIsNone(self.cache.get('asset')[0])
+
+    def test_invalidate_all_outdates_every_entry(self):
+        _, token = self.cache.get('asset')
+        self.cache.invalidate_all()
+        self.cache.set('asset', {'status': 'old'}, token)
+        self.assertIsNone(self.cache.get('asset')[0])
@@ -26,4 +26,6 @@ certificates_router.register('items', views.InspectionItemViewSet, basename='cer
 stores_router = routers.NestedDefaultRouter(router, 'stores', lookup='store')
 stores_router.register('inventries', views.StoreInventryViewSet, basename='store-inventries')
 
-urlpatterns = router.urls + certificates_router.urls + stores_router.urls
\ No newline at end of file
+urlpatterns = router.urls + certificates_router.urls + stores_router.urls + [
+    path('_metrics/', views.metrics, name='metrics'),
+]
\ No newline at end of file
@@ -1,169 +1,67 @@
-from django.shortcuts import render
+from django.shortcuts import render, get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import *
 from .serializers import *
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 import csv
+from django.db.models import Count
 from rest_framework import status
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+from django.conf import settings
+import os
+from uuid import UUID
+from django.utils import timezone
+from django.db import transaction
+from django.core.exceptions import ValidationError as DjangoValidationError
+from . import history, pdf, qr, services, snapshot
+from .scan_cache import scan_cache
+from .pagination import KeysetCursorPagination
+from .query_planning import QueryPlanningMixin
+from .profiling import metrics as request_metrics
+from .autocomplete import tag_index
+from .search import SEARCH_LIMIT, SEARCH_MAX_LIMIT, search_assets, search_filter
 
-class DepartmentViewSet(ModelViewSet):
-    queryset = Department.objects.all()
-    serializer_class = DepartmentSerializer
+# Labels rendered per database fetch / streamed chunk in print_tags
+PRINT_CHUNK_SIZE = 200
 
-class ItemCategoryViewSet(ModelViewSet):
-    queryset = ItemCategory.objects.all()
-    serializer_class = ItemCategorySerializer
+# Page size bounds for tagged_assets
+TAGGED_ASSETS_PAGE_SIZE = 100
+TAGGED_ASSETS_MAX_PAGE_SIZE = 1000
 
-class ItemViewSet(ModelViewSet):
-    queryset = Item.objects.all()
-    serializer_class = ItemSerializer
+# Suggestions returned by autocomplete
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
 
-class InspectionCertificateViewSet(ModelViewSet):
-    http_method_names = ['get', 'post', 'patch', 'options', 'header']
-    queryset = InspectionCertificate.objects.all()
-    
-    def get_serializer_class(self):
-        if self.request.method == 'PATCH':
-            return UpdateInspectionCertificateSerializer
-        return InspectionCertificateSerializer
-    
-    def get_serializer_context(self):
-        return {'request': self.request}
 
-class InspectionItemViewSet(ModelViewSet):
-    
-    def get_queryset(self):
-        return InspectionItem.objects.filter(inspection_id=self.kwargs['certificate_pk'])
-    
-    def get_serializer_context(self):
-        return {'certificate_id': self.kwargs['certificate_pk']}
-    
-    def get_serializer_class(self):
-        if self.request.method == 'GET':
-            return ListInspectionItemSerializer
-        return InspectionItemSerializer
-    
-class BatchViewSet(ModelViewSet):
-    queryset = Batch.objects.all()
-    serializer_class = BatchSerializer
+def _int_param(request, name, default, maximum=None):
+    """Non-negative integer query parameter, falling back to `default`"""
+    try:
+        value = max(0, int(request.query_params.get(name, default)))
+    except (TypeError, ValueError):
+        value = default
+    return min(value, maximum) if maximum is not None else value
 
-class StoreViewSet(ModelViewSet):
-    queryset = Store.objects.all()
-    serializer_class = StoreSerializer
 
-class StoreInventryViewSet(ModelViewSet):
-    
-    def get_serializer_class(self):
-        if self.request.method == 'GET':
-            return ListStoreInventrySerializer
-        return StoreInventrySerializer
+def _reconcile_row(row):
+    return {
+        'id': row['id'],
+        'qr_uuid': str(row['qr_code_uuid']),
+        'tag_number': row['tag_number'],
+        'status': row['status'],
+        'location_id': row['current_location_id'],
+        'location': row['current_location__name'],
+        'store_id': row['current_store_id'],
+        'store': row['current_store__code'],
+    }
 
-    def get_serializer_context(self):
-        return {'store_id': self.kwargs['store_pk']}
-    
-    def get_queryset(self):
-        store_pk = self.kwargs.get('store_pk')
-        return StoreInventory.objects.filter(
-            store_id=store_pk
-        ).select_related('batch', 'batch__item', 'store')
-    
-    @action(detail=True, methods=['post'])
-    def generate_tags(self, request, store_pk=None, pk=None):
-        inventory = self.get_object()
 
-        # Use serializer to validate input
-        serializer = GenerateQRTagsSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        quantity = serializer.validated_data['quantity']
-
-        # Check available quantity
-        available = inventory.quantity_on_hand - inventory.quantity_qr_tagged
-        if quantity > available:
-            return Response({
-                'error': f'Only {available} untagged items available',
-                'details': {
-                    'quantity_on_hand': inventory.quantity_on_hand,
-                    'already_tagged': inventory.quantity_qr_tagged,
-                    'available': available
-                }
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        tags_created = []
-        try:
-            with transaction.atomic():
-                for _ in range(quantity):
-                    tag = AssetTag.objects.create(
-                        batch=inventory.batch,
-                        current_store=inventory.store,
-                        created_by=request.user if request.user.is_authenticated else None
-                    )
-                    tags_created.append({
-                        'id': tag.id,
-                        'tag_number': tag.tag_number,
-                        'qr_uuid': str(tag.qr_code_uuid),
-                        'qr_image_url': request.build_absolute_uri(tag.qr_code_image.url) if tag.qr_code_image else None
-                    })
-                
-                # Update inventory
-                inventory.quantity_qr_tagged += quantity
-                inventory.save()
-            
-            # Generate print URL
-            tag_ids = ','.join(str(t['id']) for t in tags_created)
-            print_url = request.build_absolute_uri(
-                f'/api/stores/{store_pk}/inventries/{pk}/print_tags/?ids={tag_ids}'
-            )
-            
-            return Response({
-                'success': True,
-                'message': f'{quantity} QR tags generated successfully',
-                'tags': tags_created,
-                'inventory': {
-                    'batch_number': inventory.batch.batch_number,
-                    'item_name': inventory.batch.item.name,
-                    'quantity_on_hand': inventory.quantity_on_hand,
-                    'quantity_qr_tagged': inventory.quantity_qr_tagged,
-                    'untagged_remaining': inventory.quantity_on_hand - inventory.quantity_qr_tagged
-                },
-                'print_url': print_url
-            }, status=status.HTTP_201_CREATED)
-
-        except Exception as e:
-            return Response({
-                'error': f'Failed to generate tags: {str(e)}'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    
-    @action(detail=True, methods=['get'])
-    def print_tags(self, request, store_pk=None, pk=None):
-        """
-        Generate printable QR labels
-        GET /api/stores/{store_id}/inventries/{id}/print_tags/?ids=1,2,3
-        """
-        inventory = self.get_object()
-        tag_ids = request.query_params.get('ids', '').split(',')
-        
-        if not tag_ids or tag_ids == ['']:
-            # Print all tags for this inventory
-            tags = AssetTag.objects.filter(
-                batch=inventory.batch,
-                current_store=inventory.store
-            )
-        else:
-            tags = AssetTag.objects.filter(id__in=tag_ids)
-        
-        tags = tags.select_related('batch__item', 'current_store')
-        
-        if not tags.exists():
-            return HttpResponse('<h1>No tags found</h1>')
-        
-        # Generate HTML for printing
-        html = f'''
-<!DOCTYPE html>
+LABEL_SHEET_HEAD = '''<!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
@@ -243,6 +141,11 @@ class StoreInventryViewSet(ModelViewSet):
             height: auto;
         }}
         
+        .qr-code svg {{
+            width: 120px;
+            height: 120px;
+        }}
+        
         .info {{
             font-size: 11px;
             margin-top: 5px;
@@ -270,82 +173,395 @@ class StoreInventryViewSet(ModelViewSet):
 <body>
     <div class="no-print">
         <button onclick="window.print()">🖨️ Print Labels</button>
-        <p><strong>Total Labels:</strong> {tags.count()}</p>
-        <p><strong>Batch:</strong> {inventory.batch.batch_number}</p>
-        <p><strong>Item:</strong> {inventory.batch.item.name}</p>
+        <p><strong>Total Labels:</strong> {total}</p>
+        <p><strong>Batch:</strong> {batch_number}</p>
+        <p><strong>Item:</strong> {item_name}</p>
     </div>
     
     <div class="container">
 '''
-        
-        for tag in tags:
-            qr_url = request.build_absolute_uri(tag.qr_code_image.url) if tag.qr_code_image else ''
-            
-            html += f'''
-        <div class="label">
+
+LABEL_HTML = '''        <div class="label">
             <div class="qr-code">
-                <img src="{qr_url}" alt="QR Code" />
+                {qr_markup}
             </div>
             <div class="info">
-                <div class="tag-number">{tag.tag_number}</div>
-                <div class="item-name">{tag.batch.item.name}</div>
+                <div class="tag-number">{tag_number}</div>
+                <div class="item-name">{item_name}</div>
                 <div class="batch-store">
-                    Batch: {tag.batch.batch_number} | Store: {tag.current_store.code}
+                    Batch: {batch_number} | Store: {store_code}
                 </div>
             </div>
         </div>
 '''
-        
-        html += '''
-    </div>
+
+LABEL_SHEET_TAIL = '''    </div>
 </body>
 </html>
 '''
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def metrics(request):
+    """
+    Query count, SQL/serialization/total time and response size per
+    endpoint over this process's recent requests; DELETE clears them.
+    Staff only: the summary includes raw SQL.
+    """
+    if request.method == 'DELETE':
+        request_metrics.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(request_metrics.summary())
+
+
+class BinaryRenderer(BaseRenderer):
+    """Passes through raw bytes produced by the view"""
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only raw bytes are rendered; error payloads are sent empty
+        return data if isinstance(data, bytes) else b''
+
+
+class PNGRenderer(BinaryRenderer):
+    media_type = 'image/png'
+    format = 'png'
+
+
+class SVGRenderer(BinaryRenderer):
+    media_type = 'image/svg+xml'
+    format = 'svg'
+
+
+class PDFRenderer(BinaryRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+
+
+class DepartmentViewSet(QueryPlanningMixin, ModelViewSet):
+    queryset = Department.objects.all()
+    serializer_class = DepartmentSerializer
+
+class ItemCategoryViewSet(QueryPlanningMixin, ModelViewSet):
+    queryset = ItemCategory.objects.all()
+    serializer_class = ItemCategorySerializer
+
+class ItemViewSet(QueryPlanningMixin, ModelViewSet):
+    queryset = Item.objects.all()
+    serializer_class = ItemSerializer
+    query_budget = {'list': 3, 'retrieve': 3}
+
+class InspectionCertificateViewSet(QueryPlanningMixin, ModelViewSet):
+    http_method_names = ['get', 'post', 'patch', 'options', 'header']
+    queryset = InspectionCertificate.objects.annotate(num_items=Count('items'))
+    query_budget = {'list': 3, 'retrieve': 3}
+    
+    def get_serializer_class(self):
+        if self.request.method == 'PATCH':
+            return UpdateInspectionCertificateSerializer
+        return InspectionCertificateSerializer
+    
+    def get_serializer_context(self):
+        return {'request': self.request}
+
+class InspectionItemViewSet(QueryPlanningMixin, ModelViewSet):
+    query_budget = {'list': 3, 'retrieve': 3}
+    
+    def get_queryset(self):
+        return InspectionItem.objects.filter(inspection_id=self.kwargs['certificate_pk'])
+    
+    def get_serializer_context(self):
+        return {'certificate_id': self.kwargs['certificate_pk']}
+    
+    def get_serializer_class(self):
+        if self.request.method == 'GET':
+            return ListInspectionItemSerializer
+        return InspectionItemSerializer
+    
+class BatchViewSet(QueryPlanningMixin, ModelViewSet):
+    queryset = Batch.objects.all()
+    cursor_ordering = ['-created_at', '-id']
+    serializer_class = BatchSerializer
+
+class StoreViewSet(QueryPlanningMixin, ModelViewSet):
+    queryset = Store.objects.prefetch_related('registers')
+    serializer_class = StoreSerializer
+    query_budget = {'list': 5, 'retrieve': 5}
+
+    def get_serializer(self, *args, **kwargs):
+        if args and self.request.method == 'GET':
+            stores = args[0] if kwargs.get('many') else [args[0]]
+            kwargs['context'] = self.get_serializer_context()
+            kwargs['context']['register_indexes'] = stock_register_indexes(
+                [register.id for store in stores for register in store.registers.all()]
+            )
+        return super().get_serializer(*args, **kwargs)
+
+class StoreInventryViewSet(QueryPlanningMixin, ModelViewSet):
+    query_budget = {'list': 3, 'retrieve': 3}
+    
+    def get_serializer_class(self):
+        if self.request.method == 'GET':
+            return ListStoreInventrySerializer
+        return StoreInventrySerializer
+
+    def get_serializer_context(self):
+        return {'store_id': self.kwargs['store_pk']}
+    
+    def get_queryset(self):
+        store_pk = self.kwargs.get('store_pk')
+        return StoreInventory.objects.filter(
+            store_id=store_pk
+        ).select_related('batch', 'batch__item', 'store')
+    
+    @action(detail=True, methods=['post'])
+    def generate_tags(self, request, store_pk=None, pk=None):
+        inventory = self.get_object()
+
+        # Use serializer to validate input
+        serializer = GenerateQRTagsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        quantity = serializer.validated_data['quantity']
+
+        try:
+            with transaction.atomic():
+                # Claim the untagged quantity first; a concurrent request can't take it too
+                services.tag(inventory, quantity)
+                tags = AssetTag.bulk_generate(
+                    batch=inventory.batch,
+                    store=inventory.store,
+                    quantity=quantity,
+                    created_by=request.user if request.user.is_authenticated else None
+                )
+                tags_created = [{
+                    'id': tag.id,
+                    'tag_number': tag.tag_number,
+                    'qr_uuid': str(tag.qr_code_uuid),
+                    'qr_image_url': request.build_absolute_uri(tag.qr_image_path())
+                } for tag in tags]
+            
+            # Generate print URL
+            tag_ids = ','.join(str(t['id']) for t in tags_created)
+            print_url = request.build_absolute_uri(
+                f'/api/stores/{store_pk}/inventries/{pk}/print_tags/?ids={tag_ids}'
+            )
+            
+            return Response({
+                'success': True,
+                'message': f'{quantity} QR tags generated successfully',
+                'tags': tags_created,
+                'inventory': {
+                    'batch_number': inventory.batch.batch_number,
+                    'item_name': inventory.batch.item.name,
+                    'quantity_on_hand': inventory.quantity_on_hand,
+                    'quantity_qr_tagged': inventory.quantity_qr_tagged,
+                    'untagged_remaining': inventory.quantity_on_hand - inventory.quantity_qr_tagged
+                },
+                'print_url': print_url
+            }, status=status.HTTP_201_CREATED)
+
+        except services.InsufficientStock as e:
+            return Response({'error': str(e), 'details': e.details}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({
+                'error': f'Failed to generate tags: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def _post_movement(self, request, post, entry_fields):
+        """Shared body of receive/issue: validate, apply through inventry.services, report"""
+        inventory = self.get_object()
+        if inventory.batch is None:
+            return Response({'error': 'Inventory has no batch'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = InventoryMovementSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            entry = post(
+                inventory, data['quantity'], data['stock_register'],
+                created_by=request.user if request.user.is_authenticated else None,
+                **{field: data[field] for field in entry_fields if field in data}
+            )
+        except services.InsufficientStock as e:
+            return Response({'error': str(e), 'details': e.details}, status=status.HTTP_400_BAD_REQUEST)
+        except DjangoValidationError as e:
+            # e.g. the register's balance of the item is lower than the store's
+            return Response({'error': e.message_dict}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'inventory': ListStoreInventrySerializer(inventory).data,
+            'entry': StockEnteySerializer(entry).data,
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def allocate(self, request, store_pk=None, pk=None):
+        """
+        Reserve items (or release them with a negative quantity)
+        POST /api/stores/{store_id}/inventries/{id}/allocate/
+        {"quantity": 5}
+        """
+        inventory = self.get_object()
+        serializer = AllocateInventorySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            services.allocate(inventory, serializer.validated_data['quantity'])
+        except services.InsufficientStock as e:
+            return Response({'error': str(e), 'details': e.details}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(ListStoreInventrySerializer(inventory).data)
+
+    @action(detail=True, methods=['post'])
+    def receive(self, request, store_pk=None, pk=None):
+        """
+        Add stock and post the receipt in one of the store's registers
+        POST /api/stores/{store_id}/inventries/{id}/receive/
+        {"quantity": 10, "stock_register": 1, "from_inspection": 3}
+        """
+        return self._post_movement(request, services.receive, ['from_inspection'])
+
+    @action(detail=True, methods=['post'])
+    def issue(self, request, store_pk=None, pk=None):
+        """
+        Issue untagged stock and post the issue in one of the store's registers
+        POST /api/stores/{store_id}/inventries/{id}/issue/
+        {"quantity": 2, "stock_register": 1, "to_location": 5}
+        """
+        return self._post_movement(request, services.issue, ['to_location'])
+    
+    @action(detail=True, methods=['get'],
+            renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, PDFRenderer])
+    def print_tags(self, request, store_pk=None, pk=None, format=None):
+        """
+        Generate printable QR labels
+        GET /api/stores/{store_id}/inventries/{id}/print_tags/?ids=1,2,3
+        GET /api/stores/{store_id}/inventries/{id}/print_tags/?ids=1,2,3&qr=svg
+        GET /api/stores/{store_id}/inventries/{id}/print_tags/?ids=1,2,3&format=pdf
+
+        With qr=svg the QR codes are inlined as SVG paths, so the sheet
+        prints from a single response without fetching one image per label.
+        With format=pdf the labels are laid out on A4 pages as a PDF.
+        """
+        inventory = self.get_object()
+        tag_ids = request.query_params.get('ids', '').split(',')
+        inline_svg = request.query_params.get('qr') == 'svg'
         
-        return HttpResponse(html, content_type='text/html')
+        if not tag_ids or tag_ids == ['']:
+            # Print all tags for this inventory
+            tags = AssetTag.objects.filter(
+                batch=inventory.batch,
+                current_store=inventory.store
+            )
+        else:
+            tags = AssetTag.objects.filter(id__in=tag_ids)
+        
+        if request.accepted_renderer.format == 'pdf':
+            return self._print_tags_pdf(inventory, tags)
+
+        tags = tags.select_related('batch__item', 'current_store')
+        total = tags.count()
+        
+        if not total:
+            return HttpResponse('<h1>No tags found</h1>')
+
+        def render_labels():
+            yield LABEL_SHEET_HEAD.format(
+                total=total,
+                batch_number=inventory.batch.batch_number,
+                item_name=inventory.batch.item.name,
+            )
+
+            chunk = []
+            for tag in tags.iterator(chunk_size=PRINT_CHUNK_SIZE):
+                if inline_svg:
+                    # Shares cached renders with the qr.svg endpoint
+                    qr_markup = qr.cached_render(tag.qr_url, 'svg').decode()
+                else:
+                    qr_markup = f'<img src="{request.build_absolute_uri(tag.qr_image_path())}" alt="QR Code" />'
+
+                chunk.append(LABEL_HTML.format(
+                    qr_markup=qr_markup,
+                    tag_number=tag.tag_number,
+                    item_name=tag.batch.item.name,
+                    batch_number=tag.batch.batch_number,
+                    store_code=tag.current_store.code,
+                ))
+                if len(chunk) >= PRINT_CHUNK_SIZE:
+                    yield ''.join(chunk)
+                    chunk = []
+
+            chunk.append(LABEL_SHEET_TAIL)
+            yield ''.join(chunk)
+
+        return StreamingHttpResponse(render_labels(), content_type='text/html')
+
+    def _print_tags_pdf(self, inventory, tags):
+        labels = [
+            (qr.build_qr_url(settings.SITE_URL, qr_uuid), tag_number, item_name, batch_number, store_code)
+            for qr_uuid, tag_number, item_name, batch_number, store_code in tags.values_list(
+                'qr_code_uuid', 'tag_number', 'batch__item__name', 'batch__batch_number', 'current_store__code'
+            ).iterator(chunk_size=PRINT_CHUNK_SIZE)
+        ]
+
+        if not labels:
+            return HttpResponse('<h1>No tags found</h1>')
+
+        workers = settings.PDF_RENDER_WORKERS or os.cpu_count() or 1
+        response = StreamingHttpResponse(
+            pdf.stream_label_pdf(labels, workers=workers),
+            content_type='application/pdf'
+        )
+        response['Content-Disposition'] = f'inline; filename="labels-{inventory.batch.batch_number}.pdf"'
+        return response
     
     @action(detail=True, methods=['get'])
     def tagged_assets(self, request, store_pk=None, pk=None):
         """
         View all tagged assets for this inventory
-        GET /api/stores/{store_id}/inventries/{id}/tagged_assets/
+        GET /api/stores/{store_id}/inventries/{id}/tagged_assets/?limit=100&offset=0
         """
         inventory = self.get_object()
         
         assets = AssetTag.objects.filter(
             batch=inventory.batch,
             current_store=inventory.store
-        ).select_related('current_location')
+        )
         
         # Filter by status if provided
         status_filter = request.query_params.get('status')
         if status_filter:
             assets = assets.filter(status=status_filter)
         
-        # Summary
+        # Summary from a single grouped count
+        counts = dict(
+            assets.order_by().values_list('status').annotate(count=Count('id'))
+        )
         summary = {
-            'total': assets.count(),
-            'by_status': {}
+            'total': sum(counts.values()),
+            'by_status': {
+                status_label: counts[status_code]
+                for status_code, status_label in AssetTag.STATUS_CHOICES
+                if counts.get(status_code)
+            }
         }
         
-        for status_code, status_label in AssetTag.STATUS_CHOICES:
-            count = assets.filter(status=status_code).count()
-            if count > 0:
-                summary['by_status'][status_label] = count
-        
-        # Asset list
-        assets_data = []
-        for asset in assets:
-            assets_data.append({
-                'id': asset.id,
-                'tag_number': asset.tag_number,
-                'qr_uuid': str(asset.qr_code_uuid),
-                'status': asset.get_status_display(),
-                'status_code': asset.status,
-                'location': asset.current_location.name if asset.current_location else None,
-                'assigned_to': asset.assigned_to,
-                'tagged_date': asset.tagged_date,
-            })
+        # Asset list, one page of plain rows
+        limit = _int_param(request, 'limit', TAGGED_ASSETS_PAGE_SIZE, maximum=TAGGED_ASSETS_MAX_PAGE_SIZE)
+        offset = _int_param(request, 'offset', 0)
+        rows = assets.order_by('-created_at', '-id').values(
+            'id', 'tag_number', 'qr_code_uuid', 'status',
+            'current_location__name', 'assigned_to', 'tagged_date'
+        )[offset:offset + limit]
+
+        status_labels = dict(AssetTag.STATUS_CHOICES)
+        assets_data = [{
+            'id': row['id'],
+            'tag_number': row['tag_number'],
+            'qr_uuid': str(row['qr_code_uuid']),
+            'status': status_labels.get(row['status'], row['status']),
+            'status_code': row['status'],
+            'location': row['current_location__name'],
+            'assigned_to': row['assigned_to'],
+            'tagged_date': row['tagged_date'],
+        } for row in rows]
         
         return Response({
             'inventory': {
@@ -357,23 +573,56 @@ class StoreInventryViewSet(ModelViewSet):
                 'untagged': inventory.quantity_on_hand - inventory.quantity_qr_tagged,
             },
             'summary': summary,
+            'pagination': {
+                'limit': limit,
+                'offset': offset,
+                'has_more': offset + limit < summary['total'],
+            },
             'assets': assets_data
         })
     
-class StockEntryViewSet(ModelViewSet):
+class StockEntryViewSet(QueryPlanningMixin, ModelViewSet):
+    # Entries are a ledger; deleting one would leave later balances wrong
+    http_method_names = ['get', 'post', 'put', 'patch', 'options', 'head']
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['stock_register']
     queryset = StockEntry.objects.all()
     serializer_class = StockEnteySerializer
+    query_budget = {'list': 3, 'retrieve': 3}
+    cursor_ordering = ['-created_at', '-id']
 
-class StockRegisterViewSet(ModelViewSet):
+class StockRegisterViewSet(QueryPlanningMixin, ModelViewSet):
     queryset = StockRegister.objects.select_related('store').all()
     serializer_class = StockRegisterSerializer
+    query_budget = {'list': 4, 'retrieve': 4}
 
     def get_serializer_context(self):
         return {'request': self.request}
+
+    def get_serializer(self, *args, **kwargs):
+        if args and self.request.method == 'GET':
+            registers = args[0] if kwargs.get('many') else [args[0]]
+            kwargs['context'] = self.get_serializer_context()
+            kwargs['context']['register_indexes'] = stock_register_indexes([register.id for register in registers])
+        return super().get_serializer(*args, **kwargs)
+
+    @action(detail=True, methods=['get'])
+    def balances(self, request, pk=None):
+        """
+        Current balance of each item in the register (?item=<id> for one),
+        read from the maintained balance rows rather than the ledger
+        """
+        register = self.get_object()
+        balances = StockBalance.objects.filter(stock_register=register).select_related('item').order_by('item__code')
+        item_id = _int_param(request, 'item', None)
+        if item_id is not None:
+            balances = balances.filter(item_id=item_id)
+        return Response({
+            'stock_register': register.id,
+            'balances': StockBalanceSerializer(balances, many=True).data,
+        })
     
-class AssetTagViewSet(ModelViewSet):
+class AssetTagViewSet(QueryPlanningMixin, ModelViewSet):
     """ViewSet for QR Tagged Assets"""
     queryset = AssetTag.objects.all().select_related(
         'batch__item__department',
@@ -382,6 +631,9 @@ class AssetTagViewSet(ModelViewSet):
         'current_location'
     )
     permission_classes = [AllowAny]  # No login required
+    cursor_ordering = ['-created_at', '-id']
+    # ?search counts postings once per trigram of the query first
+    query_budget = {'list': 20, 'retrieve': 3}
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -408,14 +660,21 @@ class AssetTagViewSet(ModelViewSet):
         if batch_id:
             queryset = queryset.filter(batch_id=batch_id)
         if search:
-            queryset = queryset.filter(
-                tag_number__icontains=search
-            ) | queryset.filter(
-                batch__item__name__icontains=search
-            )
+            queryset = search_filter(queryset, search)
         
         return queryset
     
+    def perform_update(self, serializer):
+        previous = serializer.instance.movement_state()
+        with transaction.atomic():
+            asset = serializer.save()
+            movement = AssetMovement.between(
+                asset, previous,
+                created_by=self.request.user if self.request.user.is_authenticated else None
+            )
+            if movement is not None:
+                movement.save()
+    
     @action(detail=False, methods=['get'], url_path='scan/(?P<uuid>[^/.]+)')
     def scan(self, request, uuid=None):
         """
@@ -423,24 +682,298 @@ class AssetTagViewSet(ModelViewSet):
         GET /api/asset-tags/scan/{uuid}/
         """
         try:
+            qr_uuid = str(UUID(uuid))
+        except ValueError:
+            qr_uuid = None
+
+        data, token = scan_cache.get(qr_uuid) if qr_uuid else (None, None)
+        if data is None and qr_uuid:
             asset = AssetTag.objects.select_related(
                 'batch__item__department',
                 'batch__item__category',
                 'batch__inspection_item__inspection',
                 'current_store',
                 'current_location'
-            ).get(qr_code_uuid=uuid)
-            
-            return Response({
-                'success': True,
-                'data': asset.get_full_details()
-            })
-        except AssetTag.DoesNotExist:
+            ).filter(qr_code_uuid=qr_uuid).first()
+
+            if asset:
+                data = asset.get_full_details()
+                scan_cache.set(qr_uuid, data, token)
+
+        if data is None:
             return Response({
                 'success': False,
                 'error': 'Asset not found'
             }, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'success': True,
+            'data': data
+        })
+
+    @action(detail=False, methods=['post'])
+    def reconcile(self, request):
+        """
+        Reconcile a batch of audit scans against the records
+        POST /api/asset-tags/reconcile/
+        Body: {
+            "uuids": ["...", "..."],
+            "location_id": 10,
+            "store_id": 2
+        }
+        found: on record where expected, misplaced: on record elsewhere,
+        unknown: no such asset, missing: on record where expected but not scanned
+        """
+        serializer = ReconcileScanSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        location_id = serializer.validated_data.get('location_id')
+        store_id = serializer.validated_data.get('store_id')
+
+        scanned = {}
+        invalid = []
+        for value in serializer.validated_data['uuids']:
+            try:
+                scanned.setdefault(UUID(value), None)
+            except ValueError:
+                invalid.append(value)
+
+        def expected(row):
+            return ((location_id is None or row['current_location_id'] == location_id)
+                    and (store_id is None or row['current_store_id'] == store_id))
+
+        fields = [
+            'id', 'qr_code_uuid', 'tag_number', 'status',
+            'current_location_id', 'current_location__name',
+            'current_store_id', 'current_store__code',
+        ]
+        rows = AssetTag.objects.filter(qr_code_uuid__in=list(scanned)).values(*fields)
+
+        found, misplaced = [], []
+        for row in rows:
+            scanned[row['qr_code_uuid']] = row
+            (found if expected(row) else misplaced).append(_reconcile_row(row))
+
+        unknown = [str(qr_uuid) for qr_uuid, row in scanned.items() if row is None]
+
+        missing = []
+        if location_id is not None or store_id is not None:
+            on_record = AssetTag.objects.exclude(status__in=['WRITTEN_OFF', 'LOST'])
+            if location_id is not None:
+                on_record = on_record.filter(current_location_id=location_id)
+            if store_id is not None:
+                on_record = on_record.filter(current_store_id=store_id)
+            missing = [
+                _reconcile_row(row) for row in on_record.values(*fields).iterator()
+                if row['qr_code_uuid'] not in scanned
+            ]
+
+        return Response({
+            'summary': {
+                'scanned': len(serializer.validated_data['uuids']),
+                'found': len(found),
+                'misplaced': len(misplaced),
+                'unknown': len(unknown),
+                'missing': len(missing),
+                'invalid': len(invalid),
+            },
+            'found': found,
+            'misplaced': misplaced,
+            'unknown': unknown,
+            'missing': missing,
+            'invalid': invalid,
+        })
+
+    @action(detail=False, methods=['get'])
+    def snapshot(self, request):
+        """
+        Compact offline snapshot for audit scanners (gzip, see inventry/snapshot.py)
+        GET /api/asset-tags/snapshot/?store=2
+        GET /api/asset-tags/snapshot/?department=1&since=2026-03-31T00:00:00Z
+        """
+        store_id = request.query_params.get('store')
+        department_id = request.query_params.get('department')
+        if not store_id and not department_id:
+            return Response({'error': 'store or department is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            since = snapshot.parse_since(request.query_params.get('since'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        generated_at = timezone.now()
+        data = snapshot.build_snapshot(
+            snapshot.snapshot_queryset(store_id, department_id, since),
+            since=since,
+            generated_at=generated_at
+        )
+
+        response = HttpResponse(data, content_type='application/octet-stream')
+        response['Content-Disposition'] = 'attachment; filename="assets.amss.gz"'
+        response['X-Snapshot-Version'] = snapshot.FORMAT_VERSION
+        response['X-Snapshot-Generated-At'] = generated_at.isoformat()
+        return response
+
+    @action(detail=False, methods=['get'])
+    def as_of(self, request):
+        """
+        Assets that were in a location and/or store at a point in time
+        GET /api/asset-tags/as_of/?at=2026-03-31T23:59:59&location=10
+        GET /api/asset-tags/as_of/?at=2026-03-31&store=2&limit=100&offset=0
+        """
+        try:
+            at = snapshot.parse_since(request.query_params.get('at'))
+            location_id = request.query_params.get('location')
+            store_id = request.query_params.get('store')
+            location_id = int(location_id) if location_id else None
+            store_id = int(store_id) if store_id else None
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if at is None or (location_id is None and store_id is None):
+            return Response({'error': 'at and location or store are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        limit = _int_param(request, 'limit', TAGGED_ASSETS_PAGE_SIZE, TAGGED_ASSETS_MAX_PAGE_SIZE)
+        offset = _int_param(request, 'offset', 0)
+
+        states = history.states_as_of(at, location_id=location_id, store_id=store_id)
+        page_ids = sorted(states)[offset:offset + limit]
+        tag_numbers = dict(AssetTag.objects.filter(pk__in=page_ids).values_list('id', 'tag_number'))
+
+        return Response({
+            'at': at.isoformat(),
+            'location_id': location_id,
+            'store_id': store_id,
+            'count': len(states),
+            'results': [{
+                'id': asset_id,
+                'tag_number': tag_numbers.get(asset_id),
+                'status': states[asset_id][0],
+                'location_id': states[asset_id][1],
+                'store_id': states[asset_id][2],
+            } for asset_id in page_ids],
+            'pagination': {
+                'limit': limit,
+                'offset': offset,
+                'has_more': offset + limit < len(states),
+            }
+        })
+
+    @action(detail=True, methods=['get'], url_path='as_of', url_name='state-as-of')
+    def state_as_of(self, request, pk=None):
+        """
+        Status, location and store of one asset at a point in time
+        GET /api/asset-tags/{id}/as_of/?at=2026-03-31T23:59:59
+        """
+        try:
+            at = snapshot.parse_since(request.query_params.get('at'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if at is None:
+            return Response({'error': 'at is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        asset = get_object_or_404(AssetTag, pk=pk)
+        state = history.asset_state_as_of(asset, at)
+        if state is None:
+            return Response({'error': 'Asset did not exist at that time'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'id': asset.id,
+            'tag_number': asset.tag_number,
+            'at': at.isoformat(),
+            'status': state[0],
+            'location_id': state[1],
+            'store_id': state[2],
+        })
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Ranked search over tag numbers and item names/codes
+        GET /api/asset-tags/search/?q=chr001-0042&limit=20
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = _int_param(request, 'limit', SEARCH_LIMIT, SEARCH_MAX_LIMIT) or SEARCH_LIMIT
+
+        assets, items = search_assets(query, limit=limit)
+        return Response({
+            'query': query,
+            'results': [{
+                'id': asset.id,
+                'tag_number': asset.tag_number,
+                'qr_uuid': str(asset.qr_code_uuid),
+                'item_name': asset.batch.item.name,
+                'status': asset.status,
+                'store_code': asset.current_store.code,
+                'location_name': asset.current_location.name if asset.current_location else None,
+                'score': asset.score,
+                'match': asset.match,
+            } for asset in assets],
+            'items': [{'id': item.id, 'name': item.name, 'code': item.code} for item in items],
+        })
+
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Tag numbers starting with a prefix, served from memory
+        GET /api/asset-tags/autocomplete/?q=CS-0-CHR001&limit=10
+        """
+        prefix = request.query_params.get('q', '').strip()
+        if not prefix:
+            return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = _int_param(request, 'limit', AUTOCOMPLETE_LIMIT, AUTOCOMPLETE_MAX_LIMIT) or AUTOCOMPLETE_LIMIT
+
+        return Response({
+            'query': prefix,
+            'results': [
+                {'id': asset_id, 'tag_number': tag_number}
+                for tag_number, asset_id in tag_index.complete(prefix, limit=limit)
+            ]
+        })
+
+    @action(detail=False, methods=['get'])
+    def scan_stats(self, request):
+        """
+        Hit/miss counters of this process's scan cache
+        GET /api/asset-tags/scan_stats/
+        """
+        return Response(scan_cache.get_stats())
     
+    @action(detail=False, methods=['get'], url_path=r'(?P<uuid>[0-9a-fA-F-]{36})/qr',
+            renderer_classes=[PNGRenderer, SVGRenderer])
+    def qr_image(self, request, uuid=None, format=None):
+        """
+        QR code image rendered on demand from the asset's UUID
+        GET /api/asset-tags/{uuid}/qr.png
+        GET /api/asset-tags/{uuid}/qr.svg
+        """
+        try:
+            qr_uuid = str(UUID(uuid))
+        except ValueError:
+            # The route admits any 36 hex digits and dashes
+            return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+
+        fmt = request.accepted_renderer.format
+        qr_url = qr.build_qr_url(settings.SITE_URL, qr_uuid)
+        etag = qr.qr_etag(qr_url, fmt)
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': 'public, max-age=31536000, immutable',
+        }
+
+        if request.headers.get('If-None-Match', '').strip() == f'"{etag}"':
+            return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        cache = qr.get_image_cache()
+        cache_key = f'{etag}.{fmt}'
+        content = cache.get(cache_key)
+        if content is None:
+            if not AssetTag.objects.filter(qr_code_uuid=qr_uuid).exists():
+                return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+            content = qr.RENDERERS[fmt](qr_url)
+            cache.set(cache_key, content)
+
+        return HttpResponse(content, content_type=qr.CONTENT_TYPES[fmt], headers=headers)
+
     @action(detail=True, methods=['post'])
     def update_status(self, request, pk=None):
         """
@@ -454,33 +987,23 @@ class AssetTagViewSet(ModelViewSet):
         }
         """
         asset = self.get_object()
-        
-        # Update status
-        new_status = request.data.get('status')
-        if new_status:
-            asset.status = new_status
-        
-        # Update assignment
-        assigned_to = request.data.get('assigned_to')
-        if assigned_to:
-            asset.assigned_to = assigned_to
-        
-        # Update location
-        location_id = request.data.get('location_id')
-        if location_id:
-            asset.current_location_id = location_id
-        
-        # Update store if provided
-        store_id = request.data.get('store_id')
-        if store_id:
-            asset.current_store_id = store_id
-        
-        # Add remarks
-        new_remarks = request.data.get('remarks', '')
-        if new_remarks:
-            asset.remarks = f"{asset.remarks}\n{new_remarks}".strip()
-        
-        asset.save()
+        if asset.status == 'WRITTEN_OFF':
+            return Response({
+                'success': False,
+                'error': 'Written off assets cannot be updated'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        movement = asset.apply_changes(
+            status=request.data.get('status'),
+            assigned_to=request.data.get('assigned_to'),
+            location_id=request.data.get('location_id'),
+            store_id=request.data.get('store_id'),
+            remarks=request.data.get('remarks', ''),
+            created_by=request.user if request.user.is_authenticated else None,
+        )
+        if movement is not None:
+            with transaction.atomic():
+                asset.save()
+                movement.save()
         
         serializer = AssetTagDetailSerializer(asset, context={'request': request})
         return Response({
@@ -489,6 +1012,105 @@ class AssetTagViewSet(ModelViewSet):
             'data': serializer.data
         })
     
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def bulk_update_status(self, request):
+        """
+        Apply one status/location/store update to many assets
+        POST /api/asset-tags/bulk_update_status/
+        Body: {
+            "ids": [1, 2, 3],            (or "uuids": ["...", "..."])
+            "status": "IN_USE",
+            "assigned_to": "AV Hall",
+            "location_id": 10,
+            "store_id": 2,
+            "remarks": "Moved for annual function"
+        }
+        Returns one result per requested id/uuid, in request order.
+        Requires a logged-in user, who is recorded on the movements.
+        """
+        serializer = BulkAssetStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        changes = {field: data.get(field) for field in ('status', 'assigned_to', 'location_id', 'store_id', 'remarks')}
+
+        fields = ['id', 'qr_code_uuid', 'tag_number', 'status', 'assigned_to',
+                  'current_location_id', 'current_store_id', 'updated_at']
+        if data.get('ids'):
+            requested = list(dict.fromkeys(data['ids']))
+            keys = requested
+            assets = AssetTag.objects.filter(pk__in=keys).only(*fields).in_bulk()
+        else:
+            requested = list(dict.fromkeys(data['uuids']))
+            keys = {}
+            for value in requested:
+                try:
+                    keys[value] = UUID(value)
+                except ValueError:
+                    pass
+            assets = AssetTag.objects.filter(qr_code_uuid__in=list(keys.values())).only(*fields).in_bulk(field_name='qr_code_uuid')
+            assets = {value: assets.get(qr_uuid) for value, qr_uuid in keys.items()}
+
+        ordered, updatable = [], []
+        for key in requested:
+            asset = assets.get(key)
+            row = {'key': key, 'success': False}
+            if asset is None:
+                row['error'] = 'Asset not found' if key in keys else 'Invalid UUID'
+            elif asset.status == 'WRITTEN_OFF':
+                row['error'] = 'Written off assets cannot be updated'
+            else:
+                updatable.append(asset)
+                row['asset'] = asset
+            ordered.append(row)
+
+        with transaction.atomic():
+            movements = AssetTag.bulk_apply_changes(
+                updatable, created_by=request.user if request.user.is_authenticated else None, **changes
+            )
+        changed = {movement.asset_id for movement in movements}
+
+        for row in ordered:
+            asset = row.pop('asset', None)
+            if asset is not None:
+                row.update({
+                    'success': True,
+                    'changed': asset.pk in changed,
+                    'id': asset.pk,
+                    'tag_number': asset.tag_number,
+                    'status': asset.status,
+                })
+
+        succeeded = sum(1 for row in ordered if row['success'])
+        return Response({
+            'success': succeeded == len(ordered),
+            'summary': {
+                'requested': len(ordered),
+                'updated': sum(1 for row in ordered if row.get('changed')),
+                'unchanged': sum(1 for row in ordered if row['success'] and not row['changed']),
+                'failed': len(ordered) - succeeded,
+            },
+            'results': ordered
+        })
+
+    @action(detail=True, methods=['get'])
+    def timeline(self, request, pk=None):
+        """
+        Movement history of an asset, newest first
+        GET /api/asset-tags/{id}/timeline/?page_size=50
+        Follow the `next` / `previous` links to page through the history.
+        """
+        asset = get_object_or_404(AssetTag.objects.only('id', 'tag_number'), pk=pk)
+        movements = AssetMovement.objects.filter(asset=asset).select_related(
+            'from_location', 'to_location', 'from_store', 'to_store', 'created_by'
+        )
+
+        paginator = KeysetCursorPagination()
+        paginator.ordering = AssetMovement._meta.ordering
+        page = paginator.paginate_queryset(movements, request, view=self)
+        response = paginator.get_paginated_response(AssetMovementSerializer(page, many=True).data)
+        response.data['asset'] = {'id': asset.id, 'tag_number': asset.tag_number}
+        return response
+
     @action(detail=False, methods=['get'])
     def status_choices(self, request):
         """